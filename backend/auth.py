@@ -4,6 +4,8 @@ from firebase_admin import auth
 from pydantic import BaseModel
 from typing import Optional
 
+from .services.tracing import tracer
+
 security = HTTPBearer()
 
 
@@ -21,8 +23,10 @@ async def get_current_user(
     token = credentials.credentials
 
     try:
-        decoded_token = auth.verify_id_token(token)
-        return AuthenticatedUser(
+        with tracer.span("auth.verify_id_token") as span:
+            decoded_token = auth.verify_id_token(token)
+            span.set("user_id", decoded_token["uid"])
+        user = AuthenticatedUser(
             uid=decoded_token["uid"],
             email=decoded_token.get("email"),
             name=decoded_token.get("name"),
@@ -52,3 +56,5 @@ async def get_current_user(
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
+
+    return user
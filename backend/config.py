@@ -12,6 +12,113 @@ class Settings:
     # CORS
     FRONTEND_URL: str = os.getenv("FRONTEND_URL", "http://localhost:5173")
 
+    # Firestore call policy
+    FIRESTORE_TIMEOUT_SECONDS: float = float(
+        os.getenv("FIRESTORE_TIMEOUT_SECONDS", "10")
+    )
+    FIRESTORE_READ_ATTEMPTS: int = int(os.getenv("FIRESTORE_READ_ATTEMPTS", "3"))
+    FIRESTORE_RETRY_BASE_SECONDS: float = float(
+        os.getenv("FIRESTORE_RETRY_BASE_SECONDS", "0.05")
+    )
+    FIRESTORE_RETRY_MAX_SECONDS: float = float(
+        os.getenv("FIRESTORE_RETRY_MAX_SECONDS", "1")
+    )
+    FIRESTORE_BREAKER_FAILURE_RATE: float = float(
+        os.getenv("FIRESTORE_BREAKER_FAILURE_RATE", "0.5")
+    )
+    FIRESTORE_BREAKER_MIN_CALLS: int = int(
+        os.getenv("FIRESTORE_BREAKER_MIN_CALLS", "20")
+    )
+    FIRESTORE_BREAKER_WINDOW_SECONDS: float = float(
+        os.getenv("FIRESTORE_BREAKER_WINDOW_SECONDS", "30")
+    )
+    FIRESTORE_BREAKER_RESET_SECONDS: float = float(
+        os.getenv("FIRESTORE_BREAKER_RESET_SECONDS", "15")
+    )
+
+    # Per-user request limits; a rate of 0 turns off all but the
+    # concurrency cap
+    RATE_LIMIT_PER_SECOND: float = float(os.getenv("RATE_LIMIT_PER_SECOND", "10"))
+    RATE_LIMIT_BURST: int = int(os.getenv("RATE_LIMIT_BURST", "40"))
+    RATE_LIMIT_MAX_CONCURRENT: int = int(os.getenv("RATE_LIMIT_MAX_CONCURRENT", "8"))
+    # Upper bounds on list query parameters
+    MAX_LIST_LIMIT: int = int(os.getenv("MAX_LIST_LIMIT", "200"))
+    MAX_HISTORY_MONTHS: int = int(os.getenv("MAX_HISTORY_MONTHS", "60"))
+
+    # Response compression; BROTLI_QUALITY applies with the brotli extra
+    # installed, otherwise responses are gzipped
+    COMPRESSION_MIN_BYTES: int = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+    GZIP_LEVEL: int = int(os.getenv("GZIP_LEVEL", "6"))
+    BROTLI_QUALITY: int = int(os.getenv("BROTLI_QUALITY", "4"))
+
+    # Live session sync
+    LIVE_QUEUE_SIZE: int = int(os.getenv("LIVE_QUEUE_SIZE", "100"))
+    LIVE_KEEPALIVE_SECONDS: float = float(os.getenv("LIVE_KEEPALIVE_SECONDS", "15"))
+
+    # Sessions
+    SESSION_SHARD_THRESHOLD_BYTES: int = int(
+        os.getenv("SESSION_SHARD_THRESHOLD_BYTES", str(256 * 1024))
+    )
+    # Buffer added exercises and sets for this long and write them together;
+    # 0 writes each one straight away. Only for single-instance deployments.
+    SESSION_WRITE_BEHIND_SECONDS: float = float(
+        os.getenv("SESSION_WRITE_BEHIND_SECONDS", "0")
+    )
+
+    # Archive of old finished sessions ("firestore" or "file")
+    ARCHIVE_BACKEND: str = os.getenv("ARCHIVE_BACKEND", "firestore")
+    ARCHIVE_DIR: str = os.getenv("ARCHIVE_DIR", "archive")
+    ARCHIVE_AFTER_DAYS: int = int(os.getenv("ARCHIVE_AFTER_DAYS", "365"))
+    ARCHIVE_COMPRESSION_LEVEL: int = int(os.getenv("ARCHIVE_COMPRESSION_LEVEL", "9"))
+
+    # Weight log layout: "daily" (a document per log) or "yearly" (a
+    # document per year); run backend.migrations.weight_log_years first
+    WEIGHT_LOG_STORAGE: str = os.getenv("WEIGHT_LOG_STORAGE", "daily")
+
+    # Bulk deletes
+    BULK_DELETE_PAGE_SIZE: int = int(os.getenv("BULK_DELETE_PAGE_SIZE", "500"))
+    BULK_DELETE_PARALLELISM: int = int(os.getenv("BULK_DELETE_PARALLELISM", "4"))
+
+    # Idempotency-Key replay cache
+    IDEMPOTENCY_TTL_SECONDS: float = float(
+        os.getenv("IDEMPOTENCY_TTL_SECONDS", "3600")
+    )
+    IDEMPOTENCY_MAX_KEYS: int = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "10000"))
+
+    # In-memory exercise search indexes
+    EXERCISE_SEARCH_MAX_USERS: int = int(os.getenv("EXERCISE_SEARCH_MAX_USERS", "1000"))
+    EXERCISE_SEARCH_TTL_SECONDS: float = float(
+        os.getenv("EXERCISE_SEARCH_TTL_SECONDS", "300")
+    )
+
+    # Cache for profiles, exercises and routines: "local" (per process) or
+    # "redis" (shared by every worker; needs the redis package)
+    CACHE_BACKEND: str = os.getenv("CACHE_BACKEND", "local")
+    CACHE_URL: str = os.getenv("CACHE_URL", "redis://localhost:6379/0")
+    CACHE_PREFIX: str = os.getenv("CACHE_PREFIX", "gym:")
+    # Entries kept in each process, as the whole cache or in front of Redis
+    CACHE_MAX_ENTRIES: int = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+    CACHE_TTL_SECONDS: float = float(os.getenv("CACHE_TTL_SECONDS", "300"))
+
+    # Background jobs; the outbox is "firestore" or "file"
+    JOB_WORKERS: int = int(os.getenv("JOB_WORKERS", "4"))
+    JOB_MAX_ATTEMPTS: int = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+    JOB_RETRY_BASE_SECONDS: float = float(os.getenv("JOB_RETRY_BASE_SECONDS", "1"))
+    JOB_RETRY_MAX_SECONDS: float = float(os.getenv("JOB_RETRY_MAX_SECONDS", "60"))
+    JOB_OUTBOX_BACKEND: str = os.getenv("JOB_OUTBOX_BACKEND", "firestore")
+    JOB_OUTBOX_DIR: str = os.getenv("JOB_OUTBOX_DIR", "outbox")
+
+    # Request tracing; the exporter is "" (off), "file" (JSON lines) or
+    # "otlp" (OTLP/HTTP JSON to a collector)
+    TRACING_EXPORTER: str = os.getenv("TRACING_EXPORTER", "")
+    TRACING_FILE: str = os.getenv("TRACING_FILE", "traces.jsonl")
+    TRACING_OTLP_ENDPOINT: str = os.getenv(
+        "TRACING_OTLP_ENDPOINT", "http://localhost:4318"
+    )
+    TRACING_SERVICE_NAME: str = os.getenv("TRACING_SERVICE_NAME", "gym-tracker-api")
+    # Share of requests traced when the caller has not decided
+    TRACING_SAMPLE_RATE: float = float(os.getenv("TRACING_SAMPLE_RATE", "1.0"))
+
     # API
     API_VERSION: str = "0.1.0"
     API_TITLE: str = "Gym Tracker API"
@@ -0,0 +1,70 @@
+"""Move old finished sessions into the monthly session archive.
+
+Sessions that finished more than ``ARCHIVE_AFTER_DAYS`` days ago are packed
+into one compressed archive per month and removed from the ``sessions``
+collection, so range queries and scans only touch recent history. Archived
+sessions are still returned by the session endpoints.
+
+Usage::
+
+    python -m backend.jobs.archive_sessions [--dry-run] [--user UID] [--older-than-days N]
+"""
+import argparse
+from typing import Optional
+
+from ..config import settings
+from ..services.archive import archive_user_sessions, get_session_archive
+from ..services.firestore import get_firestore_service
+from ..services.session_store import get_session_store
+
+
+def run(
+    user_id: Optional[str] = None,
+    older_than_days: int = settings.ARCHIVE_AFTER_DAYS,
+    dry_run: bool = False,
+) -> dict:
+    """Archive sessions for one user, or every user when ``user_id`` is None."""
+    fs = get_firestore_service()
+    store = get_session_store()
+    archive = get_session_archive()
+    if user_id:
+        user_ids = [user_id]
+    else:
+        user_ids = [ref.id for ref in fs.db.collection("users").list_documents()]
+
+    totals = {"users": 0, "archived": 0}
+    for uid in user_ids:
+        totals["users"] += 1
+        totals["archived"] += archive_user_sessions(
+            fs, store, archive, uid, older_than_days=older_than_days, dry_run=dry_run
+        )
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--user", help="Only archive this user's sessions")
+    parser.add_argument(
+        "--older-than-days",
+        type=int,
+        default=settings.ARCHIVE_AFTER_DAYS,
+        help="Archive sessions dated more than this many days ago",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Report what would be archived without writing",
+    )
+    args = parser.parse_args()
+
+    totals = run(
+        user_id=args.user,
+        older_than_days=args.older_than_days,
+        dry_run=args.dry_run,
+    )
+    prefix = "[dry run] " if args.dry_run else ""
+    print(f"{prefix}{totals['users']} users, {totals['archived']} sessions archived")
+
+
+if __name__ == "__main__":
+    main()
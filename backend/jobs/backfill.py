@@ -0,0 +1,356 @@
+"""Recompute data derived from users' sessions, in parallel across users.
+
+Users are shared out across a pool of worker processes. Each worker reads
+one user's sessions a page at a time, in document-ID order, with the next
+page fetched while the current one is processed. Its writes go out in
+batches of up to 500. Finished users are appended to the ``--checkpoint``
+file, and a run given the same file skips them, so an interrupted backfill
+resumes where it stopped. Progress and throughput are printed as it goes.
+
+Set ``FIRESTORE_EMULATOR_HOST`` to run a backfill against the Firestore
+emulator before running it for real, and use ``--dry-run`` to count the
+writes it would make without making them.
+
+Usage::
+
+    python -m backend.jobs.backfill NAME [--dry-run] [--user UID]
+        [--processes N] [--page-size N] [--checkpoint FILE]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from typing import Iterable, Iterator, Optional
+
+from ..services.bulk_delete import BATCH_SIZE, apply_exercise_names
+from ..services.calendar import (
+    TrainingCalendar,
+    calendar_document,
+    calendar_entry,
+    session_date,
+)
+from ..services.firestore import FirestoreService, get_firestore_service
+from ..services.last_performance import (
+    LastPerformanceIndex,
+    merge_entry,
+    session_entries,
+)
+from ..services.session_store import SHARDS, get_session_store
+
+
+class Backfill:
+    """A recompute over each of a user's sessions.
+
+    ``prepare`` runs once per user and returns whatever ``session`` needs.
+    ``session`` returns the writes for one session document and ``finish``
+    the writes to make after the last one, as ``(op, ref, data)`` with op
+    ``"set"`` or ``"update"``.
+    """
+
+    # Session fields to read; None reads whole documents
+    fields: Optional[list[str]] = None
+
+    def prepare(self, fs: FirestoreService, user_id: str):
+        return None
+
+    def session(self, fs: FirestoreService, state, doc) -> Iterable[tuple]:
+        raise NotImplementedError
+
+    def finish(self, fs: FirestoreService, user_id: str, state) -> Iterable[tuple]:
+        return ()
+
+
+class ExerciseNames(Backfill):
+    """Store each exercise's current name on every session that performed it."""
+
+    fields = ["performed_exercises", "shard_count"]
+
+    def prepare(self, fs: FirestoreService, user_id: str) -> dict[str, str]:
+        exercises = fs.get_user_collection(user_id, "exercises").select(["name"])
+        return {doc.id: doc.to_dict()["name"] for doc in fs.query(exercises)}
+
+    def session(self, fs: FirestoreService, names: dict[str, str], doc):
+        data = doc.to_dict()
+        if data.get("shard_count"):
+            for shard in fs.query(doc.reference.collection(SHARDS)):
+                spilled = shard.to_dict()["performed_exercises"]
+                if apply_exercise_names(spilled, names):
+                    yield "update", shard.reference, {"performed_exercises": spilled}
+        performed = data.get("performed_exercises", [])
+        if apply_exercise_names(performed, names):
+            yield "update", doc.reference, {"performed_exercises": performed}
+
+
+class LastPerformance(Backfill):
+    """Rebuild the last-performance index from every finished session."""
+
+    def prepare(self, fs: FirestoreService, user_id: str) -> dict[str, dict]:
+        return {}
+
+    def session(self, fs: FirestoreService, entries: dict[str, dict], doc):
+        session = get_session_store().assemble(doc)
+        if session.get("end_time"):
+            for exercise_id, entry in session_entries(session).items():
+                entries[exercise_id] = merge_entry(entries.get(exercise_id), entry)
+        return ()
+
+    def finish(self, fs: FirestoreService, user_id: str, entries: dict[str, dict]):
+        index = LastPerformanceIndex(fs)
+        for exercise_id, entry in entries.items():
+            yield "set", index.ref(user_id, exercise_id), entry
+
+
+class Calendar(Backfill):
+    """Rebuild the training calendar from every session."""
+
+    fields = ["date", "end_time", "performed_exercises", "shard_index"]
+
+    def prepare(self, fs: FirestoreService, user_id: str) -> dict[int, dict]:
+        return {}
+
+    def session(self, fs: FirestoreService, years: dict[int, dict], doc):
+        session = get_session_store().assemble(doc)
+        year = session_date(session).year
+        years.setdefault(year, {})[doc.id] = calendar_entry(session)
+        return ()
+
+    def finish(self, fs: FirestoreService, user_id: str, years: dict[int, dict]):
+        calendar = TrainingCalendar(fs)
+        for year, sessions in years.items():
+            yield "set", calendar.ref(user_id, year), calendar_document(year, sessions)
+
+
+BACKFILLS: dict[str, Backfill] = {
+    "exercise_names": ExerciseNames(),
+    "last_performance": LastPerformance(),
+    "calendar": Calendar(),
+}
+
+
+def _pages(
+    fs: FirestoreService, query, page_size: int, fields: Optional[list[str]]
+) -> Iterator[list]:
+    """Pages of ``query`` by cursor, reading one page ahead."""
+    query = query.order_by("__name__").limit(page_size)
+    if fields is not None:
+        query = query.select(fields)
+    with ThreadPoolExecutor(1) as reader:
+        future = reader.submit(fs.query, query)
+        while True:
+            page = future.result()
+            if len(page) == page_size:
+                future = reader.submit(fs.query, query.start_after(page[-1]))
+            if page:
+                yield page
+            if len(page) < page_size:
+                return
+
+
+class _BatchWriter:
+    def __init__(self, fs: FirestoreService, dry_run: bool):
+        self._fs = fs
+        self._dry_run = dry_run
+        self._batch = fs.db.batch()
+        self._size = 0
+        self.count = 0
+
+    def add(self, writes: Iterable[tuple]):
+        for op, ref, data in writes:
+            self.count += 1
+            if self._dry_run:
+                continue
+            if op == "set":
+                self._batch.set(ref, data)
+            else:
+                self._batch.update(ref, data)
+            self._size += 1
+            if self._size == BATCH_SIZE:
+                self.flush()
+
+    def flush(self):
+        if self._size:
+            self._fs.write(self._batch.commit)
+            self._batch = self._fs.db.batch()
+            self._size = 0
+
+
+def backfill_user(
+    fs: FirestoreService,
+    backfill: Backfill,
+    user_id: str,
+    page_size: int = 500,
+    dry_run: bool = False,
+) -> dict:
+    """Run ``backfill`` over one user's sessions; returns counts."""
+    state = backfill.prepare(fs, user_id)
+    writer = _BatchWriter(fs, dry_run)
+    sessions = 0
+    collection = fs.get_user_collection(user_id, "sessions")
+    for page in _pages(fs, collection, page_size, backfill.fields):
+        sessions += len(page)
+        for doc in page:
+            writer.add(backfill.session(fs, state, doc))
+    writer.add(backfill.finish(fs, user_id, state))
+    writer.flush()
+    return {"user": user_id, "sessions": sessions, "writes": writer.count}
+
+
+def _run_user(name: str, user_id: str, page_size: int, dry_run: bool) -> dict:
+    # Runs in a worker process, which opens its own Firestore client.
+    return backfill_user(
+        get_firestore_service(), BACKFILLS[name], user_id, page_size, dry_run
+    )
+
+
+def _load_checkpoint(path: str, name: str) -> set[str]:
+    if not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    return {entry["user"] for entry in entries if entry["backfill"] == name}
+
+
+def run(
+    name: str,
+    user_id: Optional[str] = None,
+    processes: int = os.cpu_count() or 1,
+    page_size: int = 500,
+    checkpoint: Optional[str] = None,
+    dry_run: bool = False,
+    report_every: float = 10,
+) -> dict:
+    """Run backfill ``name`` for one user, or every user when ``user_id`` is None.
+
+    With ``processes`` of 1 everything runs in this process.
+    """
+    if name not in BACKFILLS:
+        raise ValueError(f"Unknown backfill {name!r}")
+    fs = get_firestore_service()
+    if user_id:
+        user_ids = [user_id]
+    else:
+        users = fs.db.collection("users")
+        user_ids = [ref.id for ref in fs.read(users.list_documents)]
+
+    done = _load_checkpoint(checkpoint, name) if checkpoint and not dry_run else set()
+    todo = [uid for uid in user_ids if uid not in done]
+    totals = {
+        "users": 0,
+        "skipped": len(user_ids) - len(todo),
+        "sessions": 0,
+        "writes": 0,
+        "failed": [],
+    }
+    started = last_report = time.monotonic()
+    log = open(checkpoint, "a") if checkpoint and not dry_run else None
+
+    def report(final: bool = False):
+        elapsed = max(time.monotonic() - started, 1e-9)
+        print(
+            f"{totals['users']}/{len(todo)} users, {totals['sessions']} sessions, "
+            f"{totals['writes']} writes in {elapsed:.1f}s "
+            f"({totals['users'] / elapsed:.1f} users/s, "
+            f"{totals['sessions'] / elapsed:.0f} sessions/s)"
+            + (" - done" if final else ""),
+            flush=True,
+        )
+
+    def record(uid: str, result: Optional[dict], error: Optional[BaseException]):
+        nonlocal last_report
+        if error is not None:
+            totals["failed"].append(uid)
+            print(f"{uid}: {type(error).__name__}: {error}", flush=True)
+        else:
+            totals["users"] += 1
+            totals["sessions"] += result["sessions"]
+            totals["writes"] += result["writes"]
+            if log:
+                log.write(json.dumps({"backfill": name, **result}) + "\n")
+                log.flush()
+        if time.monotonic() - last_report >= report_every:
+            last_report = time.monotonic()
+            report()
+
+    try:
+        if processes <= 1:
+            for uid in todo:
+                try:
+                    record(uid, _run_user(name, uid, page_size, dry_run), None)
+                except Exception as exc:
+                    record(uid, None, exc)
+        else:
+            # Spawned, not forked: gRPC clients do not survive a fork.
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(processes, mp_context=context) as pool:
+                pending = {}
+                for uid in todo:
+                    if len(pending) >= processes * 2:
+                        finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            record(pending.pop(future), *_outcome(future))
+                    pending[pool.submit(_run_user, name, uid, page_size, dry_run)] = uid
+                for future, uid in pending.items():
+                    record(uid, *_outcome(future))
+    finally:
+        if log:
+            log.close()
+    report(final=True)
+    return totals
+
+
+def _outcome(future) -> tuple[Optional[dict], Optional[BaseException]]:
+    error = future.exception()
+    return (None, error) if error else (future.result(), None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("name", choices=sorted(BACKFILLS), help="Backfill to run")
+    parser.add_argument("--user", help="Only backfill this user")
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Worker processes; 1 runs everything in this process",
+    )
+    parser.add_argument(
+        "--page-size", type=int, default=500, help="Sessions read per query"
+    )
+    parser.add_argument(
+        "--checkpoint",
+        help="File recording finished users; users already in it are skipped",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Count the writes without making them",
+    )
+    args = parser.parse_args()
+
+    totals = run(
+        args.name,
+        user_id=args.user,
+        processes=args.processes,
+        page_size=args.page_size,
+        checkpoint=args.checkpoint,
+        dry_run=args.dry_run,
+    )
+    prefix = "[dry run] " if args.dry_run else ""
+    print(
+        f"{prefix}{totals['users']} users ({totals['skipped']} skipped), "
+        f"{totals['sessions']} sessions, {totals['writes']} writes"
+    )
+    if totals["failed"]:
+        print(f"Failed: {' '.join(totals['failed'])}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
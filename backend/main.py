@@ -1,18 +1,46 @@
-from fastapi import FastAPI
+import math
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 
 from .config import settings
+from .middleware import CompressionMiddleware, TracingMiddleware
+from .services.cache import get_cache
+from .services.metrics import metrics
+from .services.job_queue import job_queue
+from .services.resilience import FirestoreUnavailable
+from .services.session_store import get_session_store
+from .services.tracing import tracer
 from .routers import (
     exercises_router,
     routines_router,
     sessions_router,
     body_metrics_router,
+    account_router,
 )
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Connects to a shared cache, if any, before the first request
+    get_cache()
+    await job_queue.start()
+    yield
+    await job_queue.stop()
+    # Write out session changes still held by write-behind
+    get_session_store().flush_all()
+    get_cache().close()
+    # Export the spans of the last requests
+    tracer.shutdown()
+
+
 app = FastAPI(
     title=settings.API_TITLE,
     version=settings.API_VERSION,
+    lifespan=lifespan,
 )
 
 # CORS configuration
@@ -23,12 +51,26 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(CompressionMiddleware)
+# Outermost, so the root span covers everything else
+app.add_middleware(TracingMiddleware)
+
+
+@app.exception_handler(FirestoreUnavailable)
+async def firestore_unavailable_handler(request: Request, exc: FirestoreUnavailable):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(math.ceil(exc.retry_after))},
+    )
+
 
 # Include routers
 app.include_router(exercises_router, prefix="/api")
 app.include_router(routines_router, prefix="/api")
 app.include_router(sessions_router, prefix="/api")
 app.include_router(body_metrics_router, prefix="/api")
+app.include_router(account_router, prefix="/api")
 
 
 class HealthCheck(BaseModel):
@@ -44,3 +86,8 @@ def read_root():
 @app.get("/health", response_model=HealthCheck)
 def health_check():
     return HealthCheck(status="ok", version=settings.API_VERSION)
+
+
+@app.get("/metrics")
+def read_metrics() -> dict:
+    return metrics.snapshot()
@@ -0,0 +1,159 @@
+import gzip
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .config import settings
+from .services.metrics import metrics
+from .services.tracing import tracer
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick ``br`` or ``gzip`` from an Accept-Encoding header, if acceptable."""
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip())
+
+    if brotli is not None and ("br" in accepted or "*" in accepted):
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=settings.BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=settings.GZIP_LEVEL, mtime=0)
+
+
+class CompressionMiddleware:
+    """Compress responses and record payload sizes per route.
+
+    Responses of at least ``COMPRESSION_MIN_BYTES`` are compressed with
+    brotli when the client accepts it and the ``brotli`` extra is
+    installed, otherwise with gzip, which needs nothing. Streamed
+    responses such as live session events pass through untouched so
+    events are not held back.
+
+    Every response body's size is observed under
+    ``http.payload_bytes.<METHOD> <route>``, and the size actually sent
+    under ``http.wire_bytes.<METHOD> <route>``.
+    """
+
+    def __init__(
+        self, app: ASGIApp, minimum_size: int = settings.COMPRESSION_MIN_BYTES
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        start: Optional[Message] = None
+        sizes = [0, 0]
+
+        async def send_wrapper(message: Message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            sizes[0] += len(body)
+            if start is not None:
+                headers = MutableHeaders(raw=start["headers"])
+                # Only whole bodies sent in one message are compressed.
+                if (
+                    not more_body
+                    and encoding is not None
+                    and len(body) >= self.minimum_size
+                    and "content-encoding" not in headers
+                ):
+                    body = compress(body, encoding)
+                    headers["Content-Encoding"] = encoding
+                    headers["Content-Length"] = str(len(body))
+                    headers.add_vary_header("Accept-Encoding")
+                    message = {**message, "body": body}
+                await send(start)
+                start = None
+            sizes[1] += len(body)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            if route is not None:
+                name = f"{scope['method']} {route.path}"
+                metrics.observe(f"http.payload_bytes.{name}", sizes[0])
+                metrics.observe(f"http.wire_bytes.{name}", sizes[1])
+
+
+class TracingMiddleware:
+    """Trace each request, continuing the caller's W3C trace context.
+
+    The root span is named ``<METHOD> <route>`` once routing has matched
+    and records the status code; Firestore calls, token checks and model
+    building below it add child spans. Traced responses carry a
+    ``traceparent`` header naming the root span, so a client can look its
+    request up. With tracing off, requests pass straight through.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not tracer.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        span = tracer.start_trace(
+            f"{scope['method']} {scope['path']}",
+            traceparent=headers.get("traceparent"),
+            tracestate=headers.get("tracestate"),
+        )
+        if not span.recording:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                span.set("http.status_code", message["status"])
+                if message["status"] >= 500:
+                    span.error = f"HTTP {message['status']}"
+                MutableHeaders(scope=message)["traceparent"] = span.traceparent
+            await send(message)
+
+        span.set("http.method", scope["method"])
+        span.set("http.target", scope["path"])
+        with span:
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = scope.get("route")
+                if route is not None:
+                    span.name = f"{scope['method']} {route.path}"
+                    span.set("http.route", route.path)
@@ -0,0 +1,116 @@
+"""Backfill exercise name reservations.
+
+Exercise names are kept unique through ``users/{uid}/exercise_names``
+documents. Exercises created before those existed have no reservation, so
+this migration claims one for each of them. When a user already has several
+exercises whose names normalize to the same key, the oldest keeps the name
+and the others are reported so they can be renamed by hand.
+
+Reservations under keys without ``NAME_KEY_PREFIX``, from before keys had
+one, are replaced by prefixed ones; run this after deploying that change.
+
+Usage::
+
+    python -m backend.migrations.exercise_names [--dry-run] [--user UID]
+"""
+import argparse
+from datetime import datetime, timezone
+from typing import Optional
+
+from ..models.exercise import NAME_KEY_PREFIX, exercise_name_key
+from ..services.firestore import FirestoreService, get_firestore_service
+
+# Firestore allows at most 500 operations per batched write.
+BATCH_SIZE = 500
+
+_EPOCH = datetime.min.replace(tzinfo=timezone.utc)
+
+
+def migrate_user(fs: FirestoreService, user_id: str, dry_run: bool = False) -> dict:
+    """Claim missing name reservations for one user's exercises.
+
+    Returns the number of reservations written and deleted, and the IDs of
+    exercises whose names clash with an older exercise.
+    """
+    exercises = fs.get_user_collection(user_id, "exercises")
+    names = fs.get_user_collection(user_id, "exercise_names")
+
+    reserved = {}
+    deletes = []
+    for doc in names.stream():
+        if doc.id.startswith(NAME_KEY_PREFIX):
+            reserved[doc.id] = doc.to_dict().get("exercise_id")
+        else:
+            deletes.append(doc.reference)
+
+    by_key: dict[str, list] = {}
+    for doc in exercises.stream():
+        data = doc.to_dict()
+        by_key.setdefault(exercise_name_key(data["name"]), []).append((doc.id, data))
+
+    writes = []
+    conflicts = []
+    for key, docs in by_key.items():
+        docs.sort(key=lambda item: item[1].get("created_at") or _EPOCH)
+        owner = reserved.get(key)
+        if owner is None:
+            owner, data = docs[0]
+            reservation = {"exercise_id": owner, "name": data["name"]}
+            writes.append((names.document(key), reservation))
+        conflicts.extend(exercise_id for exercise_id, _ in docs if exercise_id != owner)
+
+    if not dry_run:
+        operations = writes + [(ref, None) for ref in deletes]
+        for i in range(0, len(operations), BATCH_SIZE):
+            batch = fs.db.batch()
+            for ref, data in operations[i:i + BATCH_SIZE]:
+                if data is None:
+                    batch.delete(ref)
+                else:
+                    batch.set(ref, data)
+            batch.commit()
+
+    return {"written": len(writes), "deleted": len(deletes), "conflicts": conflicts}
+
+
+def migrate(user_id: Optional[str] = None, dry_run: bool = False) -> dict:
+    """Run the migration for one user, or every user when ``user_id`` is None."""
+    fs = get_firestore_service()
+    if user_id:
+        user_ids = [user_id]
+    else:
+        user_ids = [ref.id for ref in fs.db.collection("users").list_documents()]
+
+    totals = {"users": 0, "written": 0, "deleted": 0, "conflicts": {}}
+    for uid in user_ids:
+        result = migrate_user(fs, uid, dry_run=dry_run)
+        totals["users"] += 1
+        totals["written"] += result["written"]
+        totals["deleted"] += result["deleted"]
+        if result["conflicts"]:
+            totals["conflicts"][uid] = result["conflicts"]
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--user", help="Only migrate this user ID")
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Report what would change without writing",
+    )
+    args = parser.parse_args()
+
+    totals = migrate(user_id=args.user, dry_run=args.dry_run)
+    prefix = "[dry run] " if args.dry_run else ""
+    print(
+        f"{prefix}{totals['users']} users, {totals['written']} names reserved, "
+        f"{totals['deleted']} old reservations removed"
+    )
+    for uid, exercise_ids in totals["conflicts"].items():
+        print(f"  {uid}: duplicate names on exercises {', '.join(exercise_ids)}")
+
+
+if __name__ == "__main__":
+    main()
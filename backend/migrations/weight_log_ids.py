@@ -0,0 +1,107 @@
+"""Move weight logs to date-derived document IDs.
+
+Older weight logs were stored under random UUIDs, which allowed several logs
+for the same day. This migration collapses each day's logs into the most
+recently written one and stores it under ``weight_log_id(date)``.
+
+Usage::
+
+    python -m backend.migrations.weight_log_ids [--dry-run] [--user UID]
+"""
+import argparse
+from datetime import date, datetime, timezone
+from typing import Optional
+
+from ..models.body_metrics import as_date, weight_log_id
+from ..services.firestore import FirestoreService, get_firestore_service
+
+# Firestore allows at most 500 operations per batched write.
+BATCH_SIZE = 500
+
+_EPOCH = datetime.min.replace(tzinfo=timezone.utc)
+
+
+def migrate_user(fs: FirestoreService, user_id: str, dry_run: bool = False) -> dict:
+    """Merge one user's duplicate-date weight logs.
+
+    Returns counts of documents written and deleted.
+    """
+    collection = fs.get_user_collection(user_id, "weight_logs")
+
+    by_date: dict[date, list] = {}
+    for doc in collection.stream():
+        data = doc.to_dict()
+        if data.get("date") is None:
+            continue
+        by_date.setdefault(as_date(data["date"]), []).append(doc)
+
+    writes = []
+    deletes = []
+    for log_date, docs in by_date.items():
+        target_id = weight_log_id(log_date)
+        if len(docs) == 1 and docs[0].id == target_id:
+            continue
+
+        # The latest write for a day wins, as it did with the old update path.
+        latest = max(docs, key=lambda d: d.to_dict().get("created_at") or _EPOCH)
+        writes.append((collection.document(target_id), latest.to_dict()))
+        deletes.extend(doc.reference for doc in docs if doc.id != target_id)
+
+    if not dry_run:
+        batch = fs.db.batch()
+        pending = 0
+        for ref, data in writes:
+            batch.set(ref, data)
+            pending += 1
+            if pending == BATCH_SIZE:
+                batch.commit()
+                batch, pending = fs.db.batch(), 0
+        for ref in deletes:
+            batch.delete(ref)
+            pending += 1
+            if pending == BATCH_SIZE:
+                batch.commit()
+                batch, pending = fs.db.batch(), 0
+        if pending:
+            batch.commit()
+
+    return {"written": len(writes), "deleted": len(deletes)}
+
+
+def migrate(user_id: Optional[str] = None, dry_run: bool = False) -> dict:
+    """Run the migration for one user, or every user when ``user_id`` is None."""
+    fs = get_firestore_service()
+    if user_id:
+        user_ids = [user_id]
+    else:
+        user_ids = [ref.id for ref in fs.db.collection("users").list_documents()]
+
+    totals = {"users": 0, "written": 0, "deleted": 0}
+    for uid in user_ids:
+        result = migrate_user(fs, uid, dry_run=dry_run)
+        totals["users"] += 1
+        totals["written"] += result["written"]
+        totals["deleted"] += result["deleted"]
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--user", help="Only migrate this user ID")
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Report what would change without writing",
+    )
+    args = parser.parse_args()
+
+    totals = migrate(user_id=args.user, dry_run=args.dry_run)
+    prefix = "[dry run] " if args.dry_run else ""
+    print(
+        f"{prefix}{totals['users']} users, "
+        f"{totals['written']} logs written, {totals['deleted']} duplicates removed"
+    )
+
+
+if __name__ == "__main__":
+    main()
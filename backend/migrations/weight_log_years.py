@@ -0,0 +1,135 @@
+"""Copy weight logs into one document per year.
+
+Packs each user's ``weight_logs`` documents into ``weight_years/{YYYY}``,
+the layout read when ``WEIGHT_LOG_STORAGE`` is ``yearly``. Logs already in
+a year document are kept over the daily copy, so the migration can be run
+again after the switch without undoing newer writes. Run it before
+switching, and with ``--delete`` once the switch is done to remove the
+daily documents.
+
+Usage::
+
+    python -m backend.migrations.weight_log_years [--dry-run] [--delete] [--user UID]
+"""
+import argparse
+from datetime import datetime, timezone
+from typing import Optional
+
+from ..models.body_metrics import as_date
+from ..services.firestore import FirestoreService, get_firestore_service
+from ..services.weight_logs import YearlyWeightLogStore
+from .weight_log_ids import BATCH_SIZE
+
+
+def migrate_user(
+    fs: FirestoreService,
+    user_id: str,
+    dry_run: bool = False,
+    delete: bool = False,
+) -> dict:
+    """Pack one user's weight logs into year documents.
+
+    Returns counts of logs copied, year documents written and daily
+    documents deleted.
+    """
+    collection = fs.get_user_collection(user_id, "weight_logs")
+    years = YearlyWeightLogStore(fs)
+    now = datetime.now(timezone.utc)
+
+    by_year: dict[int, dict[str, tuple]] = {}
+    daily = []
+    for doc in collection.stream():
+        daily.append(doc.reference)
+        data = doc.to_dict()
+        if data.get("date") is None:
+            continue
+        day = as_date(data["date"])
+        by_year.setdefault(day.year, {})[day.isoformat()] = (
+            data.get("weight"),
+            data.get("notes"),
+            data.get("created_at") or now,
+        )
+
+    writes = []
+    copied = 0
+    for year, logs in by_year.items():
+        ref = years.ref(user_id, year)
+        doc = ref.get()
+        if doc.exists:
+            stored = doc.to_dict()
+            for i, day in enumerate(stored["dates"]):
+                logs[day] = tuple(stored[f][i] for f in years.FIELDS[1:])
+            copied -= len(stored["dates"])
+        copied += len(logs)
+        days = sorted(logs)
+        data = {"dates": days}
+        for n, field in enumerate(years.FIELDS[1:]):
+            data[field] = [logs[day][n] for day in days]
+        writes.append((ref, data))
+
+    deletes = daily if delete else []
+    if not dry_run:
+        batch = fs.db.batch()
+        pending = 0
+        for ref, data in writes:
+            batch.set(ref, data)
+            pending += 1
+            if pending == BATCH_SIZE:
+                batch.commit()
+                batch, pending = fs.db.batch(), 0
+        for ref in deletes:
+            batch.delete(ref)
+            pending += 1
+            if pending == BATCH_SIZE:
+                batch.commit()
+                batch, pending = fs.db.batch(), 0
+        if pending:
+            batch.commit()
+
+    return {"copied": copied, "years": len(writes), "deleted": len(deletes)}
+
+
+def migrate(
+    user_id: Optional[str] = None, dry_run: bool = False, delete: bool = False
+) -> dict:
+    """Run the migration for one user, or every user when ``user_id`` is None."""
+    fs = get_firestore_service()
+    if user_id:
+        user_ids = [user_id]
+    else:
+        user_ids = [ref.id for ref in fs.db.collection("users").list_documents()]
+
+    totals = {"users": 0, "copied": 0, "years": 0, "deleted": 0}
+    for uid in user_ids:
+        result = migrate_user(fs, uid, dry_run=dry_run, delete=delete)
+        totals["users"] += 1
+        for key in ("copied", "years", "deleted"):
+            totals[key] += result[key]
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--user", help="Only migrate this user ID")
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Report what would change without writing",
+    )
+    parser.add_argument(
+        "--delete",
+        action="store_true",
+        help="Delete the daily documents once copied",
+    )
+    args = parser.parse_args()
+
+    totals = migrate(user_id=args.user, dry_run=args.dry_run, delete=args.delete)
+    prefix = "[dry run] " if args.dry_run else ""
+    print(
+        f"{prefix}{totals['users']} users, {totals['copied']} logs copied into "
+        f"{totals['years']} year documents, {totals['deleted']} daily logs removed"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -12,9 +12,12 @@ from .session import (
     WorkoutSessionCreate,
     PerformedExercise,
     PerformedSet,
+    PreviousPerformance,
+    TrainingCalendar,
 )
 from .body_metrics import BodyMetrics, WeightLog, WeightLogCreate
 from .user import UserProfile
+from .account import DeletionJob, DeletionReport
 
 __all__ = [
     "Exercise",
@@ -30,8 +33,12 @@ __all__ = [
     "WorkoutSessionCreate",
     "PerformedExercise",
     "PerformedSet",
+    "PreviousPerformance",
+    "TrainingCalendar",
     "BodyMetrics",
     "WeightLog",
     "WeightLogCreate",
     "UserProfile",
+    "DeletionJob",
+    "DeletionReport",
 ]
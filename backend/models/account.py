@@ -0,0 +1,26 @@
+from pydantic import BaseModel, Field
+from typing import Optional
+from datetime import datetime
+from enum import Enum
+
+
+class DeletionReport(BaseModel):
+    dry_run: bool
+    # Documents deleted (or that would be deleted/updated) per collection
+    counts: dict[str, int] = Field(default_factory=dict)
+
+
+class DeletionStatus(str, Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+class DeletionJob(BaseModel):
+    id: str
+    status: DeletionStatus
+    counts: dict[str, int] = Field(default_factory=dict)
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
@@ -29,3 +29,21 @@ class BodyMetrics(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+def weight_log_id(log_date: date) -> str:
+    """Deterministic document ID for the weight log of a given day."""
+    return log_date.isoformat()
+
+
+def as_date(value) -> date:
+    """The day of a stored ``date`` field.
+
+    Firestore returns dates as timestamps, and older documents hold ISO
+    strings.
+    """
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    return value
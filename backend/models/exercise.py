@@ -1,7 +1,8 @@
-from pydantic import BaseModel, Field
-from typing import Optional
+from pydantic import BaseModel, Field, StringConstraints, field_validator
+from typing import Annotated, Optional
 from datetime import datetime
 from enum import Enum
+from urllib.parse import quote
 
 
 class MuscleGroup(str, Enum):
@@ -26,6 +27,13 @@ class ExerciseCategory(str, Enum):
     FLEXIBILITY = "flexibility"
 
 
+# Names as given by clients: surrounding whitespace is dropped, and a name
+# that is only whitespace is rejected.
+ExerciseName = Annotated[
+    str, StringConstraints(strip_whitespace=True, min_length=1, max_length=100)
+]
+
+
 class ExerciseBase(BaseModel):
     name: str = Field(..., min_length=1, max_length=100)
     muscle_group: MuscleGroup
@@ -34,15 +42,24 @@ class ExerciseBase(BaseModel):
 
 
 class ExerciseCreate(ExerciseBase):
-    pass
+    name: ExerciseName
 
 
 class ExerciseUpdate(BaseModel):
-    name: Optional[str] = Field(None, min_length=1, max_length=100)
+    name: Optional[ExerciseName] = None
     muscle_group: Optional[MuscleGroup] = None
     category: Optional[ExerciseCategory] = None
     notes: Optional[str] = None
 
+    @field_validator("name", "muscle_group", "category", mode="before")
+    @classmethod
+    def not_null(cls, value):
+        # Only runs for fields the client sent; null would otherwise clear
+        # a field every exercise has. Notes may be cleared.
+        if value is None:
+            raise ValueError("may be left out but not null")
+        return value
+
 
 class Exercise(ExerciseBase):
     id: str
@@ -52,3 +69,18 @@ class Exercise(ExerciseBase):
 
     class Config:
         from_attributes = True
+
+
+# Starts every name key, so a key is never empty, "." or "..", nor a
+# reserved ID of the form __x__.
+NAME_KEY_PREFIX = "n:"
+
+
+def exercise_name_key(name: str) -> str:
+    """Document ID reserving an exercise name for one user.
+
+    Names that differ only in case or whitespace share a key. The name is
+    percent-encoded, so it contains no "/", behind ``NAME_KEY_PREFIX``.
+    """
+    normalized = " ".join(name.split()).casefold()
+    return NAME_KEY_PREFIX + quote(normalized, safe="")
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field
-from typing import Optional, Union
+from pydantic import BaseModel, Field, TypeAdapter, field_validator
+from typing import Annotated, Literal, Optional, TypeVar, Union
 from datetime import datetime, date
 from enum import Enum
 
@@ -17,15 +17,21 @@ class RoutineItemBase(BaseModel):
     target_rpe: Optional[float] = Field(None, ge=1, le=10)
     rest_seconds: int = Field(default=90, ge=0, le=600)
     notes: Optional[str] = None
-    order: int = Field(..., ge=0)
+    # Assigned by the server from the item's position
+    order: int = Field(default=0, ge=0)
 
 
 class RoutineItemCreate(RoutineItemBase):
-    pass
+    # Existing item ID to keep when a routine is updated
+    id: Optional[str] = None
 
 
 class RoutineItem(RoutineItemBase):
     id: str
+    # Only filled in responses, from the current exercise
+    exercise_name: Optional[str] = None
+    muscle_group: Optional[str] = None
+    category: Optional[str] = None
 
     class Config:
         from_attributes = True
@@ -33,9 +39,9 @@ class RoutineItem(RoutineItemBase):
 
 class SupersetBase(BaseModel):
     name: Optional[str] = None
-    items: list[RoutineItemCreate]
+    items: list[RoutineItemCreate] = Field(..., min_length=1)
     rest_seconds: int = Field(default=90, ge=0, le=600)
-    order: int = Field(..., ge=0)
+    order: int = Field(default=0, ge=0)
 
 
 class Superset(SupersetBase):
@@ -46,10 +52,33 @@ class Superset(SupersetBase):
         from_attributes = True
 
 
-class RoutineProvision(BaseModel):
-    """A provision can be either a single exercise item or a superset."""
-    type: RoutineItemType
-    data: Union[RoutineItem, Superset]
+class ExerciseProvisionCreate(RoutineItemCreate):
+    type: Literal["exercise"] = "exercise"
+
+
+class SupersetProvisionCreate(SupersetBase):
+    type: Literal["superset"]
+    id: Optional[str] = None
+
+
+class ExerciseProvision(RoutineItem):
+    type: Literal["exercise"] = "exercise"
+
+
+class SupersetProvision(Superset):
+    type: Literal["superset"] = "superset"
+
+
+# A provision is either a single exercise item or a superset, told apart by
+# its ``type`` field.
+RoutineProvisionCreate = Annotated[
+    Union[ExerciseProvisionCreate, SupersetProvisionCreate],
+    Field(discriminator="type"),
+]
+RoutineProvision = Annotated[
+    Union[ExerciseProvision, SupersetProvision],
+    Field(discriminator="type"),
+]
 
 
 class RoutineBase(BaseModel):
@@ -60,7 +89,7 @@ class RoutineBase(BaseModel):
 
 
 class RoutineCreate(RoutineBase):
-    provisions: list[dict] = Field(default_factory=list)
+    provisions: list[RoutineProvisionCreate] = Field(default_factory=list)
 
 
 class RoutineUpdate(BaseModel):
@@ -68,15 +97,142 @@ class RoutineUpdate(BaseModel):
     description: Optional[str] = None
     schedule_start_date: Optional[date] = None
     schedule_end_date: Optional[date] = None
-    provisions: Optional[list[dict]] = None
+    # Left out to keep the current provisions; [] removes them all.
+    provisions: Optional[list[RoutineProvisionCreate]] = None
+
+    @field_validator("name", "provisions", mode="before")
+    @classmethod
+    def not_null(cls, value):
+        # Only runs for fields the client sent; null would otherwise clear
+        # a field every routine has.
+        if value is None:
+            raise ValueError("may be left out but not null")
+        return value
 
 
 class Routine(RoutineBase):
     id: str
     user_id: str
-    provisions: list[dict] = Field(default_factory=list)
+    provisions: list[RoutineProvision] = Field(default_factory=list)
     created_at: datetime
     updated_at: datetime
 
     class Config:
         from_attributes = True
+
+
+def routine_items(provisions: list[RoutineProvision]) -> list[RoutineItem]:
+    """Flatten provisions into their exercise items, including superset items."""
+    items = []
+    for provision in provisions:
+        if provision.type == RoutineItemType.SUPERSET:
+            items.extend(provision.items)
+        else:
+            items.append(provision)
+    return items
+
+
+# Stored provisions use short keys and leave out unset values to keep routine
+# documents small. Documents written before the compact format have no
+# ``provisions_format`` field and hold full provision dicts.
+PROVISIONS_FORMAT = 1
+
+_ITEM_KEYS = {
+    "id": "i",
+    "exercise_id": "e",
+    "target_sets": "s",
+    "target_reps": "r",
+    "target_weight": "w",
+    "target_rpe": "p",
+    "rest_seconds": "rs",
+    "notes": "n",
+}
+_SUPERSET_KEYS = {"id": "i", "name": "nm", "rest_seconds": "rs"}
+
+_provisions_adapter = TypeAdapter(list[RoutineProvision])
+
+Model = TypeVar("Model", bound=BaseModel)
+
+# Default values of each stored model's optional fields; none are mutable.
+_DEFAULTS = {
+    model: {
+        name: field.get_default(call_default_factory=True)
+        for name, field in model.model_fields.items()
+        if not field.is_required()
+    }
+    for model in (ExerciseProvision, SupersetProvision, RoutineItem)
+}
+
+
+def _compact(model: BaseModel, keys: dict[str, str]) -> dict:
+    return {
+        short: value
+        for field, short in keys.items()
+        if (value := getattr(model, field)) is not None
+    }
+
+
+def _construct(
+    model: type[Model], data: dict, keys: dict[str, str], order: int, **fields
+) -> Model:
+    """``model.model_construct()`` from a compact dict, without its overhead.
+
+    Only for stored values, which were validated when they were written:
+    nothing is checked, and the defaults of missing fields are not copied.
+    """
+    values = _DEFAULTS[model].copy()
+    for field, short in keys.items():
+        if short in data:
+            values[field] = data[short]
+    values["order"] = order
+    values.update(fields)
+    built = model.__new__(model)
+    object.__setattr__(built, "__dict__", values)
+    object.__setattr__(built, "__pydantic_fields_set__", set(values))
+    object.__setattr__(built, "__pydantic_extra__", None)
+    object.__setattr__(built, "__pydantic_private__", None)
+    return built
+
+
+def encode_provisions(provisions: list[RoutineProvision]) -> list[dict]:
+    """Convert provisions to their compact storage form."""
+    encoded = []
+    for provision in provisions:
+        if provision.type == RoutineItemType.SUPERSET:
+            encoded.append({
+                "t": "s",
+                **_compact(provision, _SUPERSET_KEYS),
+                "it": [_compact(item, _ITEM_KEYS) for item in provision.items],
+            })
+        else:
+            encoded.append({"t": "e", **_compact(provision, _ITEM_KEYS)})
+    return encoded
+
+
+def decode_provisions(
+    stored: list[dict], storage_format: Optional[int] = None
+) -> list[RoutineProvision]:
+    """Build provision models from a routine document's stored provisions.
+
+    Compact provisions were validated when they were written, so they are
+    built without validating them again. Documents from
+    before the compact format are validated, as they always were.
+    """
+    if storage_format != PROVISIONS_FORMAT:
+        return _provisions_adapter.validate_python(
+            [{"type": RoutineItemType.EXERCISE.value, **p} for p in stored]
+        )
+
+    provisions: list[RoutineProvision] = []
+    for order, data in enumerate(stored):
+        if data["t"] == "s":
+            items = [
+                _construct(RoutineItem, item, _ITEM_KEYS, j)
+                for j, item in enumerate(data["it"])
+            ]
+            provisions.append(
+                _construct(SupersetProvision, data, _SUPERSET_KEYS, order, items=items)
+            )
+        else:
+            provisions.append(_construct(ExerciseProvision, data, _ITEM_KEYS, order))
+    return provisions
@@ -1,6 +1,7 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import Any, Optional
 from datetime import datetime, date
+from enum import Enum
 
 
 class PerformedSet(BaseModel):
@@ -12,6 +13,13 @@ class PerformedSet(BaseModel):
     notes: Optional[str] = None
 
 
+class PreviousPerformance(BaseModel):
+    """The sets done the last time an exercise or routine item was performed."""
+    session_id: str
+    date: date
+    sets: list[PerformedSet] = Field(default_factory=list)
+
+
 class PerformedExerciseBase(BaseModel):
     exercise_id: str
     routine_item_id: Optional[str] = None
@@ -19,11 +27,23 @@ class PerformedExerciseBase(BaseModel):
     sets: list[PerformedSet] = Field(default_factory=list)
     order: int = Field(..., ge=0)
     notes: Optional[str] = None
+    # Plan carried over from the routine item when a routine is expanded
+    superset_id: Optional[str] = None
+    target_sets: Optional[int] = None
+    target_reps: Optional[int] = None
+    target_weight: Optional[float] = None
+    target_rpe: Optional[float] = None
+    rest_seconds: Optional[int] = None
 
 
 class PerformedExercise(PerformedExerciseBase):
     id: str
     exercise_name: Optional[str] = None
+    # Only filled in responses that ask for exercise details
+    muscle_group: Optional[str] = None
+    category: Optional[str] = None
+    # Only filled in responses that add exercises to a session
+    previous: Optional[PreviousPerformance] = None
 
     class Config:
         from_attributes = True
@@ -37,7 +57,8 @@ class WorkoutSessionBase(BaseModel):
 
 
 class WorkoutSessionCreate(WorkoutSessionBase):
-    pass
+    # Prefill performed exercises from the routine's provisions
+    expand_routine: bool = False
 
 
 class WorkoutSessionUpdate(BaseModel):
@@ -51,6 +72,7 @@ class WorkoutSession(WorkoutSessionBase):
     start_time: datetime
     end_time: Optional[datetime] = None
     performed_exercises: list[PerformedExercise] = Field(default_factory=list)
+    version: int = 0
     created_at: datetime
     updated_at: datetime
 
@@ -69,3 +91,48 @@ class AddSetToExercise(BaseModel):
     weight: float = Field(..., ge=0)
     rpe: Optional[float] = Field(None, ge=1, le=10)
     notes: Optional[str] = None
+
+
+class SessionDelta(BaseModel):
+    """Compact response for a session mutation: the session's new version."""
+    session_id: str
+    version: int
+    updated_at: datetime
+
+
+class PerformedExerciseDelta(SessionDelta):
+    performed_exercise: PerformedExercise
+
+
+class PerformedSetDelta(SessionDelta):
+    performed_exercise_id: str
+    performed_set: PerformedSet
+
+
+class TrainingCalendar(BaseModel):
+    """A year of training days, for a heatmap and streak counters."""
+    year: int
+    # One entry per day of the year: 0 for rest, 1-4 for volume lifted
+    levels: list[int]
+    training_days: int
+    current_streak: int
+    longest_streak: int
+
+
+class SessionEventType(str, Enum):
+    SNAPSHOT = "snapshot"
+    EXERCISE_ADDED = "exercise_added"
+    SET_ADDED = "set_added"
+    SESSION_UPDATED = "session_updated"
+    SESSION_FINISHED = "session_finished"
+    SESSION_DELETED = "session_deleted"
+    RESYNC = "resync"
+
+
+class SessionEvent(BaseModel):
+    """A change to a session, pushed to live subscribers."""
+    type: SessionEventType
+    session_id: str
+    version: Optional[int] = None
+    updated_at: Optional[datetime] = None
+    data: dict[str, Any] = Field(default_factory=dict)
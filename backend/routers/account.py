@@ -0,0 +1,86 @@
+import asyncio
+
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+
+from ..models.account import DeletionJob, DeletionReport
+from ..auth import get_current_user, AuthenticatedUser
+from ..services.bulk_delete import BulkDeleter, deletion_jobs
+from ..services.exercise_search import exercise_search
+from ..services.firestore import get_firestore_service
+from ..services.idempotency import IdempotentRoute
+from ..services.job_queue import job_queue
+from ..services.maintenance import ACCOUNT_DELETED
+from ..services.profiles import profiles
+from ..services.rate_limit import rate_limit
+from ..services.singleflight import single_flight
+
+router = APIRouter(
+    prefix="/account",
+    tags=["account"],
+    dependencies=[Depends(rate_limit, scope="function")],
+    route_class=IdempotentRoute,
+)
+
+
+@router.delete("", response_model=DeletionReport)
+async def delete_account_data(
+    dry_run: bool = False,
+    user: AuthenticatedUser = Depends(get_current_user),
+):
+    """Delete all of the authenticated user's data.
+
+    With ``dry_run`` nothing is deleted and the response reports how many
+    documents would be. Large accounts should use ``POST /account/deletion``
+    instead, which runs in the background.
+    """
+    deleter = BulkDeleter(get_firestore_service())
+    # Batched deletes across every collection; keep the event loop free.
+    counts = await asyncio.to_thread(
+        deleter.delete_user_data, user.uid, dry_run=dry_run
+    )
+    if not dry_run:
+        exercise_search.forget(user.uid)
+        profiles.forget(user.uid)
+        single_flight.invalidate(user.uid)
+    return DeletionReport(dry_run=dry_run, counts=counts)
+
+
+@router.post(
+    "/deletion",
+    response_model=DeletionJob,
+    status_code=status.HTTP_202_ACCEPTED,
+)
+async def start_account_deletion(
+    response: Response,
+    user: AuthenticatedUser = Depends(get_current_user),
+):
+    """Delete all of the authenticated user's data in the background.
+
+    The deletion runs on the job queue, so it is retried after a failure
+    and resumed after a restart. Poll ``GET /account/deletion`` for
+    progress. Starting a deletion while one is already running returns the
+    running job.
+    """
+    job, created = deletion_jobs.start(user.uid)
+    if created:
+        job_queue.enqueue(user.uid, ACCOUNT_DELETED, {}, key=user.uid)
+        exercise_search.forget(user.uid)
+        profiles.forget(user.uid)
+        single_flight.invalidate(user.uid)
+    else:
+        response.status_code = status.HTTP_200_OK
+    return job
+
+
+@router.get("/deletion", response_model=DeletionJob)
+async def get_account_deletion(
+    user: AuthenticatedUser = Depends(get_current_user),
+):
+    """Get the status of the authenticated user's latest background deletion."""
+    job = deletion_jobs.get(user.uid)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No account deletion found",
+        )
+    return job
@@ -1,13 +1,47 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import JSONResponse
 from datetime import datetime, timezone
 from typing import Optional
+import asyncio
 import uuid
 
-from ..models.exercise import Exercise, ExerciseCreate, ExerciseUpdate
+from firebase_admin import firestore
+from google.api_core.exceptions import AlreadyExists
+
+from ..models.exercise import (
+    Exercise,
+    ExerciseCreate,
+    ExerciseUpdate,
+    MuscleGroup,
+    exercise_name_key,
+)
+from ..models.account import DeletionReport
 from ..auth import get_current_user, AuthenticatedUser
-from ..services.firestore import get_firestore_service
+from ..config import settings
+from ..services.bulk_delete import BulkDeleter
+from ..services.cache import doc_key, get_cache
+from ..services.exercise_search import exercise_search
+from ..services.firestore import FirestoreService, get_firestore_service
+from ..services.idempotency import IdempotentRoute
+from ..services.job_queue import job_queue
+from ..services.maintenance import EXERCISE_DELETED, EXERCISE_RENAMED
+from ..services.rate_limit import rate_limit
+from ..services.singleflight import single_flight
+from ..services.tracing import build_model, build_models
+
+router = APIRouter(
+    prefix="/exercises",
+    tags=["exercises"],
+    dependencies=[Depends(rate_limit, scope="function")],
+    route_class=IdempotentRoute,
+)
+
 
-router = APIRouter(prefix="/exercises", tags=["exercises"])
+def _name_ref(fs: FirestoreService, user_id: str, name: str):
+    """Reservation document that makes exercise names unique per user."""
+    return fs.get_user_collection(user_id, "exercise_names").document(
+        exercise_name_key(name)
+    )
 
 
 @router.get("", response_model=list[Exercise])
@@ -23,15 +57,53 @@ async def list_exercises(
     if muscle_group:
         query = query.where("muscle_group", "==", muscle_group)
 
-    docs = query.stream()
-    exercises = []
-    for doc in docs:
-        data = doc.to_dict()
-        data["id"] = doc.id
-        data["user_id"] = user.uid
-        exercises.append(Exercise(**data))
+    def load():
+        rows = []
+        for doc in fs.query(query):
+            data = doc.to_dict()
+            data["id"] = doc.id
+            data["user_id"] = user.uid
+            rows.append(data)
+        return build_models(Exercise, rows)
+
+    return await single_flight.do(user.uid, ("exercises", muscle_group), load)
+
 
-    return exercises
+@router.get("/search", response_model=list[Exercise])
+async def search_exercises(
+    q: str = Query(..., min_length=1, max_length=100),
+    muscle_group: Optional[MuscleGroup] = None,
+    limit: int = Query(20, ge=1, le=settings.MAX_LIST_LIMIT),
+    user: AuthenticatedUser = Depends(get_current_user),
+):
+    """Search exercise names and notes, tolerating typos.
+
+    Every word of ``q`` has to match a word of the exercise, as a prefix or
+    a close misspelling. Name matches rank above notes matches.
+    """
+    fs = get_firestore_service()
+    collection = fs.get_user_collection(user.uid, "exercises")
+
+    def load():
+        return [
+            Exercise(id=doc.id, user_id=user.uid, **doc.to_dict())
+            for doc in fs.query(collection)
+        ]
+
+    index = exercise_search.cached(user.uid)
+    if index is None:
+        # Building reads every exercise, so it runs in a thread, once for
+        # concurrent searches by the same user.
+        index = await single_flight.do(
+            user.uid,
+            ("exercise_index",),
+            lambda: exercise_search.index(user.uid, load),
+        )
+    where = None
+    if muscle_group:
+        def where(exercise: Exercise) -> bool:
+            return exercise.muscle_group == muscle_group
+    return index.search(q, limit, where)
 
 
 @router.post("", response_model=Exercise, status_code=status.HTTP_201_CREATED)
@@ -41,15 +113,6 @@ async def create_exercise(
 ):
     """Create a new exercise."""
     fs = get_firestore_service()
-    collection = fs.get_user_collection(user.uid, "exercises")
-
-    # Check for duplicate name
-    existing = collection.where("name", "==", exercise.name).limit(1).stream()
-    if any(True for _ in existing):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Exercise with this name already exists",
-        )
 
     now = datetime.now(timezone.utc)
     exercise_id = str(uuid.uuid4())
@@ -60,9 +123,28 @@ async def create_exercise(
         "updated_at": now,
     }
 
-    collection.document(exercise_id).set(data)
+    # Claim the name and write the exercise atomically; create() fails if
+    # another exercise already holds the name.
+    batch = fs.db.batch()
+    batch.create(
+        _name_ref(fs, user.uid, exercise.name),
+        {"exercise_id": exercise_id, "name": exercise.name},
+    )
+    batch.set(
+        fs.get_user_collection(user.uid, "exercises").document(exercise_id), data
+    )
+    try:
+        fs.write(batch.commit)
+    except AlreadyExists:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Exercise with this name already exists",
+        )
+    single_flight.invalidate(user.uid)
 
-    return Exercise(id=exercise_id, user_id=user.uid, **data)
+    created = Exercise(id=exercise_id, user_id=user.uid, **data)
+    exercise_search.upsert(created)
+    return created
 
 
 @router.get("/{exercise_id}", response_model=Exercise)
@@ -72,18 +154,24 @@ async def get_exercise(
 ):
     """Get a specific exercise by ID."""
     fs = get_firestore_service()
-    doc = fs.get_user_collection(user.uid, "exercises").document(exercise_id).get()
+    doc_ref = fs.get_user_collection(user.uid, "exercises").document(exercise_id)
 
-    if not doc.exists:
+    def load():
+        doc = fs.read(doc_ref.get)
+        return doc.to_dict() if doc.exists else None
+
+    data = get_cache().get_or_load(
+        doc_key("exercises", user.uid, exercise_id), load, settings.CACHE_TTL_SECONDS
+    )
+    if data is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Exercise not found",
         )
 
-    data = doc.to_dict()
-    data["id"] = doc.id
+    data["id"] = exercise_id
     data["user_id"] = user.uid
-    return Exercise(**data)
+    return build_model(Exercise, data)
 
 
 @router.patch("/{exercise_id}", response_model=Exercise)
@@ -95,13 +183,6 @@ async def update_exercise(
     """Update an existing exercise."""
     fs = get_firestore_service()
     doc_ref = fs.get_user_collection(user.uid, "exercises").document(exercise_id)
-    doc = doc_ref.get()
-
-    if not doc.exists:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Exercise not found",
-        )
 
     update_data = exercise_update.model_dump(exclude_unset=True)
     if not update_data:
@@ -110,45 +191,114 @@ async def update_exercise(
             detail="No fields to update",
         )
 
-    # Check for duplicate name if name is being updated
-    if "name" in update_data:
-        existing = (
-            fs.get_user_collection(user.uid, "exercises")
-            .where("name", "==", update_data["name"])
-            .limit(1)
-            .stream()
-        )
-        for existing_doc in existing:
-            if existing_doc.id != exercise_id:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Exercise with this name already exists",
-                )
-
     update_data["updated_at"] = datetime.now(timezone.utc)
-    doc_ref.update(update_data)
 
-    updated_doc = doc_ref.get()
-    data = updated_doc.to_dict()
-    data["id"] = updated_doc.id
+    @firestore.transactional
+    def update_in_transaction(transaction):
+        doc = doc_ref.get(transaction=transaction)
+        if not doc.exists:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Exercise not found",
+            )
+        data = doc.to_dict()
+
+        # Renames move the name reservation; all reads happen before writes.
+        if "name" in update_data:
+            old_ref = _name_ref(fs, user.uid, data["name"])
+            new_ref = _name_ref(fs, user.uid, update_data["name"])
+            if new_ref.id != old_ref.id:
+                claimed = new_ref.get(transaction=transaction)
+                if claimed.exists and claimed.get("exercise_id") != exercise_id:
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail="Exercise with this name already exists",
+                    )
+                released = old_ref.get(transaction=transaction)
+                if released.exists and released.get("exercise_id") == exercise_id:
+                    transaction.delete(old_ref)
+            transaction.set(
+                new_ref, {"exercise_id": exercise_id, "name": update_data["name"]}
+            )
+
+        transaction.update(doc_ref, update_data)
+        return {**data, **update_data}, data["name"]
+
+    data, old_name = await asyncio.to_thread(fs.transact, update_in_transaction)
+    get_cache().put(
+        doc_key("exercises", user.uid, exercise_id), data, settings.CACHE_TTL_SECONDS
+    )
+    if data["name"] != old_name:
+        # Names stored on past sessions are brought up to date in the
+        # background; reads show the current name meanwhile.
+        job_queue.enqueue(
+            user.uid, EXERCISE_RENAMED, {"exercise_id": exercise_id}, key=exercise_id
+        )
+    single_flight.invalidate(user.uid)
+    data["id"] = exercise_id
     data["user_id"] = user.uid
-    return Exercise(**data)
+    updated = build_model(Exercise, data)
+    exercise_search.upsert(updated)
+    return updated
 
 
-@router.delete("/{exercise_id}", status_code=status.HTTP_204_NO_CONTENT)
+@router.delete(
+    "/{exercise_id}",
+    status_code=status.HTTP_204_NO_CONTENT,
+    responses={status.HTTP_200_OK: {"model": DeletionReport}},
+)
 async def delete_exercise(
     exercise_id: str,
+    include_sessions: bool = False,
+    dry_run: bool = False,
     user: AuthenticatedUser = Depends(get_current_user),
 ):
-    """Delete an exercise."""
+    """Delete an exercise, release its name and remove it from routines.
+
+    With ``include_sessions`` it is removed from past sessions as well,
+    which erases that part of the workout history. With ``dry_run`` nothing
+    is changed and the response reports how many documents would be;
+    changes to sessions still buffered by write-behind are not counted.
+    """
     fs = get_firestore_service()
     doc_ref = fs.get_user_collection(user.uid, "exercises").document(exercise_id)
-    doc = doc_ref.get()
 
-    if not doc.exists:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Exercise not found",
+    if dry_run:
+        if not fs.read(doc_ref.get).exists:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Exercise not found",
+            )
+        counts = BulkDeleter(fs).delete_exercise_references(
+            user.uid, exercise_id, include_sessions, dry_run=True
         )
+        report = DeletionReport(dry_run=True, counts={"exercises": 1, **counts})
+        return JSONResponse(report.model_dump())
+
+    @firestore.transactional
+    def delete_in_transaction(transaction):
+        doc = doc_ref.get(transaction=transaction)
+        if not doc.exists:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Exercise not found",
+            )
+
+        name_ref = _name_ref(fs, user.uid, doc.get("name"))
+        reservation = name_ref.get(transaction=transaction)
+        if reservation.exists and reservation.get("exercise_id") == exercise_id:
+            transaction.delete(name_ref)
+        transaction.delete(doc_ref)
 
-    doc_ref.delete()
+    await asyncio.to_thread(fs.transact, delete_in_transaction)
+    get_cache().invalidate(doc_key("exercises", user.uid, exercise_id))
+    # Routines and sessions referring to the exercise are cleaned up in the
+    # background.
+    job_queue.enqueue(
+        user.uid,
+        EXERCISE_DELETED,
+        {"exercise_id": exercise_id, "include_sessions": include_sessions},
+        key=exercise_id,
+    )
+    exercise_search.remove(user.uid, exercise_id)
+    single_flight.invalidate(user.uid)
@@ -3,50 +3,164 @@ from datetime import datetime, timezone
 from typing import Optional
 import uuid
 
-from ..models.routine import Routine, RoutineCreate, RoutineUpdate
+from google.api_core.exceptions import NotFound
+
+from ..models.routine import (
+    PROVISIONS_FORMAT,
+    ExerciseProvision,
+    Routine,
+    RoutineCreate,
+    RoutineItem,
+    RoutineItemType,
+    RoutineProvision,
+    RoutineProvisionCreate,
+    RoutineUpdate,
+    SupersetProvision,
+    decode_provisions,
+    encode_provisions,
+    routine_items,
+)
 from ..auth import get_current_user, AuthenticatedUser
-from ..services.firestore import get_firestore_service
-
-router = APIRouter(prefix="/routines", tags=["routines"])
+from ..config import settings
+from ..services.cache import doc_key, get_cache
+from ..services.firestore import (
+    EXERCISE_DETAIL_FIELDS,
+    FirestoreService,
+    get_firestore_service,
+)
+from ..services.idempotency import IdempotentRoute
+from ..services.rate_limit import rate_limit
+from ..services.singleflight import single_flight
+from ..services.tracing import build_model, build_models
+
+router = APIRouter(
+    prefix="/routines",
+    tags=["routines"],
+    dependencies=[Depends(rate_limit, scope="function")],
+    route_class=IdempotentRoute,
+)
+
+
+def _routine_data(data: dict, routine_id: str, user_id: str) -> dict:
+    """Routine fields from a stored document's data, with provisions decoded."""
+    data["id"] = routine_id
+    data["user_id"] = user_id
+    data["provisions"] = decode_provisions(
+        data.get("provisions", []), data.pop("provisions_format", None)
+    )
+    return data
+
+
+def _assign_ids(
+    provisions: list[RoutineProvisionCreate], keep_ids: bool = False
+) -> list[RoutineProvision]:
+    """Give provisions and superset items IDs and orders from their position."""
+
+    def item_id(item) -> str:
+        return (keep_ids and item.id) or str(uuid.uuid4())
+
+    assigned = []
+    for i, provision in enumerate(provisions):
+        if provision.type == RoutineItemType.SUPERSET:
+            assigned.append(
+                SupersetProvision(
+                    id=item_id(provision),
+                    name=provision.name,
+                    rest_seconds=provision.rest_seconds,
+                    order=i,
+                    items=[
+                        RoutineItem(
+                            **item.model_dump(exclude={"id", "order"}),
+                            id=item_id(item),
+                            order=j,
+                        )
+                        for j, item in enumerate(provision.items)
+                    ],
+                )
+            )
+        else:
+            assigned.append(
+                ExerciseProvision(
+                    **provision.model_dump(exclude={"id", "order", "type"}),
+                    id=item_id(provision),
+                    order=i,
+                )
+            )
+    return assigned
+
+
+def _hydrate_provisions(
+    fs: FirestoreService,
+    user_id: str,
+    routines: list[dict],
+    details: bool = False,
+):
+    """Fill in current exercise names on the items of ``routines`` in place.
+
+    All routines share one batched read. With ``details`` the exercise's
+    muscle group and category are added as well.
+    """
+    items = [
+        item
+        for routine in routines
+        for item in routine_items(routine.get("provisions", []))
+    ]
+    exercises = fs.get_exercises_by_id(
+        user_id,
+        (item.exercise_id for item in items),
+        EXERCISE_DETAIL_FIELDS if details else ("name",),
+    )
+    for item in items:
+        exercise = exercises.get(item.exercise_id)
+        if exercise is None:
+            continue
+        item.exercise_name = exercise.get("name")
+        if details:
+            item.muscle_group = exercise.get("muscle_group")
+            item.category = exercise.get("category")
 
 
 @router.get("", response_model=list[Routine])
 async def list_routines(
     active_only: bool = False,
+    exercise_details: bool = False,
     user: AuthenticatedUser = Depends(get_current_user),
 ):
     """List all routines for the authenticated user."""
     fs = get_firestore_service()
     collection = fs.get_user_collection(user.uid, "routines")
 
-    docs = collection.stream()
-    routines = []
-    today = datetime.now(timezone.utc).date()
+    def load():
+        routines = []
+        today = datetime.now(timezone.utc).date()
 
-    for doc in docs:
-        data = doc.to_dict()
-        data["id"] = doc.id
-        data["user_id"] = user.uid
+        for doc in fs.query(collection):
+            data = _routine_data(doc.to_dict(), doc.id, user.uid)
 
-        # Convert Firestore timestamps to Python datetime
-        if data.get("created_at"):
-            data["created_at"] = data["created_at"]
-        if data.get("updated_at"):
-            data["updated_at"] = data["updated_at"]
+            # Convert Firestore timestamps to Python datetime
+            if data.get("created_at"):
+                data["created_at"] = data["created_at"]
+            if data.get("updated_at"):
+                data["updated_at"] = data["updated_at"]
 
-        # Filter active routines if requested
-        if active_only:
-            start_date = data.get("schedule_start_date")
-            end_date = data.get("schedule_end_date")
+            # Filter active routines if requested
+            if active_only:
+                start_date = data.get("schedule_start_date")
+                end_date = data.get("schedule_end_date")
 
-            if start_date and start_date > today:
-                continue
-            if end_date and end_date < today:
-                continue
+                if start_date and start_date > today:
+                    continue
+                if end_date and end_date < today:
+                    continue
 
-        routines.append(Routine(**data))
+            routines.append(data)
 
-    return routines
+        _hydrate_provisions(fs, user.uid, routines, exercise_details)
+        return build_models(Routine, routines)
+
+    return await single_flight.do(
+        user.uid, ("routines", active_only, exercise_details), load
+    )
 
 
 @router.post("", response_model=Routine, status_code=status.HTTP_201_CREATED)
@@ -61,54 +175,57 @@ async def create_routine(
     now = datetime.now(timezone.utc)
     routine_id = str(uuid.uuid4())
 
-    # Process provisions to add IDs
-    provisions = []
-    for i, provision in enumerate(routine.provisions):
-        provision_with_id = {**provision, "id": str(uuid.uuid4()), "order": i}
-
-        # If it's a superset, add IDs to items
-        if provision.get("type") == "superset" and provision.get("items"):
-            provision_with_id["items"] = [
-                {**item, "id": str(uuid.uuid4()), "order": j}
-                for j, item in enumerate(provision["items"])
-            ]
-
-        provisions.append(provision_with_id)
+    provisions = _assign_ids(routine.provisions)
 
     data = {
         "name": routine.name,
         "description": routine.description,
         "schedule_start_date": routine.schedule_start_date,
         "schedule_end_date": routine.schedule_end_date,
-        "provisions": provisions,
+        "provisions": encode_provisions(provisions),
+        "provisions_format": PROVISIONS_FORMAT,
         "created_at": now,
         "updated_at": now,
     }
 
-    collection.document(routine_id).set(data)
+    fs.write(collection.document(routine_id).set, data)
+    single_flight.invalidate(user.uid)
+
+    del data["provisions_format"]
+    data["provisions"] = provisions
 
+    _hydrate_provisions(fs, user.uid, [data])
     return Routine(id=routine_id, user_id=user.uid, **data)
 
 
 @router.get("/{routine_id}", response_model=Routine)
 async def get_routine(
     routine_id: str,
+    exercise_details: bool = False,
     user: AuthenticatedUser = Depends(get_current_user),
 ):
     """Get a specific routine by ID."""
     fs = get_firestore_service()
-    doc = fs.get_user_collection(user.uid, "routines").document(routine_id).get()
+    doc_ref = fs.get_user_collection(user.uid, "routines").document(routine_id)
 
-    if not doc.exists:
+    def load():
+        doc = fs.read(doc_ref.get)
+        return doc.to_dict() if doc.exists else None
+
+    # The stored form is cached, as the cache can hold only plain data, and
+    # before hydration, so exercise renames show up straight away.
+    stored = get_cache().get_or_load(
+        doc_key("routines", user.uid, routine_id), load, settings.CACHE_TTL_SECONDS
+    )
+    if stored is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Routine not found",
         )
+    data = _routine_data(stored, routine_id, user.uid)
 
-    data = doc.to_dict()
-    data["id"] = doc.id
-    data["user_id"] = user.uid
-    return Routine(**data)
+    _hydrate_provisions(fs, user.uid, [data], exercise_details)
+    return build_model(Routine, data)
 
 
 @router.patch("/{routine_id}", response_model=Routine)
@@ -120,7 +237,7 @@ async def update_routine(
     """Update an existing routine."""
     fs = get_firestore_service()
     doc_ref = fs.get_user_collection(user.uid, "routines").document(routine_id)
-    doc = doc_ref.get()
+    doc = fs.read(doc_ref.get)
 
     if not doc.exists:
         raise HTTPException(
@@ -135,31 +252,23 @@ async def update_routine(
             detail="No fields to update",
         )
 
-    # Process provisions if provided
+    # Process provisions if provided, keeping the IDs of existing items
     if "provisions" in update_data:
-        provisions = []
-        for i, provision in enumerate(update_data["provisions"]):
-            if not provision.get("id"):
-                provision["id"] = str(uuid.uuid4())
-            provision["order"] = i
-
-            if provision.get("type") == "superset" and provision.get("items"):
-                provision["items"] = [
-                    {**item, "id": item.get("id", str(uuid.uuid4())), "order": j}
-                    for j, item in enumerate(provision["items"])
-                ]
-
-            provisions.append(provision)
-        update_data["provisions"] = provisions
+        provisions = _assign_ids(routine_update.provisions, keep_ids=True)
+        update_data["provisions"] = encode_provisions(provisions)
+        update_data["provisions_format"] = PROVISIONS_FORMAT
 
     update_data["updated_at"] = datetime.now(timezone.utc)
-    doc_ref.update(update_data)
+    fs.write(doc_ref.update, update_data)
+    single_flight.invalidate(user.uid)
 
-    updated_doc = doc_ref.get()
-    data = updated_doc.to_dict()
-    data["id"] = updated_doc.id
-    data["user_id"] = user.uid
-    return Routine(**data)
+    stored = fs.read(doc_ref.get).to_dict()
+    get_cache().put(
+        doc_key("routines", user.uid, routine_id), stored, settings.CACHE_TTL_SECONDS
+    )
+    data = _routine_data(stored, routine_id, user.uid)
+    _hydrate_provisions(fs, user.uid, [data])
+    return build_model(Routine, data)
 
 
 @router.delete("/{routine_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -170,12 +279,14 @@ async def delete_routine(
     """Delete a routine."""
     fs = get_firestore_service()
     doc_ref = fs.get_user_collection(user.uid, "routines").document(routine_id)
-    doc = doc_ref.get()
 
-    if not doc.exists:
+    # The exists precondition replaces a separate read before the delete.
+    try:
+        fs.write(doc_ref.delete, option=fs.db.write_option(exists=True))
+    except NotFound:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Routine not found",
         )
-
-    doc_ref.delete()
+    get_cache().invalidate(doc_key("routines", user.uid, routine_id))
+    single_flight.invalidate(user.uid)
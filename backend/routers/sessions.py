@@ -1,8 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import (
+    APIRouter,
+    Depends,
+    Header,
+    HTTPException,
+    Query,
+    Response,
+    status,
+)
+from fastapi.responses import StreamingResponse
 from datetime import datetime, timezone, date
-from typing import Optional
+from typing import Optional, Union
+import asyncio
 import uuid
 
+from firebase_admin import firestore
+
 from ..models.session import (
     WorkoutSession,
     WorkoutSessionCreate,
@@ -11,22 +23,170 @@ from ..models.session import (
     PerformedSet,
     AddExerciseToSession,
     AddSetToExercise,
+    PerformedExerciseDelta,
+    PerformedSetDelta,
+    SessionEvent,
+    SessionEventType,
+    TrainingCalendar,
 )
+from ..models.routine import RoutineItemType, RoutineProvision, decode_provisions
 from ..auth import get_current_user, AuthenticatedUser
-from ..services.firestore import get_firestore_service
+from ..config import settings
+from ..services.archive import get_session_archive
+from ..services.calendar import get_training_calendar
+from ..services.firestore import (
+    EXERCISE_DETAIL_FIELDS,
+    FirestoreService,
+    get_firestore_service,
+)
+from ..services.idempotency import IdempotentRoute
+from ..services.job_queue import job_queue
+from ..services.last_performance import (
+    get_last_performance_index,
+    previous_performance,
+)
+from ..services.live import live_sessions
+from ..services.maintenance import CALENDAR_CHANGED, SESSION_FINISHED
+from ..services.rate_limit import rate_limit
+from ..services.session_store import (
+    PerformedExerciseNotFound,
+    PerformedExerciseTooLarge,
+    SessionNotFound,
+    get_session_store,
+)
+from ..services.singleflight import single_flight
+from ..services.tracing import build_model, build_models
+
+router = APIRouter(
+    prefix="/sessions",
+    tags=["sessions"],
+    dependencies=[Depends(rate_limit, scope="function")],
+    route_class=IdempotentRoute,
+)
 
-router = APIRouter(prefix="/sessions", tags=["sessions"])
+
+def _hydrate_sessions(
+    fs: FirestoreService,
+    user_id: str,
+    sessions: list[dict],
+    details: bool = False,
+):
+    """Refresh exercise names on the performed exercises of ``sessions``.
+
+    Names stored on a session go stale when an exercise is renamed; this
+    replaces them with current ones using one batched read for all sessions.
+    Deleted exercises keep the name stored at the time. With ``details`` the
+    exercise's muscle group and category are added as well.
+    """
+    performed = [
+        exercise
+        for session in sessions
+        for exercise in session.get("performed_exercises", [])
+    ]
+    exercises = fs.get_exercises_by_id(
+        user_id,
+        (exercise["exercise_id"] for exercise in performed),
+        EXERCISE_DETAIL_FIELDS if details else ("name",),
+    )
+    for performed_exercise in performed:
+        exercise = exercises.get(performed_exercise["exercise_id"])
+        if exercise is None:
+            continue
+        performed_exercise["exercise_name"] = exercise.get("name")
+        if details:
+            performed_exercise["muscle_group"] = exercise.get("muscle_group")
+            performed_exercise["category"] = exercise.get("category")
+
+
+def _expand_provisions(
+    fs: FirestoreService, user_id: str, provisions: list[RoutineProvision]
+) -> list[dict]:
+    """Build performed exercises for every item of a routine.
+
+    Superset items are flattened in order and tagged with their superset's
+    ID. Exercise names are resolved with a single batched read.
+    """
+    items = []
+    for provision in provisions:
+        if provision.type == RoutineItemType.SUPERSET:
+            items.extend((item, provision.id) for item in provision.items)
+        else:
+            items.append((provision, None))
+
+    exercises = fs.get_exercises_by_id(
+        user_id, (item.exercise_id for item, _ in items)
+    )
+
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "exercise_id": item.exercise_id,
+            "exercise_name": exercises.get(item.exercise_id, {}).get("name"),
+            "routine_item_id": item.id,
+            "is_adhoc": False,
+            "sets": [],
+            "order": order,
+            "notes": item.notes,
+            "superset_id": superset_id,
+            "target_sets": item.target_sets,
+            "target_reps": item.target_reps,
+            "target_weight": item.target_weight,
+            "target_rpe": item.target_rpe,
+            "rest_seconds": item.rest_seconds,
+        }
+        for order, (item, superset_id) in enumerate(items)
+    ]
+
+
+def _update_session_doc(fs: FirestoreService, doc_ref, changes: dict) -> dict:
+    """Apply ``changes`` and bump the session's version in one transaction.
+
+    Returns the fields written, including the new version. Two updates
+    racing each other get different versions.
+    """
+
+    @firestore.transactional
+    def update_in_transaction(transaction) -> dict:
+        doc = doc_ref.get(transaction=transaction)
+        if not doc.exists:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Session not found",
+            )
+        update = {**changes, "version": doc.to_dict().get("version", 0) + 1}
+        transaction.update(doc_ref, update)
+        return update
+
+    return fs.transact(update_in_transaction)
+
+
+def _wants_delta(delta: bool, prefer: Optional[str], response: Response) -> bool:
+    """Whether the client opted into a compact delta response.
+
+    Clients opt in with ``?delta=true`` or ``Prefer: return=minimal``.
+    """
+    if prefer and "return=minimal" in prefer.replace(" ", "").lower():
+        response.headers["Preference-Applied"] = "return=minimal"
+        return True
+    return delta
 
 
 @router.get("", response_model=list[WorkoutSession])
 async def list_sessions(
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
-    limit: int = 50,
+    limit: int = Query(50, ge=1, le=settings.MAX_LIST_LIMIT),
+    exercise_details: bool = False,
     user: AuthenticatedUser = Depends(get_current_user),
 ):
-    """List workout sessions for the authenticated user."""
+    """List workout sessions for the authenticated user.
+
+    When recent sessions do not fill ``limit``, older ones are read from the
+    session archive.
+    """
     fs = get_firestore_service()
+    store = get_session_store()
+    archive = get_session_archive()
     collection = fs.get_user_collection(user.uid, "sessions")
 
     query = collection.order_by("date", direction="DESCENDING")
@@ -37,16 +197,32 @@ async def list_sessions(
         query = query.where("date", "<=", end_date)
 
     query = query.limit(limit)
-    docs = query.stream()
 
-    sessions = []
-    for doc in docs:
-        data = doc.to_dict()
-        data["id"] = doc.id
-        data["user_id"] = user.uid
-        sessions.append(WorkoutSession(**data))
-
-    return sessions
+    def load():
+        sessions = []
+        for doc in fs.query(query):
+            data = store.assemble(doc)
+            data["user_id"] = user.uid
+            sessions.append(data)
+
+        if len(sessions) < limit:
+            hot_ids = {data["id"] for data in sessions}
+            for data in archive.list_sessions(
+                user.uid, start_date, end_date, limit - len(sessions)
+            ):
+                if data["id"] not in hot_ids:
+                    data["user_id"] = user.uid
+                    sessions.append(data)
+            sessions.sort(key=lambda data: str(data["date"]), reverse=True)
+
+        _hydrate_sessions(fs, user.uid, sessions, exercise_details)
+        return build_models(WorkoutSession, sessions)
+
+    return await single_flight.do(
+        user.uid,
+        ("sessions", start_date, end_date, limit, exercise_details),
+        load,
+    )
 
 
 @router.post("", response_model=WorkoutSession, status_code=status.HTTP_201_CREATED)
@@ -54,99 +230,242 @@ async def create_session(
     session: WorkoutSessionCreate,
     user: AuthenticatedUser = Depends(get_current_user),
 ):
-    """Start a new workout session."""
+    """Start a new workout session.
+
+    With ``expand_routine`` the routine's whole plan is written into the new
+    session, so the client does not have to add each exercise separately.
+    """
     fs = get_firestore_service()
     collection = fs.get_user_collection(user.uid, "sessions")
 
+    routine_name = session.routine_name
+    performed_exercises = []
+    if session.expand_routine:
+        if not session.routine_id:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="routine_id is required to expand a routine",
+            )
+        routine_doc = fs.read(
+            fs.get_user_collection(user.uid, "routines")
+            .document(session.routine_id)
+            .get
+        )
+        if not routine_doc.exists:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Routine not found",
+            )
+        routine = routine_doc.to_dict()
+        routine_name = routine_name or routine.get("name")
+        provisions = decode_provisions(
+            routine.get("provisions", []), routine.get("provisions_format")
+        )
+        performed_exercises = _expand_provisions(fs, user.uid, provisions)
+
     now = datetime.now(timezone.utc)
     session_id = str(uuid.uuid4())
 
     data = {
         "routine_id": session.routine_id,
-        "routine_name": session.routine_name,
+        "routine_name": routine_name,
         "date": session.date,
         "notes": session.notes,
         "start_time": now,
         "end_time": None,
-        "performed_exercises": [],
+        "performed_exercises": performed_exercises,
+        "version": 0,
         "created_at": now,
         "updated_at": now,
     }
 
-    collection.document(session_id).set(data)
+    fs.write(collection.document(session_id).set, data)
+    single_flight.invalidate(user.uid)
+    job_queue.enqueue(
+        user.uid, CALENDAR_CHANGED, {"session_id": session_id}, key=session_id
+    )
 
+    if performed_exercises:
+        # What was done last time goes in the response only.
+        entries = get_last_performance_index().get_many(
+            user.uid, (exercise["exercise_id"] for exercise in performed_exercises)
+        )
+        data["performed_exercises"] = [
+            {
+                **exercise,
+                "previous": previous_performance(
+                    entries.get(exercise["exercise_id"]), exercise["routine_item_id"]
+                ),
+            }
+            for exercise in performed_exercises
+        ]
     return WorkoutSession(id=session_id, user_id=user.uid, **data)
 
 
 @router.get("/active", response_model=Optional[WorkoutSession])
 async def get_active_session(
+    exercise_details: bool = False,
     user: AuthenticatedUser = Depends(get_current_user),
 ):
     """Get the current active (unfinished) session if one exists."""
     fs = get_firestore_service()
+    store = get_session_store()
     collection = fs.get_user_collection(user.uid, "sessions")
 
     # Find sessions with no end_time
     query = collection.where("end_time", "==", None).limit(1)
-    docs = list(query.stream())
 
-    if not docs:
-        return None
+    def load():
+        docs = fs.query(query)
+        if not docs:
+            return None
 
-    doc = docs[0]
-    data = doc.to_dict()
-    data["id"] = doc.id
-    data["user_id"] = user.uid
-    return WorkoutSession(**data)
+        data = store.assemble(docs[0])
+        data["user_id"] = user.uid
+        _hydrate_sessions(fs, user.uid, [data], exercise_details)
+        return build_model(WorkoutSession, data)
+
+    return await single_flight.do(
+        user.uid, ("active_session", exercise_details), load
+    )
+
+
+@router.get("/calendar", response_model=TrainingCalendar)
+async def get_training_calendar_year(
+    year: Optional[int] = Query(None, ge=1900, le=9999),
+    user: AuthenticatedUser = Depends(get_current_user),
+):
+    """Training days of a year (default this year), with streaks."""
+    year = year or date.today().year
+    return build_model(TrainingCalendar, get_training_calendar().year(user.uid, year))
 
 
 @router.get("/{session_id}", response_model=WorkoutSession)
 async def get_session(
     session_id: str,
+    exercise_details: bool = False,
     user: AuthenticatedUser = Depends(get_current_user),
 ):
-    """Get a specific session by ID."""
+    """Get a specific session by ID, including archived sessions."""
     fs = get_firestore_service()
-    doc = fs.get_user_collection(user.uid, "sessions").document(session_id).get()
+    data = get_session_store().get(user.uid, session_id)
+    if data is None:
+        data = get_session_archive().get_session(user.uid, session_id)
 
-    if not doc.exists:
+    if data is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Session not found",
         )
 
-    data = doc.to_dict()
-    data["id"] = doc.id
     data["user_id"] = user.uid
-    return WorkoutSession(**data)
+    _hydrate_sessions(fs, user.uid, [data], exercise_details)
+    return build_model(WorkoutSession, data)
 
 
-@router.patch("/{session_id}", response_model=WorkoutSession)
-async def update_session(
+def _sse(event: SessionEvent) -> str:
+    return f"event: {event.type.value}\ndata: {event.model_dump_json()}\n\n"
+
+
+@router.get("/{session_id}/live")
+async def stream_session(
     session_id: str,
-    session_update: WorkoutSessionUpdate,
     user: AuthenticatedUser = Depends(get_current_user),
 ):
-    """Update a session (notes, end time)."""
-    fs = get_firestore_service()
-    doc_ref = fs.get_user_collection(user.uid, "sessions").document(session_id)
-    doc = doc_ref.get()
+    """Stream session changes as server-sent events.
 
-    if not doc.exists:
+    The first event is a snapshot of the whole session; after that only
+    deltas are sent. A ``resync`` event means the subscriber fell behind and
+    should re-fetch the session.
+    """
+    data = get_session_store().get(user.uid, session_id)
+
+    if data is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Session not found",
         )
 
-    update_data = session_update.model_dump(exclude_unset=True)
-    update_data["updated_at"] = datetime.now(timezone.utc)
-    doc_ref.update(update_data)
+    data["user_id"] = user.uid
+    session = build_model(WorkoutSession, data)
+
+    # Subscribe before returning so no write between the read and the first
+    # iteration of the stream is missed.
+    queue = live_sessions.subscribe(user.uid, session_id)
+
+    async def events():
+        try:
+            yield _sse(
+                SessionEvent(
+                    type=SessionEventType.SNAPSHOT,
+                    session_id=session_id,
+                    updated_at=session.updated_at,
+                    data=session.model_dump(mode="json"),
+                )
+            )
+            while True:
+                try:
+                    event = await asyncio.wait_for(
+                        queue.get(), timeout=settings.LIVE_KEEPALIVE_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield _sse(event)
+                if event.type == SessionEventType.SESSION_DELETED:
+                    break
+        finally:
+            live_sessions.unsubscribe(user.uid, session_id, queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.patch("/{session_id}", response_model=WorkoutSession)
+async def update_session(
+    session_id: str,
+    session_update: WorkoutSessionUpdate,
+    user: AuthenticatedUser = Depends(get_current_user),
+):
+    """Update a session (notes, end time)."""
+    fs = get_firestore_service()
+    store = get_session_store()
+    store.flush(user.uid, session_id)
+    update_data = await asyncio.to_thread(
+        _update_session_doc,
+        fs,
+        store.ref(user.uid, session_id),
+        {
+            **session_update.model_dump(exclude_unset=True),
+            "updated_at": datetime.now(timezone.utc),
+        },
+    )
+    single_flight.invalidate(user.uid)
+    live_sessions.publish(
+        user.uid,
+        SessionEvent(
+            type=SessionEventType.SESSION_UPDATED,
+            session_id=session_id,
+            version=update_data["version"],
+            updated_at=update_data["updated_at"],
+            data=update_data,
+        ),
+    )
+    if update_data.get("end_time"):
+        job_queue.enqueue(
+            user.uid, SESSION_FINISHED, {"session_id": session_id}, key=session_id
+        )
+    if "end_time" in update_data:
+        job_queue.enqueue(
+            user.uid, CALENDAR_CHANGED, {"session_id": session_id}, key=session_id
+        )
 
-    updated_doc = doc_ref.get()
-    data = updated_doc.to_dict()
-    data["id"] = updated_doc.id
+    data = store.get(user.uid, session_id)
     data["user_id"] = user.uid
-    return WorkoutSession(**data)
+    return build_model(WorkoutSession, data)
 
 
 @router.post("/{session_id}/finish", response_model=WorkoutSession)
@@ -156,56 +475,79 @@ async def finish_session(
 ):
     """Mark a session as finished."""
     fs = get_firestore_service()
-    doc_ref = fs.get_user_collection(user.uid, "sessions").document(session_id)
-    doc = doc_ref.get()
-
-    if not doc.exists:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Session not found",
-        )
-
+    store = get_session_store()
+    store.flush(user.uid, session_id)
     now = datetime.now(timezone.utc)
-    doc_ref.update({"end_time": now, "updated_at": now})
+    updated = await asyncio.to_thread(
+        _update_session_doc,
+        fs,
+        store.ref(user.uid, session_id),
+        {"end_time": now, "updated_at": now},
+    )
+    version = updated["version"]
+    single_flight.invalidate(user.uid)
+    live_sessions.publish(
+        user.uid,
+        SessionEvent(
+            type=SessionEventType.SESSION_FINISHED,
+            session_id=session_id,
+            version=version,
+            updated_at=now,
+            data={"end_time": now},
+        ),
+    )
+    job_queue.enqueue(
+        user.uid, SESSION_FINISHED, {"session_id": session_id}, key=session_id
+    )
+    job_queue.enqueue(
+        user.uid, CALENDAR_CHANGED, {"session_id": session_id}, key=session_id
+    )
 
-    updated_doc = doc_ref.get()
-    data = updated_doc.to_dict()
-    data["id"] = updated_doc.id
+    data = store.get(user.uid, session_id)
     data["user_id"] = user.uid
-    return WorkoutSession(**data)
+    return build_model(WorkoutSession, data)
 
 
-@router.post("/{session_id}/exercises", response_model=WorkoutSession)
+@router.post(
+    "/{session_id}/exercises",
+    response_model=Union[WorkoutSession, PerformedExerciseDelta],
+)
 async def add_exercise_to_session(
     session_id: str,
     exercise_data: AddExerciseToSession,
+    response: Response,
+    delta: bool = False,
+    prefer: Optional[str] = Header(None),
     user: AuthenticatedUser = Depends(get_current_user),
 ):
-    """Add an exercise to a session."""
-    fs = get_firestore_service()
-    doc_ref = fs.get_user_collection(user.uid, "sessions").document(session_id)
-    doc = doc_ref.get()
-
-    if not doc.exists:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Session not found",
-        )
+    """Add an exercise to a session.
 
-    session_data = doc.to_dict()
+    Returns the full session, or only the new performed exercise when a
+    delta response is requested.
+    """
+    fs = get_firestore_service()
+    store = get_session_store()
+    index = get_last_performance_index()
 
-    # Get exercise name
-    exercise_doc = (
-        fs.get_user_collection(user.uid, "exercises")
-        .document(exercise_data.exercise_id)
-        .get()
+    # The exercise's name and what was done last time, in one batched read
+    exercise_ref = fs.get_user_collection(user.uid, "exercises").document(
+        exercise_data.exercise_id
     )
+    index_ref = index.ref(user.uid, exercise_data.exercise_id)
+    docs = {
+        doc.reference.path: doc
+        for doc in fs.read(fs.db.get_all, [exercise_ref, index_ref])
+    }
+    exercise_doc, index_doc = docs[exercise_ref.path], docs[index_ref.path]
     exercise_name = None
     if exercise_doc.exists:
         exercise_name = exercise_doc.to_dict().get("name")
+    previous = previous_performance(
+        index_doc.to_dict() if index_doc.exists else None,
+        exercise_data.routine_item_id,
+    )
 
-    # Create new performed exercise
-    performed_exercises = session_data.get("performed_exercises", [])
+    # Create new performed exercise; the store assigns its order
     new_exercise = {
         "id": str(uuid.uuid4()),
         "exercise_id": exercise_data.exercise_id,
@@ -213,78 +555,121 @@ async def add_exercise_to_session(
         "routine_item_id": exercise_data.routine_item_id,
         "is_adhoc": exercise_data.is_adhoc,
         "sets": [],
-        "order": len(performed_exercises),
         "notes": None,
     }
 
-    performed_exercises.append(new_exercise)
+    try:
+        written = store.add_exercise(user.uid, session_id, new_exercise)
+    except SessionNotFound:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Session not found",
+        )
+    now, version = written["updated_at"], written["version"]
+    single_flight.invalidate(user.uid)
+    live_sessions.publish(
+        user.uid,
+        SessionEvent(
+            type=SessionEventType.EXERCISE_ADDED,
+            session_id=session_id,
+            version=version,
+            updated_at=now,
+            data=new_exercise,
+        ),
+    )
 
-    now = datetime.now(timezone.utc)
-    doc_ref.update({"performed_exercises": performed_exercises, "updated_at": now})
+    if _wants_delta(delta, prefer, response):
+        return PerformedExerciseDelta(
+            session_id=session_id,
+            version=version,
+            updated_at=now,
+            performed_exercise=build_model(
+                PerformedExercise, {**new_exercise, "previous": previous}
+            ),
+        )
 
-    updated_doc = doc_ref.get()
-    data = updated_doc.to_dict()
-    data["id"] = updated_doc.id
+    data = store.get(user.uid, session_id)
+    for performed_exercise in data["performed_exercises"]:
+        if performed_exercise["id"] == new_exercise["id"]:
+            performed_exercise["previous"] = previous
     data["user_id"] = user.uid
-    return WorkoutSession(**data)
+    return build_model(WorkoutSession, data)
 
 
 @router.post(
     "/{session_id}/exercises/{performed_exercise_id}/sets",
-    response_model=WorkoutSession,
+    response_model=Union[WorkoutSession, PerformedSetDelta],
 )
 async def add_set_to_exercise(
     session_id: str,
     performed_exercise_id: str,
     set_data: AddSetToExercise,
+    response: Response,
+    delta: bool = False,
+    prefer: Optional[str] = Header(None),
     user: AuthenticatedUser = Depends(get_current_user),
 ):
-    """Add a set to a performed exercise."""
-    fs = get_firestore_service()
-    doc_ref = fs.get_user_collection(user.uid, "sessions").document(session_id)
-    doc = doc_ref.get()
-
-    if not doc.exists:
+    """Add a set to a performed exercise.
+
+    Returns the full session, or only the new set when a delta response is
+    requested.
+    """
+    store = get_session_store()
+
+    def build_set(set_number: int) -> dict:
+        return {
+            "set_number": set_number,
+            "reps": set_data.reps,
+            "weight": set_data.weight,
+            "rpe": set_data.rpe,
+            "completed": True,
+            "notes": set_data.notes,
+        }
+
+    try:
+        new_set, written = store.add_set(
+            user.uid, session_id, performed_exercise_id, build_set
+        )
+    except SessionNotFound:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Session not found",
         )
-
-    session_data = doc.to_dict()
-    performed_exercises = session_data.get("performed_exercises", [])
-
-    # Find the exercise
-    exercise_found = False
-    for exercise in performed_exercises:
-        if exercise.get("id") == performed_exercise_id:
-            exercise_found = True
-            sets = exercise.get("sets", [])
-            new_set = {
-                "set_number": len(sets) + 1,
-                "reps": set_data.reps,
-                "weight": set_data.weight,
-                "rpe": set_data.rpe,
-                "completed": True,
-                "notes": set_data.notes,
-            }
-            sets.append(new_set)
-            exercise["sets"] = sets
-            break
-
-    if not exercise_found:
+    except PerformedExerciseNotFound:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Performed exercise not found in session",
         )
+    except PerformedExerciseTooLarge:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
+            detail="Performed exercise has too many sets; add another one",
+        )
+    now, version = written["updated_at"], written["version"]
+    single_flight.invalidate(user.uid)
+    live_sessions.publish(
+        user.uid,
+        SessionEvent(
+            type=SessionEventType.SET_ADDED,
+            session_id=session_id,
+            version=version,
+            updated_at=now,
+            data={"performed_exercise_id": performed_exercise_id, "set": new_set},
+        ),
+    )
 
-    now = datetime.now(timezone.utc)
-    doc_ref.update({"performed_exercises": performed_exercises, "updated_at": now})
+    if _wants_delta(delta, prefer, response):
+        return PerformedSetDelta(
+            session_id=session_id,
+            version=version,
+            updated_at=now,
+            performed_exercise_id=performed_exercise_id,
+            performed_set=build_model(PerformedSet, new_set),
+        )
 
-    updated_doc = doc_ref.get()
-    data = updated_doc.to_dict()
-    data["id"] = updated_doc.id
+    data = store.get(user.uid, session_id)
     data["user_id"] = user.uid
-    return WorkoutSession(**data)
+    return build_model(WorkoutSession, data)
 
 
 @router.delete("/{session_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -292,15 +677,23 @@ async def delete_session(
     session_id: str,
     user: AuthenticatedUser = Depends(get_current_user),
 ):
-    """Delete a session."""
-    fs = get_firestore_service()
-    doc_ref = fs.get_user_collection(user.uid, "sessions").document(session_id)
-    doc = doc_ref.get()
-
-    if not doc.exists:
+    """Delete a session, including archived sessions."""
+    deleted = get_session_store().delete(user.uid, session_id)
+    if not deleted:
+        deleted = await asyncio.to_thread(
+            get_session_archive().delete_session, user.uid, session_id
+        )
+    if not deleted:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Session not found",
         )
 
-    doc_ref.delete()
+    single_flight.invalidate(user.uid)
+    live_sessions.publish(
+        user.uid,
+        SessionEvent(type=SessionEventType.SESSION_DELETED, session_id=session_id),
+    )
+    job_queue.enqueue(
+        user.uid, CALENDAR_CHANGED, {"session_id": session_id}, key=session_id
+    )
@@ -1,3 +1,23 @@
+from .archive import SessionArchive, get_session_archive
 from .firestore import FirestoreService, get_firestore_service
+from .job_queue import JobQueue, job_queue
+from .live import SessionHub, live_sessions
+from .metrics import metrics
+from .session_store import SessionStore, get_session_store
+from .singleflight import SingleFlight, single_flight
 
-__all__ = ["FirestoreService", "get_firestore_service"]
+__all__ = [
+    "SessionArchive",
+    "get_session_archive",
+    "FirestoreService",
+    "get_firestore_service",
+    "JobQueue",
+    "job_queue",
+    "SessionHub",
+    "live_sessions",
+    "metrics",
+    "SessionStore",
+    "get_session_store",
+    "SingleFlight",
+    "single_flight",
+]
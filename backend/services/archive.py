@@ -0,0 +1,370 @@
+import gzip
+import json
+import os
+import shutil
+import threading
+import zlib
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Callable, Iterable, Optional, TypeVar
+
+from firebase_admin import firestore
+
+from ..config import settings
+from .firestore import FirestoreService, get_firestore_service
+from .metrics import metrics
+from .profiles import profiles
+from .session_store import SHARDS, SessionStore
+
+# Firestore allows at most 500 operations per batched write.
+BATCH_SIZE = 500
+
+T = TypeVar("T")
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Cannot archive value of type {type(value).__name__}")
+
+
+def pack_sessions(sessions: list[dict]) -> bytes:
+    """Serialize and compress one month of sessions."""
+    raw = json.dumps(sessions, default=_json_default, separators=(",", ":"))
+    return zlib.compress(raw.encode(), settings.ARCHIVE_COMPRESSION_LEVEL)
+
+
+def unpack_sessions(blob: bytes) -> list[dict]:
+    return json.loads(zlib.decompress(blob))
+
+
+def month_key(value) -> str:
+    """Archive bucket (``YYYY-MM``) for a session date."""
+    if isinstance(value, str):
+        return value[:7]
+    return f"{value.year:04d}-{value.month:02d}"
+
+
+class ArchiveStore:
+    """Where archived sessions live.
+
+    Each user has one packed archive per month plus a small index mapping
+    session IDs to months and recording the archive cutoff date.
+    """
+
+    def get_index(self, user_id: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    def put_index(self, user_id: str, index: dict):
+        raise NotImplementedError
+
+    def get_month(self, user_id: str, month: str) -> list[dict]:
+        raise NotImplementedError
+
+    def put_month(self, user_id: str, month: str, sessions: list[dict]):
+        raise NotImplementedError
+
+    def delete_user(self, user_id: str):
+        raise NotImplementedError
+
+    def transaction(self, user_id: str, fn: Callable[["ArchiveStore"], T]) -> T:
+        """Run ``fn`` on a view of a user's archive whose writes apply together.
+
+        ``fn`` may be run more than once, and must do all its reads before
+        its first write.
+        """
+        raise NotImplementedError
+
+
+class FirestoreArchiveStore(ArchiveStore):
+    """Archives as compressed blobs in ``users/{uid}/session_archives``."""
+
+    INDEX_ID = "index"
+
+    def __init__(self, fs: FirestoreService):
+        self._fs = fs
+
+    def _collection(self, user_id: str):
+        return self._fs.get_user_collection(user_id, "session_archives")
+
+    def _index_ref(self, user_id: str):
+        return self._collection(user_id).document(self.INDEX_ID)
+
+    def get_index(self, user_id: str) -> Optional[dict]:
+        doc = self._fs.read(self._index_ref(user_id).get)
+        return doc.to_dict() if doc.exists else None
+
+    def put_index(self, user_id: str, index: dict):
+        self._fs.write(self._index_ref(user_id).set, index)
+
+    def get_month(self, user_id: str, month: str) -> list[dict]:
+        doc = self._fs.read(self._collection(user_id).document(month).get)
+        return unpack_sessions(doc.get("data")) if doc.exists else []
+
+    def put_month(self, user_id: str, month: str, sessions: list[dict]):
+        ref = self._collection(user_id).document(month)
+        if sessions:
+            data = {"data": pack_sessions(sessions), "count": len(sessions)}
+            self._fs.write(ref.set, data)
+        else:
+            self._fs.write(ref.delete)
+
+    def delete_user(self, user_id: str):
+        # Archive documents are removed with the user's other subcollections.
+        pass
+
+    def transaction(self, user_id: str, fn: Callable[[ArchiveStore], T]) -> T:
+        @firestore.transactional
+        def run_in_transaction(transaction):
+            return fn(_FirestoreArchiveTransaction(self, transaction))
+
+        return self._fs.transact(run_in_transaction)
+
+
+class _FirestoreArchiveTransaction(ArchiveStore):
+    """A Firestore archive store whose reads and writes go through a transaction."""
+
+    def __init__(self, store: FirestoreArchiveStore, transaction):
+        self._store = store
+        self._transaction = transaction
+
+    def get_index(self, user_id: str) -> Optional[dict]:
+        doc = self._store._index_ref(user_id).get(transaction=self._transaction)
+        return doc.to_dict() if doc.exists else None
+
+    def put_index(self, user_id: str, index: dict):
+        self._transaction.set(self._store._index_ref(user_id), index)
+
+    def get_month(self, user_id: str, month: str) -> list[dict]:
+        ref = self._store._collection(user_id).document(month)
+        doc = ref.get(transaction=self._transaction)
+        return unpack_sessions(doc.get("data")) if doc.exists else []
+
+    def put_month(self, user_id: str, month: str, sessions: list[dict]):
+        ref = self._store._collection(user_id).document(month)
+        if sessions:
+            data = {"data": pack_sessions(sessions), "count": len(sessions)}
+            self._transaction.set(ref, data)
+        else:
+            self._transaction.delete(ref)
+
+
+class FileArchiveStore(ArchiveStore):
+    """Archives as gzipped JSON files under a local directory, for development."""
+
+    def __init__(self, root: str):
+        self._root = Path(root)
+        self._lock = threading.Lock()
+
+    def _path(self, user_id: str, name: str) -> Path:
+        return self._root / user_id / name
+
+    def get_index(self, user_id: str) -> Optional[dict]:
+        path = self._path(user_id, "index.json")
+        if not path.exists():
+            return None
+        return json.loads(path.read_text())
+
+    def put_index(self, user_id: str, index: dict):
+        path = self._path(user_id, "index.json")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(index, default=_json_default))
+
+    def get_month(self, user_id: str, month: str) -> list[dict]:
+        path = self._path(user_id, f"{month}.json.gz")
+        if not path.exists():
+            return []
+        return json.loads(gzip.decompress(path.read_bytes()))
+
+    def put_month(self, user_id: str, month: str, sessions: list[dict]):
+        path = self._path(user_id, f"{month}.json.gz")
+        if not sessions:
+            path.unlink(missing_ok=True)
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        raw = json.dumps(sessions, default=_json_default, separators=(",", ":"))
+        tmp = path.with_suffix(".tmp")
+        tmp.write_bytes(gzip.compress(raw.encode(), settings.ARCHIVE_COMPRESSION_LEVEL))
+        os.replace(tmp, path)
+
+    def delete_user(self, user_id: str):
+        shutil.rmtree(self._root / user_id, ignore_errors=True)
+
+    def transaction(self, user_id: str, fn: Callable[[ArchiveStore], T]) -> T:
+        # Development only: one process, so a lock is enough.
+        with self._lock:
+            return fn(self)
+
+
+class SessionArchive:
+    """Cold tier for finished sessions older than the archive age.
+
+    Reads consult the index first, and only when the hot tier cannot answer.
+    Archiving sets ``has_archive`` on the user document, so when the user's
+    profile is cached and lacks the flag the index is not read at all. With
+    the local cache backend an archive job in another process cannot drop
+    the API's cached profiles, so a user's first archived sessions may be
+    missing from reads for up to the cache TTL.
+    """
+
+    def __init__(self, store: ArchiveStore):
+        self._store = store
+
+    def _never_archived(self, user_id: str) -> bool:
+        profile = profiles.cached(user_id)
+        return profile is not None and not profile.get("has_archive")
+
+    def get_session(self, user_id: str, session_id: str) -> Optional[dict]:
+        if self._never_archived(user_id):
+            return None
+        index = self._store.get_index(user_id)
+        month = (index or {}).get("sessions", {}).get(session_id)
+        if month is None:
+            return None
+        metrics.incr("archive.reads")
+        for session in self._store.get_month(user_id, month):
+            if session["id"] == session_id:
+                return session
+        return None
+
+    def list_sessions(
+        self,
+        user_id: str,
+        start_date: Optional[date],
+        end_date: Optional[date],
+        limit: int,
+    ) -> list[dict]:
+        """Archived sessions in a date range, newest first."""
+        if limit <= 0 or self._never_archived(user_id):
+            return []
+        index = self._store.get_index(user_id)
+        if not index:
+            return []
+
+        start = month_key(start_date) if start_date else ""
+        end = month_key(end_date) if end_date else "9999-99"
+        sessions: list[dict] = []
+        for month in sorted(index.get("months", {}), reverse=True):
+            if not start <= month <= end:
+                continue
+            metrics.incr("archive.reads")
+            for session in self._store.get_month(user_id, month):
+                session_date = date.fromisoformat(session["date"][:10])
+                if start_date and session_date < start_date:
+                    continue
+                if end_date and session_date > end_date:
+                    continue
+                sessions.append(session)
+            if len(sessions) >= limit:
+                break
+
+        sessions.sort(key=lambda s: s["date"], reverse=True)
+        return sessions[:limit]
+
+    def delete_session(self, user_id: str, session_id: str) -> bool:
+        def delete_in_transaction(store: ArchiveStore) -> bool:
+            index = store.get_index(user_id)
+            month = (index or {}).get("sessions", {}).pop(session_id, None)
+            if month is None:
+                return False
+            remaining = [
+                s for s in store.get_month(user_id, month) if s["id"] != session_id
+            ]
+            store.put_month(user_id, month, remaining)
+            if remaining:
+                index["months"][month] = len(remaining)
+            else:
+                index["months"].pop(month, None)
+            store.put_index(user_id, index)
+            return True
+
+        return self._store.transaction(user_id, delete_in_transaction)
+
+    def delete_user(self, user_id: str):
+        self._store.delete_user(user_id)
+
+    def add_sessions(self, user_id: str, sessions: Iterable[dict], cutoff: date):
+        """Merge sessions into their monthly archives and update the index.
+
+        Runs before the hot copies are deleted, so a failure part-way leaves
+        sessions duplicated rather than lost; reads prefer the hot copy. The
+        months and the index are written together, so a concurrent delete
+        cannot be undone by a stale index.
+        """
+        by_month: dict[str, list[dict]] = {}
+        for session in sessions:
+            by_month.setdefault(month_key(session["date"]), []).append(session)
+
+        def add_in_transaction(store: ArchiveStore):
+            index = store.get_index(user_id) or {"months": {}, "sessions": {}}
+            stored = {month: store.get_month(user_id, month) for month in by_month}
+
+            for month, new in by_month.items():
+                new_ids = {s["id"] for s in new}
+                kept = [s for s in stored[month] if s["id"] not in new_ids]
+                merged = sorted(kept + new, key=lambda s: str(s["date"]))
+                store.put_month(user_id, month, merged)
+                index["months"][month] = len(merged)
+                index["sessions"].update({s["id"]: month for s in new})
+
+            index["cutoff"] = cutoff.isoformat()
+            store.put_index(user_id, index)
+
+        self._store.transaction(user_id, add_in_transaction)
+
+
+def archive_user_sessions(
+    fs: FirestoreService,
+    store: SessionStore,
+    archive: SessionArchive,
+    user_id: str,
+    older_than_days: int = settings.ARCHIVE_AFTER_DAYS,
+    dry_run: bool = False,
+) -> int:
+    """Move a user's finished sessions older than the cutoff to the archive.
+
+    Returns the number of sessions archived.
+    """
+    cutoff = datetime.now(timezone.utc).date() - timedelta(days=older_than_days)
+    collection = fs.get_user_collection(user_id, "sessions")
+
+    docs = [
+        doc
+        for doc in fs.query(collection.where("date", "<", cutoff))
+        if doc.to_dict().get("end_time") is not None
+    ]
+    if dry_run or not docs:
+        return len(docs)
+
+    archive.add_sessions(user_id, [store.assemble(doc) for doc in docs], cutoff)
+    # Before the hot copies go, so no cached profile hides the archived ones.
+    fs.write(fs.get_user_doc(user_id).set, {"has_archive": True}, merge=True)
+    profiles.forget(user_id)
+
+    refs = []
+    for doc in docs:
+        if doc.to_dict().get("shard_count"):
+            refs.extend(fs.read(doc.reference.collection(SHARDS).list_documents))
+        refs.append(doc.reference)
+    for i in range(0, len(refs), BATCH_SIZE):
+        batch = fs.db.batch()
+        for ref in refs[i:i + BATCH_SIZE]:
+            batch.delete(ref)
+        fs.write(batch.commit)
+
+    metrics.incr("archive.sessions_archived", len(docs))
+    return len(docs)
+
+
+_session_archive: Optional[SessionArchive] = None
+
+
+def get_session_archive() -> SessionArchive:
+    global _session_archive
+    if _session_archive is None:
+        if settings.ARCHIVE_BACKEND == "file":
+            store: ArchiveStore = FileArchiveStore(settings.ARCHIVE_DIR)
+        else:
+            store = FirestoreArchiveStore(get_firestore_service())
+        _session_archive = SessionArchive(store)
+    return _session_archive
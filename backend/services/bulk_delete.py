@@ -0,0 +1,394 @@
+import threading
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from typing import Iterable, Iterator, Optional, Sequence
+
+from ..config import settings
+from ..models.account import DeletionJob, DeletionStatus
+from ..models.routine import (
+    PROVISIONS_FORMAT,
+    RoutineItemType,
+    decode_provisions,
+    encode_provisions,
+)
+from .archive import get_session_archive
+from .cache import doc_key, get_cache
+from .firestore import FirestoreService, get_firestore_service
+from .job_queue import get_job_outbox
+from .metrics import metrics
+from .session_store import SHARDS
+
+# Firestore allows at most 500 operations per batched write.
+BATCH_SIZE = 500
+
+# Every subcollection under users/{uid}, in the order they are deleted.
+USER_COLLECTIONS = (
+    "exercises",
+    "exercise_names",
+    "routines",
+    "sessions",
+    "session_archives",
+    "last_performance",
+    "calendar",
+    "weight_logs",
+    "weight_years",
+)
+
+# Collections whose documents are cached by ``doc_key``.
+CACHED_COLLECTIONS = ("exercises", "routines")
+
+
+def apply_exercise_names(performed: list[dict], names: dict[str, str]) -> bool:
+    """Set ``exercise_name`` on performed exercises from ``names`` by exercise ID.
+
+    Returns whether anything changed.
+    """
+    changed = False
+    for performed_exercise in performed:
+        name = names.get(performed_exercise["exercise_id"])
+        if name is not None and performed_exercise.get("exercise_name") != name:
+            performed_exercise["exercise_name"] = name
+            changed = True
+    return changed
+
+
+class BulkDeleter:
+    """Deletes and rewrites many documents with batched writes.
+
+    Collections are scanned a page at a time in document-ID order and the
+    writes for each page are committed in batches of up to 500 operations.
+    At most ``parallelism`` batches are in flight at once; scanning the next
+    page overlaps with committing the previous one. With ``dry_run`` the
+    scans still run, so the returned counts are exact, but nothing is written.
+    """
+
+    def __init__(
+        self,
+        fs: FirestoreService,
+        page_size: int = settings.BULK_DELETE_PAGE_SIZE,
+        parallelism: int = settings.BULK_DELETE_PARALLELISM,
+    ):
+        self._fs = fs
+        self._page_size = page_size
+        self._parallelism = parallelism
+
+    def _pages(self, query, fields: Optional[Sequence[str]] = None) -> Iterator[list]:
+        query = query.order_by("__name__").limit(self._page_size)
+        if fields is not None:
+            query = query.select(fields)
+        last = None
+        while True:
+            page = self._fs.query(query.start_after(last) if last else query)
+            if page:
+                yield page
+            if len(page) < self._page_size:
+                return
+            last = page[-1]
+
+    def _commit(self, writes: Iterable[tuple], dry_run: bool) -> int:
+        """Apply ``(op, ref, data)`` writes in parallel batches.
+
+        Returns the number of writes.
+        """
+        if dry_run:
+            return sum(1 for _ in writes)
+
+        count = 0
+
+        def batches():
+            nonlocal count
+            batch = self._fs.db.batch()
+            for op, ref, data in writes:
+                count += 1
+                if op == "delete":
+                    batch.delete(ref)
+                else:
+                    batch.update(ref, data)
+                if len(batch) == BATCH_SIZE:
+                    yield batch
+                    batch = self._fs.db.batch()
+            if len(batch):
+                yield batch
+
+        with ThreadPoolExecutor(self._parallelism) as pool:
+            pending = set()
+            for batch in batches():
+                if len(pending) >= self._parallelism:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+                pending.add(pool.submit(self._fs.write, batch.commit))
+                metrics.incr("bulk_delete.batches")
+            for future in pending:
+                future.result()
+        return count
+
+    def delete_user_data(
+        self, user_id: str, dry_run: bool = False, keep_job: Optional[str] = None
+    ) -> dict[str, int]:
+        """Delete every document a user owns, including the user document.
+
+        The user's outstanding background jobs are dropped from the outbox
+        too, except ``keep_job``, the deletion's own job if it has one.
+        Returns the number of documents deleted (or that would be deleted)
+        per collection.
+        """
+        counts = {}
+        for name in USER_COLLECTIONS:
+            collection = self._fs.get_user_collection(user_id, name)
+            # Only the document names are needed, apart from session shards.
+            fields = ["shard_count"] if name == "sessions" else ["__name__"]
+            shards = 0
+            doc_ids = []
+
+            def deletes():
+                nonlocal shards
+                for page in self._pages(collection, fields):
+                    for doc in page:
+                        doc_ids.append(doc.id)
+                        if (doc.to_dict() or {}).get("shard_count"):
+                            shard_refs = doc.reference.collection(SHARDS)
+                            for shard_ref in self._fs.read(shard_refs.list_documents):
+                                shards += 1
+                                yield "delete", shard_ref, None
+                        yield "delete", doc.reference, None
+
+            counts[name] = self._commit(deletes(), dry_run) - shards
+            if name in CACHED_COLLECTIONS and not dry_run:
+                # After the deletes, so a read in between cannot cache the
+                # document again.
+                for doc_id in doc_ids:
+                    get_cache().invalidate(doc_key(name, user_id, doc_id))
+            if name == "sessions":
+                counts["session_shards"] = shards
+
+        outbox = get_job_outbox()
+        job_ids = [i for i in outbox.user_job_ids(user_id) if i != keep_job]
+        counts["job_outbox"] = len(job_ids)
+
+        user_ref = self._fs.get_user_doc(user_id)
+        counts["user"] = 1 if self._fs.read(user_ref.get).exists else 0
+        if not dry_run:
+            self._fs.write(user_ref.delete)
+            get_session_archive().delete_user(user_id)
+            for job_id in job_ids:
+                outbox.delete(job_id)
+        metrics.incr("bulk_delete.documents", sum(counts.values()))
+        return counts
+
+    def delete_exercise_references(
+        self,
+        user_id: str,
+        exercise_id: str,
+        include_sessions: bool = False,
+        dry_run: bool = False,
+    ) -> dict[str, int]:
+        """Remove a deleted exercise from routines, and optionally sessions.
+
+        Supersets left without items are dropped. Removing performed
+        exercises from sessions erases workout history, so it only happens
+        with ``include_sessions``.
+        """
+        now = datetime.now(timezone.utc)
+        counts = {"routines": 0, "routine_items": 0}
+        updated = []
+
+        def routine_updates():
+            routines = self._fs.get_user_collection(user_id, "routines")
+            for page in self._pages(routines):
+                for doc in page:
+                    data = doc.to_dict()
+                    provisions = decode_provisions(
+                        data.get("provisions", []), data.get("provisions_format")
+                    )
+                    kept, removed = [], 0
+                    for provision in provisions:
+                        if provision.type == RoutineItemType.SUPERSET:
+                            items = [
+                                item
+                                for item in provision.items
+                                if item.exercise_id != exercise_id
+                            ]
+                            removed += len(provision.items) - len(items)
+                            if items:
+                                provision.items = items
+                                kept.append(provision)
+                        elif provision.exercise_id == exercise_id:
+                            removed += 1
+                        else:
+                            kept.append(provision)
+                    if not removed:
+                        continue
+                    counts["routines"] += 1
+                    counts["routine_items"] += removed
+                    updated.append(doc.id)
+                    yield "update", doc.reference, {
+                        "provisions": encode_provisions(kept),
+                        "provisions_format": PROVISIONS_FORMAT,
+                        "updated_at": now,
+                    }
+
+        self._commit(routine_updates(), dry_run)
+        if not dry_run:
+            for routine_id in updated:
+                get_cache().invalidate(doc_key("routines", user_id, routine_id))
+
+        if include_sessions:
+            counts.update(sessions=0, performed_exercises=0)
+            self._commit(
+                self._session_updates(user_id, exercise_id, now, counts), dry_run
+            )
+        return counts
+
+    def rename_exercise_references(
+        self, user_id: str, exercise_id: str
+    ) -> dict[str, int]:
+        """Store an exercise's current name on the sessions that performed it.
+
+        Reads already show current names, so sessions are rewritten without
+        bumping their version. Archived sessions keep the old name.
+        """
+        exercise_ref = self._fs.get_user_collection(user_id, "exercises").document(
+            exercise_id
+        )
+        exercise = self._fs.read(exercise_ref.get)
+        counts = {"sessions": 0, "session_shards": 0}
+        if not exercise.exists:
+            return counts
+        names = {exercise_id: exercise.to_dict()["name"]}
+
+        def updates():
+            sessions = self._fs.get_user_collection(user_id, "sessions")
+            fields = ["performed_exercises", "shard_count"]
+            for page in self._pages(sessions, fields):
+                for doc in page:
+                    data = doc.to_dict()
+                    if data.get("shard_count"):
+                        for shard in self._fs.query(doc.reference.collection(SHARDS)):
+                            spilled = shard.to_dict()["performed_exercises"]
+                            if apply_exercise_names(spilled, names):
+                                counts["session_shards"] += 1
+                                yield "update", shard.reference, {
+                                    "performed_exercises": spilled
+                                }
+                    performed = data.get("performed_exercises", [])
+                    if apply_exercise_names(performed, names):
+                        counts["sessions"] += 1
+                        yield "update", doc.reference, {
+                            "performed_exercises": performed
+                        }
+
+        self._commit(updates(), dry_run=False)
+        return counts
+
+    def _session_updates(self, user_id: str, exercise_id: str, now, counts: dict):
+        sessions = self._fs.get_user_collection(user_id, "sessions")
+        for page in self._pages(sessions):
+            for doc in page:
+                data = doc.to_dict()
+
+                # Spilled exercises of long sessions live in shard documents,
+                # ahead of those in the session document.
+                shard_index = data.get("shard_index", {})
+                shards = []
+                if shard_index:
+                    shards = sorted(
+                        self._fs.query(doc.reference.collection(SHARDS)),
+                        key=lambda shard: int(shard.id),
+                    )
+                pieces = [
+                    (shard.reference, shard.to_dict()["performed_exercises"])
+                    for shard in shards
+                ]
+                pieces.append((doc.reference, data.get("performed_exercises", [])))
+                removed_ids = {
+                    exercise["id"]
+                    for _, exercises in pieces
+                    for exercise in exercises
+                    if exercise["exercise_id"] == exercise_id
+                }
+                if not removed_ids:
+                    continue
+
+                # Renumber what is left so ``order`` has no gaps.
+                order = 0
+                for ref, exercises in pieces:
+                    performed = [e for e in exercises if e["id"] not in removed_ids]
+                    changed = len(performed) < len(exercises)
+                    for exercise in performed:
+                        if exercise.get("order") != order:
+                            exercise["order"] = order
+                            changed = True
+                        order += 1
+                    if changed and ref is not doc.reference:
+                        yield "update", ref, {"performed_exercises": performed}
+
+                counts["sessions"] += 1
+                counts["performed_exercises"] += len(removed_ids)
+                update = {
+                    "performed_exercises": performed,
+                    "updated_at": now,
+                    "version": data.get("version", 0) + 1,
+                }
+                if shard_index:
+                    update["shard_index"] = {
+                        k: v for k, v in shard_index.items() if k not in removed_ids
+                    }
+                yield "update", doc.reference, update
+
+
+class DeletionJobs:
+    """Progress of account deletions running on the job queue, one per user."""
+
+    def __init__(self):
+        self._jobs: dict[str, DeletionJob] = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str) -> Optional[DeletionJob]:
+        return self._jobs.get(user_id)
+
+    def start(self, user_id: str) -> tuple[DeletionJob, bool]:
+        """Register a deletion for ``user_id``.
+
+        Returns the job and whether it is new; a deletion that is already
+        pending or running is returned as is.
+        """
+        with self._lock:
+            job = self._jobs.get(user_id)
+            if job and job.status in (DeletionStatus.PENDING, DeletionStatus.RUNNING):
+                return job, False
+            job = DeletionJob(
+                id=str(uuid.uuid4()),
+                status=DeletionStatus.PENDING,
+                created_at=datetime.now(timezone.utc),
+            )
+            self._jobs[user_id] = job
+            return job, True
+
+    def run(self, user_id: str, keep_job: Optional[str] = None):
+        """Delete the user's data, recording progress on their deletion.
+
+        Failures are recorded and raised, so the job queue retries them.
+        After a restart the deletion is run again without a record from
+        before.
+        """
+        job = self._jobs.get(user_id)
+        if job is None:
+            job, _ = self.start(user_id)
+        job.status = DeletionStatus.RUNNING
+        job.error = None
+        try:
+            job.counts = BulkDeleter(get_firestore_service()).delete_user_data(
+                user_id, keep_job=keep_job
+            )
+            job.status = DeletionStatus.COMPLETED
+        except Exception as exc:
+            job.status = DeletionStatus.FAILED
+            job.error = str(exc)
+            raise
+        finally:
+            job.finished_at = datetime.now(timezone.utc)
+
+
+deletion_jobs = DeletionJobs()
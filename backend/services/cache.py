@@ -0,0 +1,335 @@
+import json
+import logging
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Any, Callable, Optional
+
+from ..config import settings
+from .metrics import metrics
+
+try:
+    import redis
+except ImportError:  # redis is optional; the local backend needs nothing
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+
+class Cache:
+    """Key-value cache for the service layer, with a version per key.
+
+    ``invalidate`` bumps a key's version and drops its value everywhere. A
+    value is stored with the version read before it was loaded and only
+    served while that is still the key's version, so a load that raced an
+    update cannot put the old data back. Values are copied in and out, so
+    callers may change what they get.
+    """
+
+    def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    def version(self, key: str) -> int:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, version: int, ttl: float):
+        """Store ``value`` if ``version`` is still the key's version."""
+        raise NotImplementedError
+
+    def invalidate(self, key: str) -> int:
+        """Drop the key's value everywhere; returns its new version."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def get_or_load(
+        self, key: str, load: Callable[[], Optional[Any]], ttl: float
+    ) -> Optional[Any]:
+        """The cached value, or ``load()``'s result, cached unless None."""
+        value = self.get(key)
+        if value is not None:
+            metrics.incr("cache.hits")
+            return value
+        metrics.incr("cache.misses")
+        version = self.version(key)
+        value = load()
+        if value is not None:
+            self.set(key, value, version, ttl)
+        return value
+
+    def put(self, key: str, value: Any, ttl: float):
+        """Invalidate the key everywhere and cache its new value here.
+
+        For write-through after an update: two concurrent updates each get
+        their own version and only the later one's value is kept.
+        """
+        self.set(key, value, self.invalidate(key), ttl)
+
+
+class _Entries:
+    """Pickled values by key, least recently used dropped first."""
+
+    def __init__(self, max_entries: int):
+        self._max_entries = max_entries
+        # key -> (version, expires at, pickled value)
+        self._entries: OrderedDict[str, tuple[int, float, bytes]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[tuple[int, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[0], pickle.loads(entry[2])
+
+    def set(self, key: str, version: int, value: Any, ttl: float):
+        self._entries[key] = (version, time.monotonic() + ttl, pickle.dumps(value))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def pop(self, key: str):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+class LocalCache(Cache):
+    """A cache in this process only; what each worker has by default."""
+
+    def __init__(self, max_entries: int = settings.CACHE_MAX_ENTRIES):
+        self._max_entries = max_entries
+        self._entries = _Entries(max_entries)
+        # Versions of the most recently invalidated keys, from one counter;
+        # other keys are at the floor, the counter when a version was last
+        # forgotten, so a load begun before that cannot be stored after.
+        self._versions: OrderedDict[str, int] = OrderedDict()
+        self._counter = 0
+        self._floor = 0
+        self._lock = threading.Lock()
+        metrics.gauge("cache.entries", lambda: len(self._entries))
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            version = self._versions.get(key, self._floor)
+            if entry is None or entry[0] != version:
+                return None
+            return entry[1]
+
+    def version(self, key: str) -> int:
+        with self._lock:
+            return self._versions.get(key, self._floor)
+
+    def set(self, key: str, value: Any, version: int, ttl: float):
+        with self._lock:
+            if version == self._versions.get(key, self._floor):
+                self._entries.set(key, version, value, ttl)
+
+    def invalidate(self, key: str) -> int:
+        metrics.incr("cache.invalidations")
+        with self._lock:
+            self._counter += 1
+            self._versions.pop(key, None)
+            self._versions[key] = self._counter
+            if len(self._versions) > self._max_entries:
+                self._versions.popitem(last=False)
+                self._floor = self._counter
+            self._entries.pop(key)
+            return self._counter
+
+
+def _encode(value: Any) -> dict:
+    if isinstance(value, datetime):
+        return {"$datetime": value.isoformat()}
+    if isinstance(value, date):
+        return {"$date": value.isoformat()}
+    raise TypeError(f"Cannot cache a {type(value).__name__}")
+
+
+def _decode(obj: dict) -> Any:
+    if len(obj) == 1:
+        if "$datetime" in obj:
+            return datetime.fromisoformat(obj["$datetime"])
+        if "$date" in obj:
+            return date.fromisoformat(obj["$date"])
+    return obj
+
+
+def dumps(value: Any) -> bytes:
+    """JSON for a cached value; dates and datetimes are tagged objects."""
+    return json.dumps(value, default=_encode, separators=(",", ":")).encode()
+
+
+def loads(data: bytes) -> Any:
+    return json.loads(data, object_hook=_decode)
+
+
+class RedisCache(Cache):
+    """A cache shared by every worker through a Redis-protocol server.
+
+    Each key has a version counter ``{prefix}ver:{key}`` and a value
+    ``{prefix}val:{key}`` stored as JSON with the version it was loaded at,
+    both fetched with one MGET. JSON rather than pickle, so whoever can
+    write to the server cannot run code in the workers. Values are also
+    kept in a small in-process near cache. ``invalidate`` publishes the key
+    on ``{prefix}invalidate`` and every worker drops its near copy; while a
+    worker is not subscribed, as when the connection drops, it skips its
+    near cache.
+    """
+
+    def __init__(
+        self,
+        url: str = settings.CACHE_URL,
+        prefix: str = settings.CACHE_PREFIX,
+        max_entries: int = settings.CACHE_MAX_ENTRIES,
+    ):
+        if redis is None:
+            raise RuntimeError("CACHE_BACKEND=redis needs the redis package")
+        self._redis = redis.Redis.from_url(url)
+        self._prefix = prefix
+        self._channel = f"{prefix}invalidate"
+        self._near = _Entries(max_entries)
+        self._lock = threading.Lock()
+        self._subscribed = threading.Event()
+        # Invalidations received, to tell if one arrived during a read
+        self._seen = 0
+        self._closed = False
+        self._pubsub = None
+        self._listener = threading.Thread(target=self._listen, daemon=True)
+        self._listener.start()
+        metrics.gauge("cache.entries", lambda: len(self._near))
+
+    def _ver(self, key: str) -> str:
+        return f"{self._prefix}ver:{key}"
+
+    def _val(self, key: str) -> str:
+        return f"{self._prefix}val:{key}"
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._near.get(key) if self._subscribed.is_set() else None
+            seen = self._seen
+        if entry is not None:
+            metrics.incr("cache.near_hits")
+            return entry[1]
+        try:
+            version, stored = self._redis.mget(self._ver(key), self._val(key))
+        except redis.RedisError:
+            metrics.incr("cache.errors")
+            logger.warning("Cache read of %s failed", key, exc_info=True)
+            return None
+        if stored is None:
+            return None
+        try:
+            stored_version, ttl, value = loads(stored)
+        except (ValueError, TypeError):
+            metrics.incr("cache.errors")
+            logger.warning("Cache value of %s is not valid", key, exc_info=True)
+            return None
+        if stored_version != int(version or 0):
+            return None
+        with self._lock:
+            # Unless an invalidation arrived meanwhile, which may be for
+            # this key and sent after the MGET.
+            if self._subscribed.is_set() and self._seen == seen:
+                self._near.set(key, stored_version, value, ttl)
+        return value
+
+    def version(self, key: str) -> int:
+        try:
+            return int(self._redis.get(self._ver(key)) or 0)
+        except redis.RedisError:
+            metrics.incr("cache.errors")
+            # Not stored by set() below, since the write would fail too.
+            return -1
+
+    def set(self, key: str, value: Any, version: int, ttl: float):
+        if version < 0:
+            return
+        try:
+            # A racing update may have bumped the version since; get()
+            # then ignores this value until it is loaded again. The near
+            # cache is filled by get(), which can tell.
+            self._redis.set(
+                self._val(key),
+                dumps([version, ttl, value]),
+                px=int(ttl * 1000),
+            )
+        except (redis.RedisError, TypeError):
+            metrics.incr("cache.errors")
+            logger.warning("Cache write of %s failed", key, exc_info=True)
+
+    def invalidate(self, key: str) -> int:
+        metrics.incr("cache.invalidations")
+        with self._lock:
+            self._near.pop(key)
+        try:
+            pipe = self._redis.pipeline(transaction=True)
+            pipe.incr(self._ver(key))
+            pipe.delete(self._val(key))
+            pipe.publish(self._channel, key)
+            return pipe.execute()[0]
+        except redis.RedisError:
+            # Other workers keep their near copies until they expire or
+            # lose their own connection.
+            metrics.incr("cache.errors")
+            logger.error("Cache invalidation of %s failed", key, exc_info=True)
+            return -1
+
+    def _listen(self):
+        while not self._closed:
+            try:
+                self._pubsub = self._redis.pubsub()
+                self._pubsub.subscribe(self._channel)
+                for message in self._pubsub.listen():
+                    with self._lock:
+                        self._seen += 1
+                        if message["type"] == "subscribe":
+                            # Anything could have changed while unsubscribed.
+                            self._near.clear()
+                            self._subscribed.set()
+                        elif message["type"] == "message":
+                            self._near.pop(message["data"].decode())
+            except Exception:
+                if self._closed:
+                    return
+                logger.warning("Cache invalidation feed lost", exc_info=True)
+            with self._lock:
+                self._subscribed.clear()
+                self._near.clear()
+            time.sleep(1)
+
+    def close(self):
+        self._closed = True
+        self._subscribed.clear()
+        if self._pubsub is not None:
+            self._pubsub.close()
+        self._redis.close()
+
+
+def doc_key(collection: str, user_id: str, doc_id: str) -> str:
+    """Cache key of one of a user's documents, such as a routine."""
+    return f"{collection}:{user_id}:{doc_id}"
+
+
+_cache: Optional[Cache] = None
+
+
+def get_cache() -> Cache:
+    global _cache
+    if _cache is None:
+        if settings.CACHE_BACKEND == "redis":
+            _cache = RedisCache()
+        else:
+            _cache = LocalCache()
+    return _cache
@@ -0,0 +1,194 @@
+from calendar import isleap
+from datetime import date
+from typing import Optional
+
+from firebase_admin import firestore
+
+from ..models.body_metrics import as_date
+from .firestore import FirestoreService, get_firestore_service
+
+# users/{uid}/calendar/{YYYY}
+COLLECTION = "calendar"
+# Fields the calendar endpoint reads; the rest is bookkeeping for updates
+VIEW_FIELDS = ["trained", "levels"]
+# Day volume (weight x reps) at which each level above 1 starts; any
+# session at all is level 1.
+LEVEL_THRESHOLDS = (2500, 5000, 10000)
+
+
+def session_date(session: dict) -> date:
+    return as_date(session["date"])
+
+
+def days_in_year(year: int) -> int:
+    return 366 if isleap(year) else 365
+
+
+def day_of_year(day: date) -> int:
+    """Zero-based index of ``day`` within its year."""
+    return day.toordinal() - date(day.year, 1, 1).toordinal()
+
+
+def session_volume(session: dict) -> float:
+    """Total weight x reps of a session's completed sets."""
+    return sum(
+        s["weight"] * s["reps"]
+        for exercise in session.get("performed_exercises", [])
+        for s in exercise.get("sets", [])
+        if s.get("completed", True)
+    )
+
+
+def volume_level(volume: float) -> int:
+    level = 1
+    for threshold in LEVEL_THRESHOLDS:
+        if volume >= threshold:
+            level += 1
+    return level
+
+
+def longest_run(bits: int) -> int:
+    """Length of the longest run of set bits.
+
+    Each ``bits &= bits >> 1`` shortens every run by one, so the number
+    of steps until nothing is left is the longest run.
+    """
+    run = 0
+    while bits:
+        bits &= bits >> 1
+        run += 1
+    return run
+
+
+def run_ending_at(bits: int, index: int) -> int:
+    """Length of the run of set bits ending at bit ``index``."""
+    mask = (1 << (index + 1)) - 1
+    # The highest clear bit at or below index is where the run starts.
+    return index + 1 - (~bits & mask).bit_length()
+
+
+def calendar_entry(session: dict) -> list:
+    """A session's ``[day of year, volume]``; volume counts once finished."""
+    volume = session_volume(session) if session.get("end_time") else 0
+    return [day_of_year(session_date(session)), volume]
+
+
+def calendar_document(year: int, sessions: dict[str, list]) -> dict:
+    """The stored calendar for ``year`` given each session's entry.
+
+    ``trained`` is a bitset with bit N set if the user trained on day N,
+    as little-endian bytes; ``levels`` has one byte per day, 0 for a rest
+    day and 1-4 for how much volume was lifted. ``sessions`` keeps the
+    entries the other two are derived from, so one session can be changed
+    or removed without reading any others.
+    """
+    volumes: dict[int, float] = {}
+    for day, volume in sessions.values():
+        volumes[day] = volumes.get(day, 0) + volume
+    size = days_in_year(year)
+    trained = 0
+    levels = bytearray(size)
+    for day, volume in volumes.items():
+        trained |= 1 << day
+        levels[day] = volume_level(volume)
+    return {
+        "trained": trained.to_bytes((size + 7) // 8, "little"),
+        "levels": bytes(levels),
+        "sessions": sessions,
+    }
+
+
+class TrainingCalendar:
+    """Training days per user and year, one small document per year.
+
+    Kept up to date by the ``calendar_changed`` job as sessions are
+    created, finished and deleted, so a year's heatmap and streaks are a
+    single document read instead of a scan of every session.
+    """
+
+    def __init__(self, fs: FirestoreService):
+        self._fs = fs
+
+    def ref(self, user_id: str, year: int):
+        return self._fs.get_user_collection(user_id, COLLECTION).document(str(year))
+
+    def _bits(self, user_id: str, year: int) -> tuple[int, bytes]:
+        doc = self._fs.read(self.ref(user_id, year).get, field_paths=VIEW_FIELDS)
+        if not doc.exists:
+            return 0, bytes(days_in_year(year))
+        data = doc.to_dict()
+        return int.from_bytes(data["trained"], "little"), data["levels"]
+
+    def year(self, user_id: str, year: int, today: Optional[date] = None) -> dict:
+        """Per-day levels for ``year``, with the current and longest streak.
+
+        The current streak is the run of training days up to today, or up
+        to yesterday if today has no session yet; it is 0 for other years.
+        """
+        today = today or date.today()
+        trained, levels = self._bits(user_id, year)
+        current = 0
+        if year == today.year:
+            index = day_of_year(today)
+            if not trained >> index & 1:
+                # -1 on January 1st: yesterday was the end of last year.
+                index -= 1
+            current = run_ending_at(trained, index)
+            if current == index + 1:
+                # The streak reaches January 1st (or ends on December 31st);
+                # carry on into last year.
+                previous, _ = self._bits(user_id, year - 1)
+                current += run_ending_at(previous, days_in_year(year - 1) - 1)
+        return {
+            "year": year,
+            "levels": list(levels),
+            "training_days": trained.bit_count(),
+            "current_streak": current,
+            "longest_streak": longest_run(trained),
+        }
+
+    def record_session(self, user_id: str, session_id: str, session: Optional[dict]):
+        """Update the calendar for a session's current state.
+
+        ``session`` is None for a deleted session. Its date is gone with
+        it, so each year is tried in turn, latest first, until one held it.
+        """
+        if session is not None:
+            year = session_date(session).year
+            self._update(user_id, year, session_id, session)
+            return
+        collection = self._fs.get_user_collection(user_id, COLLECTION)
+        years = sorted(
+            (int(ref.id) for ref in self._fs.read(collection.list_documents)),
+            reverse=True,
+        )
+        for year in years:
+            if self._update(user_id, year, session_id, None):
+                return
+
+    def _update(
+        self, user_id: str, year: int, session_id: str, session: Optional[dict]
+    ) -> bool:
+        """Set or remove one session's entry; False if there was none to remove."""
+        ref = self.ref(user_id, year)
+
+        @firestore.transactional
+        def update_in_transaction(transaction) -> bool:
+            doc = ref.get(transaction=transaction)
+            sessions = dict(doc.to_dict()["sessions"]) if doc.exists else {}
+            if session is None:
+                if sessions.pop(session_id, None) is None:
+                    return False
+            else:
+                sessions[session_id] = calendar_entry(session)
+            if sessions:
+                transaction.set(ref, calendar_document(year, sessions))
+            else:
+                transaction.delete(ref)
+            return True
+
+        return self._fs.transact(update_in_transaction)
+
+
+def get_training_calendar() -> TrainingCalendar:
+    return TrainingCalendar(get_firestore_service())
@@ -0,0 +1,248 @@
+import bisect
+import heapq
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Iterable, Optional
+
+from ..config import settings
+from ..models.exercise import Exercise
+from .metrics import metrics
+
+# Weight of a match in each field, and of each kind of match
+NAME_WEIGHT = 1.0
+NOTES_WEIGHT = 0.4
+EXACT, PREFIX, FUZZY = 1.0, 0.8, 0.6
+# Whole name starting with the whole query
+NAME_PREFIX_BONUS = 0.5
+# Trigram similarity below this is not a match
+MIN_SIMILARITY = 0.3
+
+
+def words(text: Optional[str]) -> list[str]:
+    """Lower-cased words of ``text`` with accents and punctuation removed."""
+    if not text:
+        return []
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(
+        c if c.isalnum() else " "
+        for c in decomposed
+        if not unicodedata.combining(c)
+    ).split()
+
+
+def trigrams(word: str) -> set[str]:
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class ExerciseIndex:
+    """Prefix and trigram index over one user's exercise names and notes.
+
+    Words are kept in a sorted list, so a prefix is a binary search, and in
+    trigram postings, so a misspelled word finds words sharing enough
+    trigrams with it. Both map words to the exercises that use them.
+    """
+
+    def __init__(self, exercises: Iterable[Exercise] = ()):
+        self._exercises: dict[str, Exercise] = {}
+        self._fields: dict[str, tuple[list[str], list[str]]] = {}
+        # word -> {exercise ID: field weight}
+        self._postings: dict[str, dict[str, float]] = {}
+        self._sorted: list[str] = []
+        self._grams: dict[str, set[str]] = {}
+        self.built_at = time.monotonic()
+        for exercise in exercises:
+            self.add(exercise)
+
+    def __len__(self) -> int:
+        return len(self._exercises)
+
+    def add(self, exercise: Exercise):
+        self.remove(exercise.id)
+        name, notes = words(exercise.name), words(exercise.notes)
+        self._exercises[exercise.id] = exercise
+        self._fields[exercise.id] = (name, notes)
+        # Name last, so a word in both fields counts as a name match
+        for field, weight in ((notes, NOTES_WEIGHT), (name, NAME_WEIGHT)):
+            for word in field:
+                self._add_word(word)[exercise.id] = weight
+
+    def remove(self, exercise_id: str):
+        fields = self._fields.pop(exercise_id, None)
+        if fields is None:
+            return
+        del self._exercises[exercise_id]
+        for word in set(fields[0] + fields[1]):
+            posting = self._postings[word]
+            posting.pop(exercise_id, None)
+            if not posting:
+                self._remove_word(word)
+
+    def _add_word(self, word: str) -> dict[str, float]:
+        posting = self._postings.get(word)
+        if posting is None:
+            posting = self._postings[word] = {}
+            bisect.insort(self._sorted, word)
+            for gram in trigrams(word):
+                self._grams.setdefault(gram, set()).add(word)
+        return posting
+
+    def _remove_word(self, word: str):
+        del self._postings[word]
+        del self._sorted[bisect.bisect_left(self._sorted, word)]
+        for gram in trigrams(word):
+            self._grams[gram].discard(word)
+            if not self._grams[gram]:
+                del self._grams[gram]
+
+    def _matches(self, token: str) -> dict[str, float]:
+        """Words matching one query token, with how well they match."""
+        matches = {}
+        for i in range(bisect.bisect_left(self._sorted, token), len(self._sorted)):
+            word = self._sorted[i]
+            if not word.startswith(token):
+                break
+            matches[word] = EXACT if word == token else PREFIX
+        if len(token) >= 3:
+            grams = trigrams(token)
+            shared: dict[str, int] = {}
+            for gram in grams:
+                for word in self._grams.get(gram, ()):
+                    shared[word] = shared.get(word, 0) + 1
+            for word, count in shared.items():
+                if word in matches:
+                    continue
+                similarity = count / (len(grams) + len(trigrams(word)) - count)
+                if similarity >= MIN_SIMILARITY:
+                    matches[word] = FUZZY * similarity
+        return matches
+
+    def search(
+        self,
+        query: str,
+        limit: int = 20,
+        where: Optional[Callable[[Exercise], bool]] = None,
+    ) -> list[Exercise]:
+        """Exercises matching every word of ``query``, best first."""
+        tokens = words(query)
+        if not tokens:
+            return []
+
+        scores: Optional[dict[str, float]] = None
+        for token in tokens:
+            best: dict[str, float] = {}
+            for word, quality in self._matches(token).items():
+                for exercise_id, weight in self._postings[word].items():
+                    score = quality * weight
+                    if score > best.get(exercise_id, 0):
+                        best[exercise_id] = score
+            if scores is None:
+                scores = best
+            else:
+                scores = {i: s + best[i] for i, s in scores.items() if i in best}
+            if not scores:
+                return []
+
+        phrase = " ".join(tokens)
+        ranked = []
+        for exercise_id, score in scores.items():
+            exercise = self._exercises[exercise_id]
+            if where is not None and not where(exercise):
+                continue
+            if " ".join(self._fields[exercise_id][0]).startswith(phrase):
+                score += NAME_PREFIX_BONUS
+            ranked.append((-score, len(exercise.name), exercise.name, exercise))
+        return [r[3] for r in heapq.nsmallest(limit, ranked, key=lambda r: r[:3])]
+
+
+class ExerciseSearch:
+    """Search indexes for recently active users, built on first search.
+
+    At most ``max_users`` indexes are kept, least recently used first out.
+    Writes through this process update a loaded index in place; an index is
+    rebuilt after ``ttl`` seconds to pick up writes made elsewhere. Builds
+    may run in a thread: one that overlapped a write through this process
+    is used once but not kept, since it may have read from before the write.
+    """
+
+    def __init__(
+        self,
+        max_users: int = settings.EXERCISE_SEARCH_MAX_USERS,
+        ttl: float = settings.EXERCISE_SEARCH_TTL_SECONDS,
+    ):
+        self._max_users = max_users
+        self._ttl = ttl
+        self._indexes: OrderedDict[str, ExerciseIndex] = OrderedDict()
+        # Builds in progress per user, and writes seen while they ran
+        self._building: dict[str, int] = {}
+        self._writes: dict[str, int] = {}
+        self._lock = threading.Lock()
+        metrics.gauge("exercise_search.users", lambda: len(self._indexes))
+
+    def cached(self, user_id: str) -> Optional[ExerciseIndex]:
+        """The user's index if it is loaded and not expired."""
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if index is None or time.monotonic() - index.built_at >= self._ttl:
+                return None
+            self._indexes.move_to_end(user_id)
+            return index
+
+    def index(
+        self, user_id: str, load: Callable[[], Iterable[Exercise]]
+    ) -> ExerciseIndex:
+        """The user's index, built from ``load()`` if missing or expired."""
+        index = self.cached(user_id)
+        if index is not None:
+            return index
+
+        with self._lock:
+            self._building[user_id] = self._building.get(user_id, 0) + 1
+            writes = self._writes.get(user_id, 0)
+        metrics.incr("exercise_search.builds")
+        try:
+            index = ExerciseIndex(load())
+        finally:
+            with self._lock:
+                stale = self._writes.get(user_id, 0) != writes
+                self._building[user_id] -= 1
+                if not self._building[user_id]:
+                    del self._building[user_id]
+                    self._writes.pop(user_id, None)
+        if stale:
+            return index
+
+        with self._lock:
+            self._indexes[user_id] = index
+            self._indexes.move_to_end(user_id)
+            while len(self._indexes) > self._max_users:
+                self._indexes.popitem(last=False)
+        return index
+
+    def upsert(self, exercise: Exercise):
+        with self._lock:
+            self._changed(exercise.user_id)
+            index = self._indexes.get(exercise.user_id)
+            if index is not None:
+                index.add(exercise)
+
+    def remove(self, user_id: str, exercise_id: str):
+        with self._lock:
+            self._changed(user_id)
+            index = self._indexes.get(user_id)
+            if index is not None:
+                index.remove(exercise_id)
+
+    def forget(self, user_id: str):
+        with self._lock:
+            self._changed(user_id)
+            self._indexes.pop(user_id, None)
+
+    def _changed(self, user_id: str):
+        if user_id in self._building:
+            self._writes[user_id] = self._writes.get(user_id, 0) + 1
+
+
+exercise_search = ExerciseSearch()
@@ -1,7 +1,45 @@
+import time
 import firebase_admin
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
 from firebase_admin import credentials, firestore
-from typing import Optional
+from google.api_core.exceptions import DeadlineExceeded
+from typing import Any, Callable, Iterable, Optional, Sequence
 from ..config import settings
+from .metrics import metrics
+from .tracing import tracer
+from .resilience import (
+    BREAKER_ERRORS,
+    TRANSIENT_ERRORS,
+    CircuitBreaker,
+    FirestoreUnavailable,
+    backoff_delays,
+)
+
+# Exercise fields copied onto routine items and performed exercises in
+# responses when callers ask for exercise details.
+EXERCISE_DETAIL_FIELDS = ("name", "muscle_group", "category")
+
+# Transactions run here, so a hung one can be given up on at the deadline.
+_transactions = ThreadPoolExecutor(thread_name_prefix="firestore-transaction")
+
+breaker = CircuitBreaker(
+    "firestore",
+    failure_rate=settings.FIRESTORE_BREAKER_FAILURE_RATE,
+    min_calls=settings.FIRESTORE_BREAKER_MIN_CALLS,
+    window=settings.FIRESTORE_BREAKER_WINDOW_SECONDS,
+    reset_timeout=settings.FIRESTORE_BREAKER_RESET_SECONDS,
+)
+
+
+def document_count(result: Any) -> int:
+    """Documents read or written by a call, for tracing."""
+    if isinstance(result, list):
+        return len(result)
+    exists = getattr(result, "exists", None)
+    if exists is not None:
+        return int(exists)
+    return 1 if result is not None else 0
 
 
 class FirestoreService:
@@ -32,6 +70,126 @@ class FirestoreService:
     def db(self):
         return self._db
 
+    def read(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run an idempotent Firestore read, e.g. ``fs.read(doc_ref.get)``.
+
+        The call gets the configured deadline and is retried on transient
+        errors with jittered exponential backoff, within that deadline.
+        Iterators such as query streams are read to a list inside the call.
+        """
+        return self._call(fn, args, kwargs, retry=True, operation="read")
+
+    def write(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run a Firestore write, e.g. ``fs.write(batch.commit)``.
+
+        Writes get the deadline and circuit breaker but are not retried,
+        since they may have been applied before the error.
+        """
+        return self._call(fn, args, kwargs, retry=False, operation="write")
+
+    def transact(self, fn: Callable) -> Any:
+        """Run a ``@firestore.transactional`` function in a new transaction.
+
+        The transaction retries its own contention aborts; this adds the
+        circuit breaker and the deadline. The client takes no timeout for
+        beginning or committing a transaction, so the deadline is kept by
+        waiting for it in another thread: one still running by then is
+        left to finish on its own, and may yet commit, as a timed-out write
+        may have.
+        """
+        return self._call(
+            self._within_deadline,
+            (fn,),
+            {},
+            retry=False,
+            deadline=False,
+            operation="transaction",
+        )
+
+    def _within_deadline(self, fn: Callable) -> Any:
+        future = _transactions.submit(fn, self._db.transaction())
+        try:
+            return future.result(timeout=settings.FIRESTORE_TIMEOUT_SECONDS)
+        except TimeoutError:
+            raise DeadlineExceeded("Transaction did not finish within the deadline")
+
+    def query(self, query) -> list:
+        """Read all results of a query."""
+        return self._call(query.stream, (), {}, retry=True, operation="query")
+
+    def _call(
+        self,
+        fn: Callable,
+        args: tuple,
+        kwargs: dict,
+        retry: bool,
+        deadline: bool = True,
+        operation: str = "read",
+    ) -> Any:
+        with tracer.span(f"firestore.{operation}") as span:
+            if span.recording:
+                span.set("call", getattr(fn, "__qualname__", type(fn).__name__))
+            result = self._run(fn, args, kwargs, retry, deadline, span)
+            if span.recording and operation != "transaction":
+                span.set("documents", document_count(result))
+            return result
+
+    def _run(
+        self,
+        fn: Callable,
+        args: tuple,
+        kwargs: dict,
+        retry: bool,
+        deadline: bool,
+        span,
+    ) -> Any:
+        timeout = settings.FIRESTORE_TIMEOUT_SECONDS
+        if deadline:
+            # Our policy replaces the client's default retries.
+            kwargs = {"timeout": timeout, "retry": None, **kwargs}
+        delays = backoff_delays(
+            settings.FIRESTORE_READ_ATTEMPTS if retry else 1,
+            settings.FIRESTORE_RETRY_BASE_SECONDS,
+            settings.FIRESTORE_RETRY_MAX_SECONDS,
+        )
+        give_up_at = time.monotonic() + timeout
+        attempts = 0
+        error: Optional[Exception] = None
+        while True:
+            # Asked before every attempt, so retries stop as soon as the
+            # breaker opens, and a half-open breaker's probe is not retried.
+            if not breaker.allow():
+                metrics.incr("firestore.rejected")
+                raise FirestoreUnavailable(
+                    "Database temporarily unavailable", breaker.reset_timeout
+                ) from error
+            if not attempts:
+                metrics.incr("firestore.calls")
+            attempts += 1
+            span.set("attempts", attempts)
+            try:
+                result = fn(*args, **kwargs)
+                if isinstance(result, Iterator):
+                    result = list(result)
+            except TRANSIENT_ERRORS as exc:
+                breaker.record(not isinstance(exc, BREAKER_ERRORS))
+                metrics.incr(f"firestore.errors.{type(exc).__name__}")
+                delay = next(delays, None)
+                if delay is None or time.monotonic() + delay >= give_up_at:
+                    raise FirestoreUnavailable(
+                        "Database temporarily unavailable", 1
+                    ) from exc
+                metrics.incr("firestore.retries")
+                time.sleep(delay)
+                error = exc
+                continue
+            except Exception:
+                # Not found, already exists and the like: the backend is fine.
+                breaker.record(True)
+                raise
+            breaker.record(True)
+            return result
+
     def get_user_collection(self, user_id: str, collection: str):
         """Get a subcollection under a user document."""
         return self._db.collection("users").document(user_id).collection(collection)
@@ -40,6 +198,27 @@ class FirestoreService:
         """Get the user's main document."""
         return self._db.collection("users").document(user_id)
 
+    def get_exercises_by_id(
+        self,
+        user_id: str,
+        exercise_ids: Iterable[str],
+        fields: Sequence[str] = ("name",),
+    ) -> dict[str, dict]:
+        """Fetch selected fields of many exercises in one batched read.
+
+        Returns a mapping of exercise ID to the requested fields; exercises
+        that no longer exist are left out.
+        """
+        collection = self.get_user_collection(user_id, "exercises")
+        refs = [collection.document(exercise_id) for exercise_id in set(exercise_ids)]
+        if not refs:
+            return {}
+        return {
+            doc.id: doc.to_dict()
+            for doc in self.read(self._db.get_all, refs, field_paths=list(fields))
+            if doc.exists
+        }
+
 
 _firestore_service: Optional[FirestoreService] = None
 
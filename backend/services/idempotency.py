@@ -0,0 +1,225 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional
+
+from fastapi import Depends, Header, HTTPException, Request, Response, status
+from fastapi.routing import APIRoute
+
+from ..auth import AuthenticatedUser, get_current_user
+from ..config import settings
+from .metrics import metrics
+
+MAX_KEY_LENGTH = 255
+
+# Recomputed when a stored response is replayed
+_SKIPPED_HEADERS = {"content-length"}
+
+
+@dataclass
+class IdempotencyRecord:
+    """A request seen under an idempotency key, and its response once done."""
+
+    fingerprint: str
+    status_code: Optional[int] = None
+    body: bytes = b""
+    headers: list[tuple[str, str]] = field(default_factory=list)
+
+    @property
+    def completed(self) -> bool:
+        return self.status_code is not None
+
+    def to_response(self) -> Response:
+        response = Response(content=self.body, status_code=self.status_code)
+        for name, value in self.headers:
+            response.headers.append(name, value)
+        response.headers["Idempotent-Replayed"] = "true"
+        return response
+
+
+class IdempotencyStore:
+    """Where idempotency records are kept between retries."""
+
+    def reserve(self, key: str, fingerprint: str) -> Optional[IdempotencyRecord]:
+        """Claim ``key`` for a new request.
+
+        Returns None if the key was free, or the existing record otherwise.
+        """
+        raise NotImplementedError
+
+    def complete(self, key: str, record: IdempotencyRecord):
+        raise NotImplementedError
+
+    def release(self, key: str):
+        raise NotImplementedError
+
+
+class MemoryIdempotencyStore(IdempotencyStore):
+    """Records kept in process memory, expiring after ``ttl`` seconds.
+
+    Holds at most ``max_keys`` records; the oldest are dropped first.
+    """
+
+    def __init__(
+        self,
+        ttl: float = settings.IDEMPOTENCY_TTL_SECONDS,
+        max_keys: int = settings.IDEMPOTENCY_MAX_KEYS,
+    ):
+        self._ttl = ttl
+        self._max_keys = max_keys
+        self._records: OrderedDict[str, tuple[float, IdempotencyRecord]]
+        self._records = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _purge(self, now: float):
+        while self._records:
+            key, (expires, _) = next(iter(self._records.items()))
+            if expires > now and len(self._records) <= self._max_keys:
+                break
+            del self._records[key]
+
+    def reserve(self, key: str, fingerprint: str) -> Optional[IdempotencyRecord]:
+        now = time.monotonic()
+        with self._lock:
+            self._purge(now)
+            existing = self._records.get(key)
+            if existing is not None:
+                return existing[1]
+            self._records[key] = (now + self._ttl, IdempotencyRecord(fingerprint))
+            return None
+
+    def complete(self, key: str, record: IdempotencyRecord):
+        with self._lock:
+            if key in self._records:
+                self._records[key] = (self._records[key][0], record)
+
+    def release(self, key: str):
+        with self._lock:
+            self._records.pop(key, None)
+
+
+idempotency_store: IdempotencyStore = MemoryIdempotencyStore()
+
+
+class IdempotentReplay(Exception):
+    """Raised by the idempotency dependency to short-circuit a retried request."""
+
+    def __init__(self, record: IdempotencyRecord):
+        self.record = record
+
+
+def valid_key(key: str) -> bool:
+    """Whether ``key`` is 1 to ``MAX_KEY_LENGTH`` visible ASCII characters."""
+    return 0 < len(key) <= MAX_KEY_LENGTH and all(
+        "!" <= char <= "~" for char in key
+    )
+
+
+async def check_idempotency_key(
+    request: Request,
+    idempotency_key: Optional[str] = Header(None),
+    user: AuthenticatedUser = Depends(get_current_user),
+):
+    """Reserve the request's idempotency key, or replay its stored response.
+
+    Keys are scoped to the authenticated user. A retry of a completed request
+    gets the original response. A retry while the original is still running,
+    or reusing a key for a different request (method, path, query or body),
+    gets 409. A malformed key gets 400.
+    """
+    if idempotency_key is None:
+        return
+    if not valid_key(idempotency_key):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=(
+                f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} visible "
+                "ASCII characters"
+            ),
+        )
+
+    body = await request.body()
+    fingerprint = hashlib.sha256(
+        b"%s %s?%s\n%s"
+        % (
+            request.method.encode(),
+            request.url.path.encode(),
+            request.url.query.encode(),
+            body,
+        )
+    ).hexdigest()
+    key = f"{user.uid}:{idempotency_key}"
+
+    existing = idempotency_store.reserve(key, fingerprint)
+    if existing is None:
+        request.state.idempotency = (key, fingerprint)
+        return
+    if existing.fingerprint != fingerprint:
+        metrics.incr("idempotency.mismatches")
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Idempotency-Key was already used for a different request",
+        )
+    if not existing.completed:
+        metrics.incr("idempotency.conflicts")
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A request with this Idempotency-Key is still in progress",
+        )
+    metrics.incr("idempotency.replays")
+    raise IdempotentReplay(existing)
+
+
+class IdempotentRoute(APIRoute):
+    """Route class adding ``Idempotency-Key`` support to POST endpoints.
+
+    Successful responses are stored under the key; failed requests release
+    it so the client can retry.
+    """
+
+    def __init__(self, path, endpoint, *, methods=None, dependencies=None, **kwargs):
+        if methods and "POST" in {method.upper() for method in methods}:
+            dependencies = [*(dependencies or []), Depends(check_idempotency_key)]
+        super().__init__(
+            path, endpoint, methods=methods, dependencies=dependencies, **kwargs
+        )
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def route_handler(request: Request) -> Response:
+            try:
+                response = await handler(request)
+            except IdempotentReplay as replay:
+                return replay.record.to_response()
+            except BaseException:
+                reserved = getattr(request.state, "idempotency", None)
+                if reserved is not None:
+                    idempotency_store.release(reserved[0])
+                raise
+
+            reserved = getattr(request.state, "idempotency", None)
+            if reserved is None:
+                return response
+            key, fingerprint = reserved
+            if response.status_code < 400 and hasattr(response, "body"):
+                idempotency_store.complete(
+                    key,
+                    IdempotencyRecord(
+                        fingerprint=fingerprint,
+                        status_code=response.status_code,
+                        body=response.body,
+                        headers=[
+                            (name, value)
+                            for name, value in response.headers.items()
+                            if name not in _SKIPPED_HEADERS
+                        ],
+                    ),
+                )
+            else:
+                idempotency_store.release(key)
+            return response
+
+        return route_handler
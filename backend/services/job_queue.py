@@ -0,0 +1,361 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable, Optional
+
+from ..config import settings
+from .firestore import FirestoreService, get_firestore_service
+from .metrics import metrics
+from .singleflight import single_flight
+
+logger = logging.getLogger(__name__)
+
+JobHandler = Callable[[str, dict], None]
+
+# Handlers by job kind, registered with ``job_handler``
+_handlers: dict[str, JobHandler] = {}
+
+
+def job_handler(kind: str):
+    """Register ``fn(user_id, payload)`` as the handler for jobs of ``kind``.
+
+    Handlers run in a worker thread and may run more than once for the same
+    job (after a failure or a restart), so they must be idempotent.
+    """
+    def register(fn: JobHandler) -> JobHandler:
+        _handlers[kind] = fn
+        return fn
+    return register
+
+
+@dataclass
+class Job:
+    id: str
+    user_id: str
+    kind: str
+    payload: dict
+    # Epoch seconds, so the age of a job survives a restart
+    enqueued_at: float
+    attempts: int = 0
+    error: Optional[str] = None
+    # Gave up after the last attempt; kept in the outbox for inspection
+    failed: bool = False
+
+
+def job_id(user_id: str, kind: str, key: Optional[str]) -> str:
+    """Outbox ID of a job; jobs with the same key share one."""
+    if key is None:
+        return uuid.uuid4().hex
+    return hashlib.sha256(f"{user_id}\0{kind}\0{key}".encode()).hexdigest()[:32]
+
+
+class JobOutbox:
+    """Durable record of jobs that have been accepted but not completed."""
+
+    def put(self, job: Job):
+        raise NotImplementedError
+
+    def delete(self, job_id: str):
+        raise NotImplementedError
+
+    def load(self) -> list[Job]:
+        """Every outstanding job that has not failed, oldest first."""
+        raise NotImplementedError
+
+    def user_job_ids(self, user_id: str) -> list[str]:
+        """IDs of every job of a user in the outbox, failed ones included."""
+        raise NotImplementedError
+
+
+class FirestoreJobOutbox(JobOutbox):
+    """Jobs as documents in the top-level ``job_outbox`` collection."""
+
+    COLLECTION = "job_outbox"
+
+    def __init__(self, fs: FirestoreService):
+        self._fs = fs
+
+    def _collection(self):
+        return self._fs.db.collection(self.COLLECTION)
+
+    def put(self, job: Job):
+        self._fs.write(self._collection().document(job.id).set, asdict(job))
+
+    def delete(self, job_id: str):
+        self._fs.write(self._collection().document(job_id).delete)
+
+    def load(self) -> list[Job]:
+        query = self._collection().where("failed", "==", False)
+        jobs = [Job(**doc.to_dict()) for doc in self._fs.query(query)]
+        return sorted(jobs, key=lambda job: job.enqueued_at)
+
+    def user_job_ids(self, user_id: str) -> list[str]:
+        query = self._collection().where("user_id", "==", user_id).select(["__name__"])
+        return [doc.id for doc in self._fs.query(query)]
+
+
+class FileJobOutbox(JobOutbox):
+    """Jobs as JSON files under a local directory, for development."""
+
+    def __init__(self, root: str):
+        self._root = Path(root)
+
+    def put(self, job: Job):
+        self._root.mkdir(parents=True, exist_ok=True)
+        path = self._root / f"{job.id}.json"
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(asdict(job)))
+        os.replace(tmp, path)
+
+    def delete(self, job_id: str):
+        (self._root / f"{job_id}.json").unlink(missing_ok=True)
+
+    def load(self) -> list[Job]:
+        jobs = [Job(**json.loads(p.read_text())) for p in self._root.glob("*.json")]
+        return sorted(
+            (job for job in jobs if not job.failed), key=lambda job: job.enqueued_at
+        )
+
+    def user_job_ids(self, user_id: str) -> list[str]:
+        return [
+            p.stem
+            for p in self._root.glob("*.json")
+            if json.loads(p.read_text())["user_id"] == user_id
+        ]
+
+
+class JobQueue:
+    """Runs derived-data maintenance in the background.
+
+    ``enqueue`` records a job in the outbox and returns; a pool of
+    ``workers`` asyncio tasks runs handlers in threads. A user's jobs run
+    one at a time in the order they were enqueued, while different users'
+    jobs run in parallel. Enqueuing a job with the same ``key`` as one that
+    is still waiting replaces its payload instead of adding another job.
+
+    A failed job is retried with exponential backoff, ahead of the user's
+    later jobs, up to ``max_attempts`` times; after that it is marked failed
+    in the outbox and the user's queue moves on. Jobs are removed from the
+    outbox once they succeed, so whatever was outstanding at shutdown or a
+    crash is loaded again by ``start``.
+    """
+
+    def __init__(
+        self,
+        workers: int = settings.JOB_WORKERS,
+        max_attempts: int = settings.JOB_MAX_ATTEMPTS,
+        retry_base: float = settings.JOB_RETRY_BASE_SECONDS,
+        retry_max: float = settings.JOB_RETRY_MAX_SECONDS,
+        outbox: Optional[JobOutbox] = None,
+    ):
+        self._workers = workers
+        self._max_attempts = max_attempts
+        self._retry_base = retry_base
+        self._retry_max = retry_max
+        self._outbox = outbox
+        self._lock = threading.Lock()
+        # Waiting jobs per user, in order, and by ID for deduplication
+        self._pending: dict[str, deque[Job]] = {}
+        self._waiting: dict[str, Job] = {}
+        # Users with a job waiting to be picked up, running or backing off
+        self._active: set[str] = set()
+        self._ready: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks: list[asyncio.Task] = []
+        metrics.gauge("jobs.queue_depth", lambda: len(self._waiting))
+        metrics.gauge("jobs.oldest_age_seconds", self._oldest_age)
+
+    @property
+    def outbox(self) -> JobOutbox:
+        if self._outbox is None:
+            self._outbox = get_job_outbox()
+        return self._outbox
+
+    def _oldest_age(self) -> float:
+        with self._lock:
+            ages = [job.enqueued_at for job in self._waiting.values()]
+        return time.time() - min(ages) if ages else 0.0
+
+    def enqueue(
+        self, user_id: str, kind: str, payload: dict, key: Optional[str] = None
+    ) -> Job:
+        """Accept a job for ``user_id``; it runs after the user's earlier jobs."""
+        if kind not in _handlers:
+            raise ValueError(f"No handler for job kind {kind!r}")
+        job = Job(
+            id=job_id(user_id, kind, key),
+            user_id=user_id,
+            kind=kind,
+            payload=payload,
+            enqueued_at=time.time(),
+        )
+        with self._lock:
+            waiting = self._waiting.get(job.id)
+            if waiting is not None:
+                # Keep the original's place in the queue and its age.
+                waiting.payload = payload
+                job = waiting
+        # The caller's own write has committed by now, so failing here would
+        # only hide that; the job still runs, it just will not survive a
+        # restart.
+        self._put(job)
+        if waiting is not None:
+            metrics.incr("jobs.deduplicated")
+            return job
+
+        metrics.incr("jobs.enqueued")
+        self._add(job)
+        return job
+
+    def _add(self, job: Job):
+        with self._lock:
+            self._pending.setdefault(job.user_id, deque()).append(job)
+            self._waiting[job.id] = job
+            if job.user_id in self._active:
+                return
+            self._active.add(job.user_id)
+        self._signal(job.user_id)
+
+    def _signal(self, user_id: str, delay: float = 0):
+        """Tell the workers ``user_id`` has a job to run, after ``delay``."""
+        if self._loop is None:
+            return  # start() queues every active user
+        if delay:
+            self._loop.call_soon_threadsafe(
+                self._loop.call_later, delay, self._ready.put_nowait, user_id
+            )
+        else:
+            self._loop.call_soon_threadsafe(self._ready.put_nowait, user_id)
+
+    async def start(self):
+        """Load outstanding jobs from the outbox and start the workers."""
+        for job in await asyncio.to_thread(self.outbox.load):
+            if job.id not in self._waiting:
+                self._add(job)
+        # Every active user is queued exactly once, here.
+        self._loop = asyncio.get_running_loop()
+        self._ready = asyncio.Queue()
+        with self._lock:
+            for user_id in self._active:
+                self._ready.put_nowait(user_id)
+        self._tasks = [
+            asyncio.create_task(self._work()) for _ in range(self._workers)
+        ]
+
+    async def stop(self):
+        """Stop the workers. Unfinished jobs stay in the outbox."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._loop = None
+
+    async def _work(self):
+        while True:
+            user_id = await self._ready.get()
+            with self._lock:
+                job = self._pending[user_id].popleft()
+                del self._waiting[job.id]
+
+            metrics.observe("jobs.lag_seconds", time.time() - job.enqueued_at)
+            started = time.perf_counter()
+            delay = 0
+            try:
+                await asyncio.to_thread(_handlers[job.kind], job.user_id, job.payload)
+            except Exception as exc:
+                delay = await asyncio.to_thread(self._failed, job, exc)
+            else:
+                metrics.incr("jobs.completed")
+                # A newer job with the same ID may already be waiting. This
+                # runs on the loop, like enqueue, so one cannot slip in between.
+                if job.id not in self._waiting:
+                    await self._remove(job)
+            finally:
+                metrics.observe("jobs.run_seconds", time.perf_counter() - started)
+                # Handlers change what list endpoints return, such as the
+                # exercise names on sessions, so reads must not join a call
+                # that started before the job. Done here, on the loop, since
+                # single_flight is not thread-safe.
+                single_flight.invalidate(job.user_id)
+                self._next(user_id, delay)
+
+    async def _remove(self, job: Job):
+        """Remove a completed job from the outbox."""
+        try:
+            await asyncio.to_thread(self.outbox.delete, job.id)
+        except Exception:
+            # It runs again after a restart; handlers are idempotent.
+            metrics.incr("jobs.outbox_errors")
+            logger.exception("Could not remove job %s from the outbox", job.id)
+            return
+        waiting = self._waiting.get(job.id)
+        if waiting is not None:
+            # Enqueued again while the delete was in flight, which may have
+            # removed the new copy's entry.
+            await asyncio.to_thread(self._put, waiting)
+
+    def _put(self, job: Job):
+        """Record a job in the outbox, logging rather than raising failures."""
+        try:
+            self.outbox.put(job)
+        except Exception:
+            metrics.incr("jobs.outbox_errors")
+            logger.exception("Could not record job %s in the outbox", job.id)
+
+    def _failed(self, job: Job, exc: Exception) -> float:
+        """Record a failure; returns the delay before the job is retried."""
+        job.attempts += 1
+        job.error = f"{type(exc).__name__}: {exc}"
+        if job.attempts >= self._max_attempts:
+            job.failed = True
+            metrics.incr("jobs.failed")
+            logger.error("Job %s (%s) failed: %s", job.id, job.kind, job.error)
+            if job.id not in self._waiting:
+                self._put(job)
+            return 0
+
+        metrics.incr("jobs.retries")
+        logger.warning("Job %s (%s) will be retried: %s", job.id, job.kind, job.error)
+        with self._lock:
+            if job.id in self._waiting:
+                # A newer copy of the job is waiting and will run instead.
+                return 0
+            self._pending[job.user_id].appendleft(job)
+            self._waiting[job.id] = job
+        self._put(job)
+        return random.uniform(
+            0, min(self._retry_max, self._retry_base * 2 ** (job.attempts - 1))
+        )
+
+    def _next(self, user_id: str, delay: float):
+        with self._lock:
+            if not self._pending[user_id]:
+                del self._pending[user_id]
+                self._active.discard(user_id)
+                return
+        self._signal(user_id, delay)
+
+
+_job_outbox: Optional[JobOutbox] = None
+
+
+def get_job_outbox() -> JobOutbox:
+    global _job_outbox
+    if _job_outbox is None:
+        if settings.JOB_OUTBOX_BACKEND == "file":
+            _job_outbox = FileJobOutbox(settings.JOB_OUTBOX_DIR)
+        else:
+            _job_outbox = FirestoreJobOutbox(get_firestore_service())
+    return _job_outbox
+
+
+job_queue = JobQueue()
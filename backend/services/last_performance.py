@@ -0,0 +1,111 @@
+from typing import Iterable, Optional
+
+from .firestore import FirestoreService, get_firestore_service
+
+# users/{uid}/last_performance/{exercise_id}
+COLLECTION = "last_performance"
+
+
+def session_entries(session: dict) -> dict[str, dict]:
+    """Last-performance entries from one finished session, by exercise ID.
+
+    Each entry holds the sets of the exercise's last performance in the
+    session, plus the same for each routine item it was performed as under
+    ``routine_items``. Exercises performed without any sets are left out.
+    """
+    base = {
+        "session_id": session["id"],
+        "date": session["date"],
+        "finished_at": session["end_time"],
+    }
+    entries: dict[str, dict] = {}
+    performed = sorted(session.get("performed_exercises", []), key=lambda e: e["order"])
+    for exercise in performed:
+        if not exercise.get("sets"):
+            continue
+        entry = entries.setdefault(exercise["exercise_id"], {"routine_items": {}})
+        performance = {**base, "sets": exercise["sets"]}
+        entry.update(performance)
+        if exercise.get("routine_item_id"):
+            entry["routine_items"][exercise["routine_item_id"]] = performance
+    return entries
+
+
+def merge_entry(current: Optional[dict], newer: dict) -> dict:
+    """Combine a stored entry with one from another session, latest wins."""
+    if current is None:
+        return newer
+
+    def later(a: dict, b: dict) -> bool:
+        return a["finished_at"] >= b["finished_at"]
+
+    merged = {**current, "routine_items": dict(current.get("routine_items", {}))}
+    if later(newer, current):
+        merged.update({k: v for k, v in newer.items() if k != "routine_items"})
+    for item_id, performance in newer["routine_items"].items():
+        stored = merged["routine_items"].get(item_id)
+        if stored is None or later(performance, stored):
+            merged["routine_items"][item_id] = performance
+    return merged
+
+
+def previous_performance(
+    entry: Optional[dict], routine_item_id: Optional[str] = None
+) -> Optional[dict]:
+    """What was done last time: for the routine item if known, else the exercise."""
+    if entry is None:
+        return None
+    performance = entry.get("routine_items", {}).get(routine_item_id) or entry
+    return {
+        "session_id": performance["session_id"],
+        "date": performance["date"],
+        "sets": performance["sets"],
+    }
+
+
+class LastPerformanceIndex:
+    """The sets a user last did for each exercise and routine item.
+
+    One document per exercise, updated from each session as it finishes, so
+    prefilling a new exercise needs a single document read rather than a
+    scan of recent sessions. Entries are a copy of the sets; deleting the
+    session they came from does not remove them.
+    """
+
+    def __init__(self, fs: FirestoreService):
+        self._fs = fs
+
+    def ref(self, user_id: str, exercise_id: str):
+        return self._fs.get_user_collection(user_id, COLLECTION).document(exercise_id)
+
+    def get_many(self, user_id: str, exercise_ids: Iterable[str]) -> dict[str, dict]:
+        """Entries for several exercises in one batched read."""
+        refs = [self.ref(user_id, exercise_id) for exercise_id in set(exercise_ids)]
+        if not refs:
+            return {}
+        return {
+            doc.id: doc.to_dict()
+            for doc in self._fs.read(self._fs.db.get_all, refs)
+            if doc.exists
+        }
+
+    def record_session(self, user_id: str, session: dict) -> int:
+        """Update the index from a finished session; returns entries written."""
+        entries = session_entries(session)
+        stored = self.get_many(user_id, entries)
+        batch = self._fs.db.batch()
+        for exercise_id, entry in entries.items():
+            batch.set(
+                self.ref(user_id, exercise_id),
+                merge_entry(stored.get(exercise_id), entry),
+            )
+        if entries:
+            self._fs.write(batch.commit)
+        return len(entries)
+
+    def delete(self, user_id: str, exercise_id: str):
+        self._fs.write(self.ref(user_id, exercise_id).delete)
+
+
+def get_last_performance_index() -> LastPerformanceIndex:
+    return LastPerformanceIndex(get_firestore_service())
@@ -0,0 +1,64 @@
+import asyncio
+
+from ..config import settings
+from ..models.session import SessionEvent, SessionEventType
+from .metrics import metrics
+
+
+class SessionHub:
+    """In-process pub/sub that fans session changes out to live subscribers.
+
+    Session write paths publish a ``SessionEvent`` after they commit; each
+    subscriber receives it on its own bounded queue. A subscriber that falls
+    behind gets its backlog replaced by a single ``resync`` event telling it
+    to re-fetch the session.
+    """
+
+    def __init__(self, queue_size: int = settings.LIVE_QUEUE_SIZE):
+        self._queue_size = queue_size
+        self._subscribers: dict[tuple[str, str], set[asyncio.Queue]] = {}
+        metrics.gauge("live.subscribers", self.subscriber_count)
+
+    def subscribe(self, user_id: str, session_id: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self._queue_size)
+        self._subscribers.setdefault((user_id, session_id), set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: str, session_id: str, queue: asyncio.Queue):
+        key = (user_id, session_id)
+        queues = self._subscribers.get(key)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[key]
+
+    def publish(self, user_id: str, event: SessionEvent):
+        """Deliver an event to every subscriber of the event's session.
+
+        Must be called from the event loop thread.
+        """
+        queues = self._subscribers.get((user_id, event.session_id))
+        if not queues:
+            return
+        metrics.incr("live.events_published")
+        for queue in queues:
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                metrics.incr("live.resyncs")
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(
+                    SessionEvent(
+                        type=SessionEventType.RESYNC,
+                        session_id=event.session_id,
+                        updated_at=event.updated_at,
+                    )
+                )
+
+    def subscriber_count(self) -> int:
+        return sum(len(queues) for queues in self._subscribers.values())
+
+
+live_sessions = SessionHub()
@@ -0,0 +1,80 @@
+from .bulk_delete import BulkDeleter, deletion_jobs
+from .calendar import get_training_calendar
+from .exercise_search import exercise_search
+from .firestore import get_firestore_service
+from .job_queue import job_handler, job_id
+from .last_performance import get_last_performance_index
+from .metrics import metrics
+from .profiles import profiles
+from .session_store import get_session_store
+
+# Job kinds, enqueued with ``job_queue.enqueue(user_id, kind, payload, key)``
+EXERCISE_RENAMED = "exercise_renamed"
+EXERCISE_DELETED = "exercise_deleted"
+SESSION_FINISHED = "session_finished"
+CALENDAR_CHANGED = "calendar_changed"
+# Enqueued with the user ID as its key
+ACCOUNT_DELETED = "account_deleted"
+
+
+@job_handler(EXERCISE_RENAMED)
+def rename_exercise(user_id: str, payload: dict):
+    """Store a renamed exercise's new name on past sessions.
+
+    Payload: ``exercise_id``. The name is read when the job runs, so
+    several renames in a row need only one pass.
+    """
+    get_session_store().flush_all(user_id)
+    counts = BulkDeleter(get_firestore_service()).rename_exercise_references(
+        user_id, payload["exercise_id"]
+    )
+    metrics.incr("jobs.sessions_renamed", counts["sessions"])
+
+
+@job_handler(EXERCISE_DELETED)
+def delete_exercise_references(user_id: str, payload: dict):
+    """Remove a deleted exercise from routines, and sessions if asked.
+
+    Payload: ``exercise_id`` and ``include_sessions``.
+    """
+    if payload["include_sessions"]:
+        get_session_store().flush_all(user_id)
+    BulkDeleter(get_firestore_service()).delete_exercise_references(
+        user_id, payload["exercise_id"], payload["include_sessions"]
+    )
+    get_last_performance_index().delete(user_id, payload["exercise_id"])
+
+
+@job_handler(SESSION_FINISHED)
+def index_finished_session(user_id: str, payload: dict):
+    """Record a finished session's sets in the last-performance index.
+
+    Payload: ``session_id``. Sessions deleted or reopened since are skipped.
+    """
+    session = get_session_store().get(user_id, payload["session_id"])
+    if session is None or not session.get("end_time"):
+        return
+    get_last_performance_index().record_session(user_id, session)
+
+
+@job_handler(CALENDAR_CHANGED)
+def update_calendar(user_id: str, payload: dict):
+    """Bring the training calendar up to date with a session.
+
+    Payload: ``session_id``. The session is read when the job runs, so a
+    create and finish in quick succession need only one update.
+    """
+    session = get_session_store().get(user_id, payload["session_id"])
+    get_training_calendar().record_session(user_id, payload["session_id"], session)
+
+
+@job_handler(ACCOUNT_DELETED)
+def delete_account(user_id: str, payload: dict):
+    """Delete all of a user's data, reporting progress through ``deletion_jobs``.
+
+    Payload: none. The user's other outstanding jobs are dropped.
+    """
+    deletion_jobs.run(user_id, keep_job=job_id(user_id, ACCOUNT_DELETED, user_id))
+    # Reads made while the deletion ran may have cached what it deleted.
+    exercise_search.forget(user_id)
+    profiles.forget(user_id)
@@ -0,0 +1,46 @@
+import threading
+from collections import defaultdict
+from typing import Callable
+
+
+class Metrics:
+    """In-process counters and gauges exposed on the ``/metrics`` endpoint."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: dict[str, int] = defaultdict(int)
+        self._gauges: dict[str, Callable[[], float]] = {}
+        self._summaries: dict[str, list[float]] = {}
+
+    def incr(self, name: str, value: int = 1):
+        with self._lock:
+            self._counters[name] += value
+
+    def observe(self, name: str, value: float):
+        """Record a sample; reported as ``name.count``, ``.sum`` and ``.max``."""
+        with self._lock:
+            summary = self._summaries.get(name)
+            if summary is None:
+                self._summaries[name] = [1, value, value]
+            else:
+                summary[0] += 1
+                summary[1] += value
+                summary[2] = max(summary[2], value)
+
+    def gauge(self, name: str, fn: Callable[[], float]):
+        """Register a gauge whose value is computed when metrics are read."""
+        self._gauges[name] = fn
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            data: dict = dict(self._counters)
+            for name, (count, total, largest) in self._summaries.items():
+                data[f"{name}.count"] = count
+                data[f"{name}.sum"] = total
+                data[f"{name}.max"] = largest
+        for name, fn in self._gauges.items():
+            data[name] = fn()
+        return dict(sorted(data.items()))
+
+
+metrics = Metrics()
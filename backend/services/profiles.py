@@ -0,0 +1,136 @@
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Optional
+
+from google.api_core.exceptions import AlreadyExists, NotFound
+
+from ..config import settings
+from .cache import get_cache
+from .firestore import get_firestore_service
+from .metrics import metrics
+
+if TYPE_CHECKING:
+    from ..auth import AuthenticatedUser
+
+# Profile fields brought in step with the ID token's claims at sign-in. The
+# display name is only taken from the token when the profile is created,
+# since users can change it.
+TOKEN_FIELDS = {"email": "email", "photo_url": "picture"}
+
+
+class Profiles:
+    """User profiles, created at sign-in and kept in the shared cache.
+
+    Only sign-in writes a new profile, with ``create()``, so signing in
+    twice, or two requests racing to sign in, never overwrite a profile;
+    reads of a missing profile find nothing. Loaded profiles are cached for
+    ``ttl`` seconds under ``profile:{uid}``, and updates are written
+    through, invalidating every worker's copy.
+    """
+
+    def __init__(self, ttl: float = settings.CACHE_TTL_SECONDS):
+        self._ttl = ttl
+
+    @staticmethod
+    def _key(user_id: str) -> str:
+        return f"profile:{user_id}"
+
+    def cached(self, user_id: str) -> Optional[dict]:
+        return get_cache().get(self._key(user_id))
+
+    def forget(self, user_id: str):
+        get_cache().invalidate(self._key(user_id))
+
+    def get(self, user_id: str) -> Optional[dict]:
+        """The user's profile, or None if they have not signed in yet.
+
+        Costs one read unless cached; never writes.
+        """
+        return self._get(user_id, lambda: self._read(user_id))
+
+    def sign_in(self, user: "AuthenticatedUser") -> dict:
+        """The user's profile, created from their token claims if absent.
+
+        The stored email and picture are brought in step with the token.
+        Costs one read, plus a write the first time or when a claim has
+        changed, unless cached.
+        """
+        return self._sync(user, self._get(user.uid, lambda: self._load(user)))
+
+    def _get(self, user_id: str, load) -> Optional[dict]:
+        cache = get_cache()
+        profile = cache.get(self._key(user_id))
+        if profile is not None:
+            metrics.incr("profiles.hits")
+            return profile
+        metrics.incr("profiles.misses")
+        version = cache.version(self._key(user_id))
+        profile = load()
+        if profile is not None:
+            cache.set(self._key(user_id), profile, version, self._ttl)
+        return profile
+
+    def _read(self, user_id: str) -> Optional[dict]:
+        fs = get_firestore_service()
+        doc = fs.read(fs.get_user_doc(user_id).get)
+        if not doc.exists:
+            return None
+        return {**doc.to_dict(), "uid": user_id}
+
+    def _load(self, user: "AuthenticatedUser") -> dict:
+        data = self._read(user.uid)
+        if data is None:
+            fs = get_firestore_service()
+            ref = fs.get_user_doc(user.uid)
+            now = datetime.now(timezone.utc)
+            data = {
+                "uid": user.uid,
+                "email": user.email,
+                "display_name": user.name,
+                "photo_url": user.picture,
+                "height_cm": None,
+                "created_at": now,
+                "updated_at": now,
+            }
+            try:
+                fs.write(ref.create, data)
+            except AlreadyExists:
+                # Created by a concurrent sign-in; theirs stands.
+                data = fs.read(ref.get).to_dict()
+        data["uid"] = user.uid
+        return data
+
+    def _sync(self, user: "AuthenticatedUser", profile: dict) -> dict:
+        changes = {}
+        for field, claim in TOKEN_FIELDS.items():
+            value = getattr(user, claim)
+            if value is not None and profile.get(field) != value:
+                changes[field] = value
+        if not changes:
+            return profile
+        return self._write(user.uid, profile, changes)
+
+    def update(self, user_id: str, changes: dict) -> Optional[dict]:
+        """Apply ``changes`` to the profile; None if there is no profile."""
+        profile = self.get(user_id)
+        if profile is None:
+            return None
+        try:
+            return self._write(user_id, profile, changes)
+        except NotFound:
+            # Deleted since it was cached.
+            return None
+
+    def _write(self, user_id: str, profile: dict, changes: dict) -> dict:
+        fs = get_firestore_service()
+        changes = {**changes, "updated_at": datetime.now(timezone.utc)}
+        try:
+            fs.write(fs.get_user_doc(user_id).update, changes)
+        except NotFound:
+            self.forget(user_id)
+            raise
+        profile = {**profile, **changes}
+        get_cache().put(self._key(user_id), profile, self._ttl)
+        return profile
+
+
+profiles = Profiles()
@@ -0,0 +1,109 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi import Depends, HTTPException, status
+
+from ..auth import AuthenticatedUser, get_current_user
+from ..config import settings
+from .metrics import metrics
+
+
+class RateLimiter:
+    """Per-user token buckets plus a cap on concurrent requests.
+
+    Each user has a bucket of ``burst`` tokens refilled at ``rate`` tokens
+    per second; a request takes one token. State is a tuple per active user,
+    kept in least-recently-used order so buckets that have been idle long
+    enough to refill completely can be dropped from the front. A ``rate``
+    of 0 turns the buckets off; the concurrency cap still applies.
+    """
+
+    def __init__(
+        self,
+        rate: float = settings.RATE_LIMIT_PER_SECOND,
+        burst: int = settings.RATE_LIMIT_BURST,
+        max_concurrent: int = settings.RATE_LIMIT_MAX_CONCURRENT,
+    ):
+        self._rate = rate
+        self._burst = burst
+        self._max_concurrent = max_concurrent
+        self._idle_after = burst / rate if rate > 0 else 0
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self._in_flight: dict[str, int] = {}
+        self._lock = threading.Lock()
+        metrics.gauge("rate_limit.active_users", lambda: len(self._buckets))
+
+    def take(self, user_id: str) -> float:
+        """Take a token for ``user_id``.
+
+        Returns 0 on success, or the seconds until a token is available.
+        """
+        if self._rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(user_id, (self._burst, now))
+            tokens = min(self._burst, tokens + (now - updated) * self._rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self._rate
+            self._buckets[user_id] = (tokens, now)
+
+            # Forget users whose buckets would be full again anyway.
+            while self._buckets:
+                oldest, (_, seen) = next(iter(self._buckets.items()))
+                if now - seen < self._idle_after:
+                    break
+                del self._buckets[oldest]
+            return wait
+
+    def acquire(self, user_id: str) -> bool:
+        """Claim a concurrent request slot; False if the user has none left."""
+        with self._lock:
+            count = self._in_flight.get(user_id, 0)
+            if count >= self._max_concurrent:
+                return False
+            self._in_flight[user_id] = count + 1
+            return True
+
+    def release(self, user_id: str):
+        with self._lock:
+            count = self._in_flight.pop(user_id, 1) - 1
+            if count > 0:
+                self._in_flight[user_id] = count
+
+
+rate_limiter = RateLimiter()
+
+
+async def rate_limit(user: AuthenticatedUser = Depends(get_current_user)):
+    """Apply the per-user rate limit and concurrency cap to a request.
+
+    This is a dependency rather than middleware because limits are keyed by
+    the verified uid, which is only known once the token has been checked.
+    Use it with ``scope="function"`` so the slot is released as soon as the
+    endpoint returns, not when a streamed response finishes.
+    """
+    wait = rate_limiter.take(user.uid)
+    if wait:
+        metrics.incr("rate_limit.throttled")
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many requests",
+            headers={"Retry-After": str(math.ceil(wait))},
+        )
+    if not rate_limiter.acquire(user.uid):
+        metrics.incr("rate_limit.concurrency_rejected")
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many concurrent requests",
+            headers={"Retry-After": "1"},
+        )
+    try:
+        yield
+    finally:
+        rate_limiter.release(user.uid)
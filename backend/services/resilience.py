@@ -0,0 +1,126 @@
+import random
+import threading
+import time
+from collections import deque
+from enum import Enum
+from typing import Iterator
+
+from google.api_core import exceptions
+
+from .metrics import metrics
+
+# Errors that say the backend is struggling rather than that the request was
+# wrong. Reads that fail with one of these are retried.
+TRANSIENT_ERRORS = (
+    exceptions.Aborted,
+    exceptions.DeadlineExceeded,
+    exceptions.InternalServerError,
+    exceptions.ResourceExhausted,
+    exceptions.ServiceUnavailable,
+)
+
+# Transient errors that count against the circuit breaker. ABORTED means
+# contention on a document, not an unhealthy backend.
+BREAKER_ERRORS = tuple(e for e in TRANSIENT_ERRORS if e is not exceptions.Aborted)
+
+
+class FirestoreUnavailable(Exception):
+    """Firestore could not serve a call; mapped to 503 by the app."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def backoff_delays(attempts: int, base: float, maximum: float) -> Iterator[float]:
+    """Delays before each retry: exponential backoff with full jitter."""
+    for attempt in range(attempts - 1):
+        yield random.uniform(0, min(maximum, base * 2**attempt))
+
+
+class BreakerState(str, Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Stops sending calls to a backend whose error rate is too high.
+
+    The breaker opens once at least ``min_calls`` calls in the last
+    ``window`` seconds failed at ``failure_rate`` or more. While open, calls
+    are rejected immediately. After ``reset_timeout`` seconds one probe call
+    is let through; its result closes the breaker or opens it again.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_rate: float,
+        min_calls: int,
+        window: float,
+        reset_timeout: float,
+    ):
+        self._name = name
+        self._failure_rate = failure_rate
+        self._min_calls = min_calls
+        self._window = window
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._results: deque[tuple[float, bool]] = deque()
+        self._state = BreakerState.CLOSED
+        self._opened_at = 0.0
+        self._probing = False
+        metrics.gauge(f"{name}.breaker_open", self._is_open)
+
+    @property
+    def state(self) -> BreakerState:
+        return self._state
+
+    def _is_open(self) -> float:
+        return float(self._state != BreakerState.CLOSED)
+
+    def allow(self) -> bool:
+        """Whether a call may go ahead now."""
+        with self._lock:
+            if self._state == BreakerState.CLOSED:
+                return True
+            if self._state == BreakerState.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self._state = BreakerState.HALF_OPEN
+                self._probing = False
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record(self, ok: bool):
+        now = time.monotonic()
+        with self._lock:
+            if self._state == BreakerState.HALF_OPEN:
+                if ok:
+                    self._state = BreakerState.CLOSED
+                    self._results.clear()
+                else:
+                    self._trip(now)
+                self._probing = False
+                return
+            if self._state == BreakerState.OPEN:
+                # A call that started before the breaker opened
+                return
+
+            self._results.append((now, ok))
+            while self._results and self._results[0][0] < now - self._window:
+                self._results.popleft()
+            if len(self._results) < self._min_calls:
+                return
+            failures = sum(1 for _, result in self._results if not result)
+            if failures / len(self._results) >= self._failure_rate:
+                self._trip(now)
+
+    def _trip(self, now: float):
+        self._state = BreakerState.OPEN
+        self._opened_at = now
+        self._results.clear()
+        metrics.incr(f"{self._name}.breaker_trips")
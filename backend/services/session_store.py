@@ -0,0 +1,367 @@
+import asyncio
+import copy
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Optional
+
+from google.api_core.exceptions import NotFound
+
+from ..config import settings
+from .firestore import FirestoreService, get_firestore_service
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Subcollection holding performed exercises spilled out of a long session.
+SHARDS = "shards"
+
+
+class SessionNotFound(LookupError):
+    pass
+
+
+class PerformedExerciseNotFound(LookupError):
+    pass
+
+
+class PerformedExerciseTooLarge(ValueError):
+    """A performed exercise would outgrow what one document can hold."""
+
+
+def estimate_size(value: Any) -> int:
+    """Approximate Firestore storage size of a value, in bytes.
+
+    Follows Firestore's documented sizing rules closely enough to keep
+    session documents well away from the 1 MiB limit.
+    """
+    if value is None or isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float, datetime)):
+        return 8
+    if isinstance(value, str):
+        return len(value.encode()) + 1
+    if isinstance(value, dict):
+        return sum(len(k.encode()) + 1 + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_size(v) for v in value)
+    # Dates and anything else stored as a scalar
+    return 8
+
+
+class SessionStore:
+    """Reads and writes workout session documents.
+
+    A session's performed exercises normally live in the session document.
+    When a write would take the document past ``shard_threshold`` bytes, all
+    but the most recent exercise are moved into a new document under the
+    session's ``shards`` subcollection, so each write only rewrites a
+    bounded amount of data. ``shard_index`` on the session maps a spilled
+    exercise ID to its shard; reads put the pieces back together.
+
+    Exercises are never split, so a set is refused if it would take its
+    exercise past half the threshold, or the shard holding it past one and
+    a half times the threshold. No document then grows much beyond one and
+    a half times the threshold, however long the session.
+
+    Mutations of one session are serialized by a lock of its own, held
+    across the read-modify-write; different sessions do not wait on each
+    other.
+
+    With a ``flush_window`` (write-behind), added exercises and sets are
+    applied to an in-memory copy of the session and written to Firestore
+    together once the window has passed, instead of one read-modify-write
+    per mutation. Reads through the store see the buffered state. Other
+    writers must call ``flush`` before touching the session document, and
+    ``flush_all`` must run on shutdown. Buffered changes only live in this
+    process, so write-behind is for single-instance deployments.
+    """
+
+    def __init__(
+        self,
+        fs: FirestoreService,
+        shard_threshold: int = settings.SESSION_SHARD_THRESHOLD_BYTES,
+        flush_window: float = settings.SESSION_WRITE_BEHIND_SECONDS,
+    ):
+        self._fs = fs
+        self._shard_threshold = shard_threshold
+        self._flush_window = flush_window
+        # Buffered session documents by path; only used with write-behind
+        self._buffered: dict[str, dict] = {}
+        # Per-session locks by path, with the number of threads using each
+        self._session_locks: dict[str, list] = {}
+        # Guards the two dicts above; never held while calling Firestore
+        self._lock = threading.Lock()
+        # Flushes running in a thread, referenced until they finish
+        self._flush_tasks: set[asyncio.Task] = set()
+        metrics.gauge("sessions.buffered", lambda: len(self._buffered))
+
+    def ref(self, user_id: str, session_id: str):
+        return self._fs.get_user_collection(user_id, "sessions").document(session_id)
+
+    @contextmanager
+    def _locked(self, ref):
+        """Hold the lock of one session, dropping it once nobody uses it."""
+        with self._lock:
+            entry = self._session_locks.get(ref.path)
+            if entry is None:
+                entry = self._session_locks[ref.path] = [threading.RLock(), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._session_locks[ref.path]
+
+    def get(self, user_id: str, session_id: str) -> Optional[dict]:
+        """Read a whole session, or None if it does not exist."""
+        ref = self.ref(user_id, session_id)
+        data = self._buffered_copy(ref)
+        if data is None:
+            doc = self._fs.read(ref.get)
+            if not doc.exists:
+                return None
+            data = doc.to_dict()
+        return self._assemble(ref, data)
+
+    def assemble(self, doc) -> dict:
+        """Session data from a snapshot, with spilled exercises merged back in."""
+        data = self._buffered_copy(doc.reference)
+        if data is None:
+            data = doc.to_dict()
+        return self._assemble(doc.reference, data)
+
+    def _assemble(self, ref, data: dict) -> dict:
+        data.pop("shard_count", None)
+        if data.pop("shard_index", None):
+            shards = sorted(
+                self._fs.query(ref.collection(SHARDS)),
+                key=lambda s: int(s.id),
+            )
+            spilled = [e for shard in shards for e in shard.get("performed_exercises")]
+            data["performed_exercises"] = spilled + data.get("performed_exercises", [])
+        data["id"] = ref.id
+        return data
+
+    def add_exercise(self, user_id: str, session_id: str, exercise: dict) -> dict:
+        """Append a performed exercise, assigning its order.
+
+        Returns the fields written to the session document.
+        """
+        ref = self.ref(user_id, session_id)
+        with self._locked(ref):
+            data = self._load(ref)
+            performed = data.setdefault("performed_exercises", [])
+            exercise["order"] = len(data.get("shard_index", {})) + len(performed)
+            performed.append(exercise)
+            return self._save(ref, data, performed, self._fs.db.batch())
+
+    def add_set(
+        self,
+        user_id: str,
+        session_id: str,
+        performed_exercise_id: str,
+        build_set: Callable[[int], dict],
+    ) -> tuple[dict, dict]:
+        """Append a set built by ``build_set(set_number)`` to an exercise.
+
+        Returns the new set and the fields written to the session document.
+        """
+        ref = self.ref(user_id, session_id)
+        with self._locked(ref):
+            data = self._load(ref)
+            performed = data.setdefault("performed_exercises", [])
+            batch = self._fs.db.batch()
+            shard = None
+
+            exercise = _find(performed, performed_exercise_id)
+            if exercise is None:
+                # Going back to an exercise that has been spilled: update its
+                # shard. This is written straight away with the session.
+                shard_no = data.get("shard_index", {}).get(performed_exercise_id)
+                if shard_no is None:
+                    raise PerformedExerciseNotFound(performed_exercise_id)
+                shard_ref = ref.collection(SHARDS).document(str(shard_no))
+                shard = self._fs.read(shard_ref.get).to_dict()
+                exercise = _find(shard["performed_exercises"], performed_exercise_id)
+                batch.set(shard_ref, shard)
+
+            sets = exercise.setdefault("sets", [])
+            new_set = build_set(len(sets) + 1)
+            sets.append(new_set)
+            if estimate_size(exercise) > self._shard_threshold // 2 or (
+                shard is not None
+                and estimate_size(shard) > self._shard_threshold * 3 // 2
+            ):
+                sets.pop()
+                metrics.incr("sessions.exercises_too_large")
+                raise PerformedExerciseTooLarge(performed_exercise_id)
+            return new_set, self._save(ref, data, performed, batch)
+
+    def delete(self, user_id: str, session_id: str) -> bool:
+        """Delete a session and its shards. Returns False if it did not exist."""
+        ref = self.ref(user_id, session_id)
+        with self._locked(ref):
+            with self._lock:
+                self._buffered.pop(ref.path, None)
+            doc = self._fs.read(ref.get)
+            if not doc.exists:
+                return False
+
+            batch = self._fs.db.batch()
+            if doc.to_dict().get("shard_count"):
+                shards = self._fs.read(ref.collection(SHARDS).list_documents)
+                for shard_ref in shards:
+                    batch.delete(shard_ref)
+            batch.delete(ref)
+            self._fs.write(batch.commit)
+            return True
+
+    def flush(self, user_id: str, session_id: str):
+        """Write any buffered changes to a session to Firestore."""
+        self._flush(self.ref(user_id, session_id))
+
+    def flush_all(self, user_id: Optional[str] = None):
+        """Write every buffered session, or every one of a user's.
+
+        Call on shutdown, and before changing a user's sessions in bulk.
+        """
+        prefix = f"users/{user_id}/" if user_id else ""
+        with self._lock:
+            refs = [
+                data["_ref"]
+                for path, data in self._buffered.items()
+                if path.startswith(prefix)
+            ]
+        for ref in refs:
+            try:
+                self._flush(ref)
+            except Exception:
+                metrics.incr("sessions.flush_errors")
+                logger.exception("Could not flush buffered session %s", ref.path)
+
+    def _buffered_copy(self, ref) -> Optional[dict]:
+        if ref.path not in self._buffered:
+            return None
+        with self._locked(ref):
+            data = self._buffered.get(ref.path)
+            if data is None:
+                return None
+            return copy.deepcopy({k: v for k, v in data.items() if k != "_ref"})
+
+    def _load(self, ref) -> dict:
+        """Session document data to mutate: the buffered copy if there is one."""
+        data = self._buffered.get(ref.path)
+        if data is not None:
+            return data
+        doc = self._fs.read(ref.get)
+        if not doc.exists:
+            raise SessionNotFound(ref.id)
+        return doc.to_dict()
+
+    def _save(self, ref, data: dict, performed: list[dict], batch) -> dict:
+        stamp = {
+            "updated_at": datetime.now(timezone.utc),
+            "version": data.get("version", 0) + 1,
+        }
+        if self._flush_window > 0 and not len(batch):
+            data.update(performed_exercises=performed, **stamp)
+            if ref.path not in self._buffered:
+                data["_ref"] = ref
+                with self._lock:
+                    self._buffered[ref.path] = data
+                self._schedule_flush(ref)
+            metrics.incr("sessions.buffered_writes")
+            return {"performed_exercises": performed, **stamp}
+
+        update = self._commit(ref, data, performed, batch, stamp)
+        with self._lock:
+            self._buffered.pop(ref.path, None)
+        return update
+
+    def _schedule_flush(self, ref):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Not called from a request, e.g. a script: nothing will flush
+            # later, so write now.
+            self._flush(ref)
+            return
+
+        async def flush_in_thread():
+            try:
+                # The commit blocks, so keep it off the event loop.
+                await asyncio.to_thread(self._flush, ref)
+            except Exception:
+                metrics.incr("sessions.flush_errors")
+                logger.exception("Could not flush buffered session %s", ref.path)
+                loop.call_later(self._flush_window, flush_later)
+
+        def flush_later():
+            task = loop.create_task(flush_in_thread())
+            self._flush_tasks.add(task)
+            task.add_done_callback(self._flush_tasks.discard)
+
+        loop.call_later(self._flush_window, flush_later)
+
+    def _flush(self, ref):
+        with self._locked(ref):
+            data = self._buffered.get(ref.path)
+            if data is None:
+                return
+            stamp = {"updated_at": data["updated_at"], "version": data["version"]}
+            try:
+                self._commit(
+                    ref, data, data["performed_exercises"], self._fs.db.batch(), stamp
+                )
+            except NotFound:
+                # Deleted behind our back, e.g. with the whole account
+                logger.warning("Dropping buffered changes to deleted %s", ref.path)
+            with self._lock:
+                del self._buffered[ref.path]
+            metrics.incr("sessions.flushes")
+
+    def _commit(self, ref, data: dict, performed: list[dict], batch, stamp) -> dict:
+        update = {"performed_exercises": performed, **stamp}
+
+        size = estimate_size({**data, **update})
+        if size > self._shard_threshold and len(performed) > 1:
+            # Keep the exercise being worked on in the session document.
+            spilled, kept = performed[:-1], performed[-1:]
+            shard_no = data.get("shard_count", 0)
+            batch.set(
+                ref.collection(SHARDS).document(str(shard_no)),
+                {"performed_exercises": spilled},
+            )
+            update["performed_exercises"] = kept
+            update["shard_count"] = shard_no + 1
+            update["shard_index"] = {
+                **data.get("shard_index", {}),
+                **{exercise["id"]: shard_no for exercise in spilled},
+            }
+            metrics.incr("sessions.shard_spills")
+
+        batch.update(ref, update)
+        self._fs.write(batch.commit)
+        return update
+
+
+def _find(performed: list[dict], performed_exercise_id: str) -> Optional[dict]:
+    for exercise in performed:
+        if exercise.get("id") == performed_exercise_id:
+            return exercise
+    return None
+
+
+_session_store: Optional[SessionStore] = None
+
+
+def get_session_store() -> SessionStore:
+    global _session_store
+    if _session_store is None:
+        _session_store = SessionStore(get_firestore_service())
+    return _session_store
@@ -0,0 +1,68 @@
+import asyncio
+from typing import Any, Callable, Hashable
+
+from starlette.concurrency import run_in_threadpool
+
+from .metrics import metrics
+
+
+class SingleFlight:
+    """Share one in-flight call between concurrent identical reads.
+
+    Calls are keyed by a scope (the user ID) and a key describing the read.
+    Every write for a scope must call ``invalidate`` once it has committed:
+    reads that start afterwards then get a fresh call instead of joining one
+    that may have started before the write.
+    """
+
+    def __init__(self, name: str = "singleflight"):
+        self._name = name
+        self._generations: dict[str, int] = {}
+        self._inflight: dict[tuple, asyncio.Future] = {}
+        self._calls = 0
+        self._coalesced = 0
+        metrics.gauge(f"{name}.coalesce_rate", self.coalesce_rate)
+
+    async def do(self, scope: str, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """Run ``fn`` in the threadpool, or wait for an identical running call."""
+        flight_key = (scope, self._generations.get(scope, 0), key)
+        self._calls += 1
+        metrics.incr(f"{self._name}.calls")
+
+        task = self._inflight.get(flight_key)
+        if task is not None:
+            self._coalesced += 1
+            metrics.incr(f"{self._name}.coalesced")
+        else:
+            task = asyncio.ensure_future(run_in_threadpool(fn))
+            self._inflight[flight_key] = task
+            task.add_done_callback(lambda t: self._finish(flight_key, t))
+
+        # Shield so one caller disconnecting does not cancel the shared call.
+        return await asyncio.shield(task)
+
+    def invalidate(self, scope: str):
+        """Stop new reads in ``scope`` from joining calls already in flight."""
+        if self._has_inflight(scope):
+            self._generations[scope] = self._generations.get(scope, 0) + 1
+
+    def coalesce_rate(self) -> float:
+        return self._coalesced / self._calls if self._calls else 0.0
+
+    def _has_inflight(self, scope: str) -> bool:
+        return any(key[0] == scope for key in self._inflight)
+
+    def _finish(self, flight_key: tuple, task: asyncio.Future):
+        if self._inflight.get(flight_key) is task:
+            del self._inflight[flight_key]
+        scope = flight_key[0]
+        if not self._has_inflight(scope):
+            # Generations only matter while calls are in flight; dropping them
+            # keeps memory bounded by the number of active users.
+            self._generations.pop(scope, None)
+        if not task.cancelled():
+            # Mark the exception as retrieved when every caller went away.
+            task.exception()
+
+
+single_flight = SingleFlight()
@@ -0,0 +1,354 @@
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+import urllib.request
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Iterable, Optional, TypeVar
+
+from pydantic import BaseModel
+
+from ..config import settings
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# W3C trace context: version-trace ID-parent ID-flags
+TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+SAMPLED = 0x01
+
+Model = TypeVar("Model", bound=BaseModel)
+
+
+class Span:
+    """A timed operation within a trace, with attributes."""
+
+    __slots__ = (
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "name",
+        "kind",
+        "trace_state",
+        "attributes",
+        "error",
+        "start_ns",
+        "end_ns",
+        "_tracer",
+        "_token",
+    )
+    recording = True
+
+    def __init__(
+        self,
+        tracer: "Tracer",
+        name: str,
+        trace_id: str,
+        parent_id: Optional[str] = None,
+        kind: str = "internal",
+        trace_state: Optional[str] = None,
+        attributes: Optional[dict] = None,
+    ):
+        self._tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.kind = kind
+        self.trace_state = trace_state
+        self.attributes = attributes or {}
+        self.error: Optional[str] = None
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self._token = None
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{SAMPLED:02x}"
+
+    def set(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def end(self):
+        if not self.end_ns:
+            self.end_ns = time.time_ns()
+            self._tracer.processor.add(self)
+
+    def __enter__(self) -> "Span":
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None and self.error is None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        _current.reset(self._token)
+        self.end()
+
+
+class _NoopSpan:
+    """Stands in for a span when the request is not traced."""
+
+    recording = False
+    traceparent = None
+
+    def set(self, key: str, value: Any):
+        pass
+
+    def end(self):
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+_current: ContextVar[Optional[Span]] = ContextVar("span", default=None)
+
+
+class SpanExporter:
+    """Where finished spans go."""
+
+    def export(self, spans: list[Span]):
+        raise NotImplementedError
+
+
+class FileSpanExporter(SpanExporter):
+    """Spans appended to a file as JSON lines."""
+
+    def __init__(self, path: str = settings.TRACING_FILE):
+        self._path = path
+
+    def export(self, spans: list[Span]):
+        with open(self._path, "a") as f:
+            for span in spans:
+                f.write(json.dumps({
+                    "trace_id": span.trace_id,
+                    "span_id": span.span_id,
+                    "parent_id": span.parent_id,
+                    "name": span.name,
+                    "kind": span.kind,
+                    "start_ns": span.start_ns,
+                    "duration_ms": (span.end_ns - span.start_ns) / 1e6,
+                    "attributes": span.attributes,
+                    "error": span.error,
+                }, default=str) + "\n")
+
+
+def _otlp_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class OtlpSpanExporter(SpanExporter):
+    """Spans posted to an OpenTelemetry collector as OTLP/HTTP JSON."""
+
+    KINDS = {"internal": 1, "server": 2}
+
+    def __init__(
+        self,
+        endpoint: str = settings.TRACING_OTLP_ENDPOINT,
+        service_name: str = settings.TRACING_SERVICE_NAME,
+    ):
+        self._url = endpoint.rstrip("/") + "/v1/traces"
+        self._resource = {
+            "attributes": [
+                {"key": "service.name", "value": {"stringValue": service_name}}
+            ]
+        }
+
+    def export(self, spans: list[Span]):
+        body = {
+            "resourceSpans": [{
+                "resource": self._resource,
+                "scopeSpans": [{
+                    "scope": {"name": "backend"},
+                    "spans": [self._span(span) for span in spans],
+                }],
+            }]
+        }
+        request = urllib.request.Request(
+            self._url,
+            data=json.dumps(body).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(request, timeout=10) as response:
+            response.read()
+
+    def _span(self, span: Span) -> dict:
+        data = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": self.KINDS[span.kind],
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": [
+                {"key": key, "value": _otlp_value(value)}
+                for key, value in span.attributes.items()
+            ],
+            "status": {"code": 2, "message": span.error} if span.error else {},
+        }
+        if span.parent_id:
+            data["parentSpanId"] = span.parent_id
+        if span.trace_state:
+            data["traceState"] = span.trace_state
+        return data
+
+
+class SpanProcessor:
+    """Hands finished spans to an exporter in batches, off the request path.
+
+    At most ``max_queue`` spans wait; more are dropped and counted under
+    ``tracing.dropped_spans``. A batch goes out every ``interval`` seconds,
+    or sooner once ``batch_size`` spans are waiting.
+    """
+
+    def __init__(
+        self,
+        exporter: SpanExporter,
+        interval: float = 1.0,
+        batch_size: int = 512,
+        max_queue: int = 8192,
+    ):
+        self._exporter = exporter
+        self._interval = interval
+        self._batch_size = batch_size
+        self._queue: deque[Span] = deque()
+        self._max_queue = max_queue
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def add(self, span: Span):
+        if len(self._queue) >= self._max_queue:
+            metrics.incr("tracing.dropped_spans")
+            return
+        self._queue.append(span)
+        if len(self._queue) >= self._batch_size:
+            self._wake.set()
+
+    def _run(self):
+        while not self._stopped:
+            self._wake.wait(self._interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        """Export every waiting span."""
+        with self._lock:
+            while self._queue:
+                batch = []
+                while self._queue and len(batch) < self._batch_size:
+                    batch.append(self._queue.popleft())
+                try:
+                    self._exporter.export(batch)
+                    metrics.incr("tracing.exported_spans", len(batch))
+                except Exception:
+                    metrics.incr("tracing.export_errors")
+                    logger.warning(
+                        "Could not export %d spans", len(batch), exc_info=True
+                    )
+
+    def shutdown(self):
+        self._stopped = True
+        self._wake.set()
+        self._thread.join(timeout=5)
+        self.flush()
+
+
+class Tracer:
+    """Starts traces for requests and spans within them.
+
+    A request is traced if its ``traceparent`` header says the caller
+    sampled it, or, without one, with probability ``sample_rate``. Spans
+    are only recorded inside a traced request; anywhere else ``span()``
+    returns a shared no-op span, so instrumented code costs one context
+    variable lookup when tracing is off.
+    """
+
+    def __init__(self, processor: Optional[SpanProcessor], sample_rate: float = 1.0):
+        self.processor = processor
+        self.enabled = processor is not None
+        self._sample_rate = sample_rate
+
+    def start_trace(
+        self,
+        name: str,
+        traceparent: Optional[str] = None,
+        tracestate: Optional[str] = None,
+        **attributes,
+    ):
+        """A root span for a request, continuing the caller's trace if any."""
+        if not self.enabled:
+            return NOOP_SPAN
+        match = TRACEPARENT.match(traceparent or "")
+        if match and int(match[1], 16) and int(match[2], 16):
+            if not int(match[3], 16) & SAMPLED:
+                return NOOP_SPAN
+            trace_id, parent_id = match[1], match[2]
+        else:
+            if random.random() >= self._sample_rate:
+                return NOOP_SPAN
+            trace_id, parent_id, tracestate = os.urandom(16).hex(), None, None
+        return Span(
+            self, name, trace_id, parent_id, "server", tracestate, attributes
+        )
+
+    def span(self, name: str, **attributes):
+        """A child of the current span, or the no-op span outside a trace."""
+        parent = _current.get()
+        if parent is None:
+            return NOOP_SPAN
+        return Span(self, name, parent.trace_id, parent.span_id, attributes=attributes)
+
+    def current(self):
+        return _current.get() or NOOP_SPAN
+
+    def shutdown(self):
+        if self.processor is not None:
+            self.processor.shutdown()
+
+
+def build_model(model: type[Model], data: dict) -> Model:
+    """``model(**data)``, timed as a span of the current trace."""
+    with tracer.span("pydantic", model=model.__name__):
+        return model(**data)
+
+
+def build_models(model: type[Model], rows: Iterable[dict]) -> list[Model]:
+    """A ``model`` per row, timed as one span of the current trace."""
+    with tracer.span("pydantic", model=model.__name__) as span:
+        built = [model(**data) for data in rows]
+        span.set("count", len(built))
+    return built
+
+
+def _exporter() -> Optional[SpanExporter]:
+    if settings.TRACING_EXPORTER == "file":
+        return FileSpanExporter()
+    if settings.TRACING_EXPORTER == "otlp":
+        return OtlpSpanExporter()
+    return None
+
+
+def _tracer() -> Tracer:
+    exporter = _exporter()
+    processor = SpanProcessor(exporter) if exporter is not None else None
+    return Tracer(processor, settings.TRACING_SAMPLE_RATE)
+
+
+tracer = _tracer()
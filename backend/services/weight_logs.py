@@ -0,0 +1,186 @@
+import bisect
+from datetime import date, datetime, timezone
+from typing import Optional
+
+from firebase_admin import firestore
+from google.api_core.exceptions import NotFound
+from pydantic import TypeAdapter
+
+from ..config import settings
+from ..models.body_metrics import WeightLog, WeightLogCreate, weight_log_id
+from .firestore import FirestoreService, get_firestore_service
+
+_weight_logs_adapter = TypeAdapter(list[WeightLog])
+
+
+class WeightLogStore:
+    """Where a user's weight logs live; one log per day."""
+
+    def list_since(self, user_id: str, start: date) -> list[WeightLog]:
+        """Logs dated ``start`` or later, newest first."""
+        raise NotImplementedError
+
+    def upsert(self, user_id: str, log: WeightLogCreate) -> WeightLog:
+        """Store a log, replacing any existing log for the same day."""
+        raise NotImplementedError
+
+    def delete(self, user_id: str, log_id: str) -> bool:
+        """Delete a log; False if there was none."""
+        raise NotImplementedError
+
+
+class DailyWeightLogStore(WeightLogStore):
+    """One document per log in ``users/{uid}/weight_logs``, keyed by date."""
+
+    def __init__(self, fs: FirestoreService):
+        self._fs = fs
+
+    def _collection(self, user_id: str):
+        return self._fs.get_user_collection(user_id, "weight_logs")
+
+    def list_since(self, user_id: str, start: date) -> list[WeightLog]:
+        query = (
+            self._collection(user_id)
+            .where("date", ">=", start)
+            .order_by("date", direction="DESCENDING")
+        )
+        logs = []
+        for doc in self._fs.query(query):
+            data = doc.to_dict()
+            data["id"] = doc.id
+            logs.append(WeightLog(**data))
+        return logs
+
+    def upsert(self, user_id: str, log: WeightLogCreate) -> WeightLog:
+        # The document ID is derived from the date, so the upsert is a single
+        # write and concurrent posts cannot create duplicates.
+        log_id = weight_log_id(log.date)
+        data = {**log.model_dump(), "created_at": datetime.now(timezone.utc)}
+        self._fs.write(self._collection(user_id).document(log_id).set, data, merge=True)
+        return WeightLog(id=log_id, **data)
+
+    def delete(self, user_id: str, log_id: str) -> bool:
+        # The exists precondition replaces a separate read before the delete.
+        try:
+            self._fs.write(
+                self._collection(user_id).document(log_id).delete,
+                option=self._fs.db.write_option(exists=True),
+            )
+        except NotFound:
+            return False
+        return True
+
+
+class YearlyWeightLogStore(WeightLogStore):
+    """One document per year in ``users/{uid}/weight_years``.
+
+    Each document holds the year's logs as parallel arrays sorted by date:
+    ``dates`` (ISO strings), ``weights``, ``notes`` and ``created_at``. A
+    chart of the last year reads two documents instead of one per day.
+    Writes rewrite the year's arrays in a transaction. Deletes also find
+    logs still in the daily layout, so they work before the migration.
+    """
+
+    COLLECTION = "weight_years"
+    FIELDS = ("dates", "weights", "notes", "created_at")
+
+    def __init__(self, fs: FirestoreService):
+        self._fs = fs
+
+    def ref(self, user_id: str, year: int):
+        return self._fs.get_user_collection(user_id, self.COLLECTION).document(
+            str(year)
+        )
+
+    def list_since(self, user_id: str, start: date) -> list[WeightLog]:
+        refs = [
+            self.ref(user_id, year)
+            for year in range(start.year, date.today().year + 1)
+        ]
+        first = start.isoformat()
+        rows = []
+        for doc in self._fs.read(self._fs.db.get_all, refs):
+            if not doc.exists:
+                continue
+            data = doc.to_dict()
+            dates = data["dates"]
+            for i in range(bisect.bisect_left(dates, first), len(dates)):
+                rows.append({
+                    "id": dates[i],
+                    "date": dates[i],
+                    "weight": data["weights"][i],
+                    "notes": data["notes"][i],
+                    "created_at": data["created_at"][i],
+                })
+        rows.sort(key=lambda row: row["date"], reverse=True)
+        # One validation pass over the list instead of a model per row
+        return _weight_logs_adapter.validate_python(rows)
+
+    def upsert(self, user_id: str, log: WeightLogCreate) -> WeightLog:
+        ref = self.ref(user_id, log.date.year)
+        day = log.date.isoformat()
+        now = datetime.now(timezone.utc)
+
+        @firestore.transactional
+        def upsert_in_transaction(transaction):
+            doc = ref.get(transaction=transaction)
+            data = doc.to_dict() if doc.exists else {f: [] for f in self.FIELDS}
+            i = bisect.bisect_left(data["dates"], day)
+            row = (day, log.weight, log.notes, now)
+            if i < len(data["dates"]) and data["dates"][i] == day:
+                for field, value in zip(self.FIELDS, row):
+                    data[field][i] = value
+            else:
+                for field, value in zip(self.FIELDS, row):
+                    data[field].insert(i, value)
+            transaction.set(ref, data)
+
+        self._fs.transact(upsert_in_transaction)
+        return WeightLog(id=day, created_at=now, **log.model_dump())
+
+    def delete(self, user_id: str, log_id: str) -> bool:
+        try:
+            day = date.fromisoformat(log_id)
+        except ValueError:
+            return False
+        if weight_log_id(day) != log_id:
+            return False
+        ref = self.ref(user_id, day.year)
+        daily = self._fs.get_user_collection(user_id, "weight_logs").document(log_id)
+
+        @firestore.transactional
+        def delete_in_transaction(transaction) -> bool:
+            doc = ref.get(transaction=transaction)
+            data = doc.to_dict() if doc.exists else {"dates": []}
+            i = bisect.bisect_left(data["dates"], log_id)
+            if i == len(data["dates"]) or data["dates"][i] != log_id:
+                # Not migrated yet: the log may still be a daily document.
+                if not daily.get(transaction=transaction).exists:
+                    return False
+                transaction.delete(daily)
+                return True
+            for field in self.FIELDS:
+                del data[field][i]
+            if data["dates"]:
+                transaction.set(ref, data)
+            else:
+                transaction.delete(ref)
+            # Drop any daily-layout copy too, so re-running the migration
+            # cannot bring the log back.
+            transaction.delete(daily)
+            return True
+
+        return self._fs.transact(delete_in_transaction)
+
+
+_weight_log_store: Optional[WeightLogStore] = None
+
+
+def get_weight_log_store() -> WeightLogStore:
+    global _weight_log_store
+    if _weight_log_store is None:
+        if settings.WEIGHT_LOG_STORAGE == "yearly":
+            _weight_log_store = YearlyWeightLogStore(get_firestore_service())
+        else:
+            _weight_log_store = DailyWeightLogStore(get_firestore_service())
+    return _weight_log_store
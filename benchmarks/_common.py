@@ -0,0 +1,94 @@
+"""Helpers shared by the benchmarks.
+
+The benchmarks run against the in-memory Firestore fake from the tests, so
+they count reads and writes exactly and measure the app's own CPU time,
+not network latency.
+"""
+import statistics
+import time
+from contextlib import contextmanager
+from typing import Any, Callable
+
+from tests.fake_firestore import FakeFirestore, transactional
+
+
+def use_fake_firestore() -> FakeFirestore:
+    """Put a fresh fake behind ``get_firestore_service()`` for this process."""
+    from firebase_admin import firestore
+
+    from backend.services.firestore import FirestoreService
+
+    fake = FakeFirestore()
+    firestore.transactional = transactional
+    FirestoreService._initialize = lambda self: None
+    FirestoreService()._db = fake
+    return fake
+
+
+@contextmanager
+def app_client():
+    """A test client for the app that accepts any bearer token as a user ID.
+
+    Rate limiting is off, so repeated requests are measured, not refused.
+    """
+    from fastapi.testclient import TestClient
+
+    from backend import auth
+    from backend.main import app
+    from backend.services.rate_limit import rate_limit
+
+    def verify_id_token(token, *args, **kwargs):
+        return {"uid": token, "email": f"{token}@example.com"}
+
+    auth.auth.verify_id_token = verify_id_token
+    app.dependency_overrides[rate_limit] = lambda: None
+    with TestClient(app) as client:
+        yield client
+
+
+def timed(fn: Callable[[], Any], repeat: int = 200) -> dict:
+    """Median and 95th percentile of ``fn``'s run time, in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "median_ms": statistics.median(samples),
+        "p95_ms": samples[int(len(samples) * 0.95) - 1],
+    }
+
+
+def document_size(value: Any) -> int:
+    """Stored size of a Firestore value, by Firestore's documented rules.
+
+    For a whole document add the size of its name plus 16 bytes.
+    """
+    if isinstance(value, dict):
+        return sum(len(k.encode()) + 1 + document_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(document_size(v) for v in value)
+    if isinstance(value, str):
+        return len(value.encode()) + 1
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if value is None or isinstance(value, bool):
+        return 1
+    return 8
+
+
+def table(rows: list[dict]):
+    """Print rows of equal keys as an aligned table."""
+    columns = list(rows[0])
+    cells = [[_format(row[c]) for c in columns] for row in rows]
+    widths = [max(len(c), *(len(r[i]) for r in cells)) for i, c in enumerate(columns)]
+    print("  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+    for row in cells:
+        print("  ".join(v.ljust(w) for v, w in zip(row, widths)))
+
+
+def _format(value: Any) -> str:
+    if isinstance(value, float):
+        return f"{value:.3f}"
+    return str(value)
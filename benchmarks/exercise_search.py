@@ -0,0 +1,140 @@
+"""Exercise search over 5000 exercises: index build, queries and payloads.
+
+Builds the in-memory index over generated exercise names, times exact,
+prefix and misspelled queries against it, then compares the size of the
+search response with the full ``GET /api/exercises`` list it replaces.
+
+Usage::
+
+    python -m benchmarks.exercise_search
+"""
+import random
+from datetime import datetime, timezone
+
+from ._common import app_client, table, timed, use_fake_firestore
+
+AUTH = {"Authorization": "Bearer u1", "Accept-Encoding": "identity"}
+EXERCISES = 5000
+QUERIES = [
+    "bench", "incline dumbbell", "benh pres", "dumbel curl", "sq",
+    "deadlfit", "trap bar dead", "slow", "xyzzy",
+]
+
+MODIFIERS = [
+    "Incline", "Decline", "Flat", "Seated", "Standing", "Single-Arm",
+    "Close-Grip", "Wide-Grip", "Paused", "Tempo", "Deficit", "Banded",
+    "Reverse", "Kneeling", "Cable", "Smith",
+]
+EQUIPMENT = [
+    "Barbell", "Dumbbell", "Kettlebell", "Machine", "Cable", "Band",
+    "Landmine", "Trap Bar", "EZ-Bar", "Sandbag",
+]
+MOVEMENTS = [
+    "Bench Press", "Squat", "Deadlift", "Row", "Curl", "Lateral Raise",
+    "Overhead Press", "Lunge", "Hip Thrust", "Pulldown", "Fly", "Pushdown",
+    "Shrug", "Calf Raise", "Good Morning", "Split Squat", "Pullover", "Crunch",
+]
+NOTES = [
+    "slow eccentric", "pause at bottom", "elbows tucked", "brace hard",
+    "full range of motion", None, None, "spotter needed", "chalk",
+]
+
+
+def generate():
+    from backend.models.exercise import Exercise
+
+    rnd = random.Random(7)
+    names = set()
+    while len(names) < EXERCISES:
+        name = " ".join(
+            rnd.choice(options) for options in (MODIFIERS, EQUIPMENT, MOVEMENTS)
+        )
+        if rnd.random() < 0.5:
+            name += f" {rnd.randint(2, 99)}"
+        names.add(name)
+    now = datetime.now(timezone.utc)
+    return [
+        Exercise(
+            id=f"e{n}",
+            user_id="u1",
+            name=name,
+            muscle_group=rnd.choice(["chest", "back", "quads"]),
+            notes=rnd.choice(NOTES),
+            created_at=now,
+            updated_at=now,
+        )
+        for n, name in enumerate(sorted(names))
+    ]
+
+
+def main():
+    from backend.services.exercise_search import ExerciseIndex, exercise_search
+
+    exercises = generate()
+    print(f"Building the index over {EXERCISES} exercises")
+    table([timed(lambda: ExerciseIndex(exercises), 10)])
+
+    index = ExerciseIndex(exercises)
+    rows = []
+    for query in QUERIES:
+        hits = index.search(query, 20)
+        rows.append({
+            "query": repr(query),
+            "hits": len(hits),
+            "top": hits[0].name if hits else "-",
+            **timed(lambda: index.search(query, 20), 300),
+        })
+    print(f"\nSearching {EXERCISES} exercises, limit 20")
+    table(rows)
+
+    fake = use_fake_firestore()
+    for exercise in exercises:
+        data = exercise.model_dump(exclude={"id", "user_id"})
+        fake.documents[f"users/u1/exercises/{exercise.id}"] = data
+    with app_client() as client:
+        search = {"q": "bench"}
+        exercise_search.forget("u1")
+        fake.stats.clear()
+        first = timed(
+            lambda: client.get("/api/exercises/search", params=search, headers=AUTH),
+            1,
+        )
+        rows = [
+            {
+                "request": "first search",
+                "reads": fake.stats["reads"],
+                "bytes": len(
+                    client.get(
+                        "/api/exercises/search", params=search, headers=AUTH
+                    ).content
+                ),
+                "median_ms": first["median_ms"],
+            },
+        ]
+        fake.stats.clear()
+        later = timed(
+            lambda: client.get("/api/exercises/search", params=search, headers=AUTH),
+            50,
+        )
+        rows.append({
+            "request": "later search",
+            "reads": fake.stats["reads"] // 50,
+            "bytes": rows[0]["bytes"],
+            "median_ms": later["median_ms"],
+        })
+        fake.stats.clear()
+        full = client.get("/api/exercises", headers=AUTH)
+        rows.append({
+            "request": "full list",
+            "reads": fake.stats["reads"],
+            "bytes": len(full.content),
+            "median_ms": timed(
+                lambda: client.get("/api/exercises", headers=AUTH), 5
+            )["median_ms"],
+        })
+    print("\nGET /api/exercises/search?q=bench against the full list")
+    table(rows)
+
+
+if __name__ == "__main__":
+    main()
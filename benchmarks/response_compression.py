@@ -0,0 +1,116 @@
+"""Size and cost of compressing a 50-session list response.
+
+Fetches ``GET /api/sessions`` with and without ``Accept-Encoding: gzip``,
+then times gzip at several levels (and brotli, if installed) on the same
+body, to show what ``GZIP_LEVEL`` and ``BROTLI_QUALITY`` trade.
+
+Usage::
+
+    python -m benchmarks.response_compression
+"""
+import gzip
+import uuid
+from datetime import date, datetime, timedelta, timezone
+
+from ._common import app_client, table, timed, use_fake_firestore
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+AUTH = {"Authorization": "Bearer u1"}
+SESSIONS = 50
+
+
+def seed(fake):
+    today = date.today()
+    for days_ago in range(SESSIONS):
+        day = today - timedelta(days=days_ago)
+        start = datetime.combine(day, datetime.min.time(), timezone.utc)
+        fake.documents[f"users/u1/sessions/{uuid.uuid4()}"] = {
+            "routine_id": str(uuid.uuid4()),
+            "routine_name": "Push day",
+            "date": day,
+            "notes": None,
+            "start_time": start,
+            "end_time": start + timedelta(hours=1),
+            "version": 30,
+            "created_at": start,
+            "updated_at": start,
+            "performed_exercises": [
+                {
+                    "id": str(uuid.uuid4()),
+                    "exercise_id": str(uuid.uuid4()),
+                    "exercise_name": f"Exercise {j}",
+                    "routine_item_id": str(uuid.uuid4()),
+                    "is_adhoc": False,
+                    "order": j,
+                    "notes": None,
+                    "target_sets": 4,
+                    "target_reps": 8,
+                    "target_weight": 100.0,
+                    "target_rpe": 8.0,
+                    "rest_seconds": 90,
+                    "sets": [
+                        {
+                            "set_number": k + 1,
+                            "reps": 8,
+                            "weight": 100.0 + 2.5 * k,
+                            "rpe": 8.0,
+                            "completed": True,
+                            "notes": None,
+                        }
+                        for k in range(4)
+                    ],
+                }
+                for j in range(6)
+            ],
+        }
+
+
+def main():
+    fake = use_fake_firestore()
+    seed(fake)
+    with app_client() as client:
+        rows = []
+        for encoding in ("identity", "gzip", "br"):
+            headers = {**AUTH, "Accept-Encoding": encoding}
+            response = client.get("/api/sessions", headers=headers)
+            rows.append({
+                "accept": encoding,
+                "content_encoding": response.headers.get("content-encoding", "-"),
+                "bytes_on_wire": int(response.headers["content-length"]),
+                **timed(lambda: client.get("/api/sessions", headers=headers), 50),
+            })
+        body = client.get(
+            "/api/sessions", headers={**AUTH, "Accept-Encoding": "identity"}
+        ).content
+
+    print(f"GET /api/sessions, {SESSIONS} sessions")
+    table(rows)
+
+    codecs = [
+        (f"gzip-{level}", lambda level=level: gzip.compress(body, level, mtime=0))
+        for level in (1, 4, 6, 9)
+    ]
+    if brotli is not None:
+        codecs += [
+            (f"br-{q}", lambda q=q: brotli.compress(body, quality=q))
+            for q in (1, 4, 6, 11)
+        ]
+    rows = [
+        {
+            "codec": name,
+            "bytes": len(compress()),
+            "ratio": len(compress()) / len(body),
+            **timed(compress, 50),
+        }
+        for name, compress in codecs
+    ]
+    print(f"\nCompressing the {len(body)}-byte body")
+    table(rows)
+
+
+if __name__ == "__main__":
+    main()
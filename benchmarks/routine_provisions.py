@@ -0,0 +1,77 @@
+"""Size and validation time of a 40-item routine's provisions.
+
+Compares the old full-dict storage with the compact ``provisions_format``
+1 encoding: the stored size, and the time to turn stored provisions into
+models on every read.
+
+Usage::
+
+    python -m benchmarks.routine_provisions
+"""
+import uuid
+
+from pydantic import TypeAdapter
+
+from backend.models.routine import (
+    PROVISIONS_FORMAT,
+    RoutineCreate,
+    RoutineProvision,
+    decode_provisions,
+    encode_provisions,
+)
+
+from ._common import document_size, table, timed
+
+ITEMS = 40
+
+
+def legacy_provisions() -> list[dict]:
+    """40 items as the old format stored them: every field, nulls included."""
+    return [
+        {
+            "type": "exercise",
+            "id": str(uuid.uuid4()),
+            "exercise_id": str(uuid.uuid4()),
+            "target_sets": 3,
+            "target_reps": 10,
+            "target_weight": None,
+            "target_rpe": None,
+            "rest_seconds": 90,
+            "notes": None,
+            "order": i,
+        }
+        for i in range(ITEMS)
+    ]
+
+
+def main():
+    legacy = legacy_provisions()
+    adapter = TypeAdapter(list[RoutineProvision])
+    compact = encode_provisions(adapter.validate_python(legacy))
+    request = {
+        "name": "Full body",
+        "provisions": [
+            {k: v for k, v in p.items() if k not in ("id", "order")} for p in legacy
+        ],
+    }
+
+    rows = [
+        {
+            "format": "legacy",
+            "stored_bytes": document_size(legacy),
+            **timed(lambda: decode_provisions(legacy, None), 2000),
+        },
+        {
+            "format": f"compact (v{PROVISIONS_FORMAT})",
+            "stored_bytes": document_size(compact),
+            **timed(lambda: decode_provisions(compact, PROVISIONS_FORMAT), 2000),
+        },
+    ]
+    print(f"Reading {ITEMS} stored provisions into models")
+    table(rows)
+    validate = timed(lambda: RoutineCreate(**request), 2000)
+    print(f"\nValidating a create request: {validate['median_ms']:.3f} ms median")
+
+
+if __name__ == "__main__":
+    main()
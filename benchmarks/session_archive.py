@@ -0,0 +1,106 @@
+"""Reading a five-year session history before and after archiving.
+
+Seeds a session every other day for five years, then lists the last 90
+days, the latest 200 sessions and one month three years back, before and
+after the archive job moves sessions older than ``ARCHIVE_AFTER_DAYS``
+into monthly archives.
+
+Usage::
+
+    python -m benchmarks.session_archive
+"""
+import uuid
+from datetime import date, datetime, timedelta, timezone
+
+from ._common import app_client, table, timed, use_fake_firestore
+
+AUTH = {"Authorization": "Bearer u1"}
+YEARS = 5
+
+
+def seed(fake):
+    today = date.today()
+    for days_ago in range(0, YEARS * 365, 2):
+        day = today - timedelta(days=days_ago)
+        start = datetime.combine(day, datetime.min.time(), timezone.utc)
+        fake.documents[f"users/u1/sessions/{uuid.uuid4()}"] = {
+            "routine_id": None,
+            "routine_name": "Full body",
+            "date": day,
+            "notes": None,
+            "start_time": start,
+            "end_time": start + timedelta(hours=1),
+            "version": 3,
+            "created_at": start,
+            "updated_at": start,
+            "performed_exercises": [
+                {
+                    "id": str(uuid.uuid4()),
+                    "exercise_id": f"e{j}",
+                    "routine_item_id": None,
+                    "is_adhoc": True,
+                    "order": j,
+                    "notes": None,
+                    "sets": [
+                        {
+                            "set_number": k + 1,
+                            "reps": 5,
+                            "weight": 100.0 + k,
+                            "rpe": 8.0,
+                            "completed": True,
+                            "notes": None,
+                        }
+                        for k in range(4)
+                    ],
+                }
+                for j in range(5)
+            ],
+        }
+
+
+def measure(fake, client, label: str) -> list[dict]:
+    today = date.today()
+    old = today - timedelta(days=3 * 365)
+    urls = {
+        "last 90 days": f"/api/sessions?start_date={today - timedelta(days=90)}",
+        "latest 200": "/api/sessions?limit=200",
+        "a month 3 years ago": (
+            f"/api/sessions?start_date={old}&end_date={old + timedelta(days=30)}"
+        ),
+    }
+    hot = sum(1 for path in fake.documents if path.startswith("users/u1/sessions/"))
+    rows = []
+    for name, url in urls.items():
+        fake.stats.clear()
+        count = len(client.get(url, headers=AUTH).json())
+        rows.append({
+            "tier": label,
+            "hot_docs": hot,
+            "listing": name,
+            "sessions": count,
+            "reads": fake.stats["reads"],
+            **timed(lambda: client.get(url, headers=AUTH), 20),
+        })
+    return rows
+
+
+def main():
+    from backend.jobs import archive_sessions
+
+    fake = use_fake_firestore()
+    seed(fake)
+    with app_client() as client:
+        client.post("/api/body-metrics/profile", headers=AUTH)
+        rows = measure(fake, client, "all hot")
+        archived = archive_sessions.run(user_id="u1")["archived"]
+        rows += measure(fake, client, "archived")
+
+    archives = [p for p in fake.documents if "/session_archives/" in p]
+    packed = sum(len(fake.documents[p].get("data", b"")) for p in archives)
+    print(f"{archived} sessions archived into {len(archives)} documents")
+    print(f"({packed} bytes compressed)\n")
+    table(rows)
+
+
+if __name__ == "__main__":
+    main()
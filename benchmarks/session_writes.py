@@ -0,0 +1,67 @@
+"""Firestore writes per logged set, with and without write-behind.
+
+Logs 5 exercises of 4 sets each through the API, once writing every
+change straight away and once with a ``SESSION_WRITE_BEHIND_SECONDS``
+window that outlasts the workout, and counts the reads and writes.
+
+Usage::
+
+    python -m benchmarks.session_writes
+"""
+from ._common import app_client, table, timed, use_fake_firestore
+
+AUTH = {"Authorization": "Bearer u1"}
+EXERCISES = 5
+SETS = 4
+
+
+def log_workout(client) -> str:
+    session_id = client.post(
+        "/api/sessions", json={"date": "2026-10-19"}, headers=AUTH
+    ).json()["id"]
+    for n in range(EXERCISES):
+        performed = client.post(
+            f"/api/sessions/{session_id}/exercises?delta=true",
+            json={"exercise_id": f"e{n}"},
+            headers=AUTH,
+        ).json()["performed_exercise"]
+        for _ in range(SETS):
+            client.post(
+                f"/api/sessions/{session_id}/exercises/{performed['id']}/sets",
+                json={"reps": 5, "weight": 100},
+                headers=AUTH,
+            )
+    return session_id
+
+
+def main():
+    from backend.services import session_store
+    from backend.services.firestore import get_firestore_service
+
+    fake = use_fake_firestore()
+    rows = []
+    with app_client() as client:
+        for window in (0, 60):
+            store = session_store.SessionStore(
+                get_firestore_service(), flush_window=window
+            )
+            session_store._session_store = store
+            fake.stats.clear()
+            session_id = log_workout(client)
+            counts = dict(fake.stats)
+            client.post(f"/api/sessions/{session_id}/finish", headers=AUTH)
+            rows.append({
+                "write_behind_s": window,
+                "reads": counts["reads"],
+                "writes": counts["writes"],
+                "writes_per_set": counts["writes"] / (EXERCISES * SETS),
+                "workout_ms": timed(lambda: log_workout(client), 5)["median_ms"],
+            })
+            store.flush_all()
+
+    print(f"{EXERCISES} exercises x {SETS} sets, then finish")
+    table(rows)
+
+
+if __name__ == "__main__":
+    main()
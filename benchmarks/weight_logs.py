@@ -0,0 +1,65 @@
+"""Weight log reads with one document per day and one per year.
+
+Logs three years of daily weights through the API, packs them into year
+documents with the ``weight_log_years`` migration, then reads chart
+windows of 1, 3 and 12 months from both layouts and compares documents
+read and time taken.
+
+Usage::
+
+    python -m benchmarks.weight_logs
+"""
+from datetime import date, timedelta
+
+from ._common import app_client, table, timed, use_fake_firestore
+
+AUTH = {"Authorization": "Bearer u1"}
+DAYS = 3 * 365
+
+
+def main():
+    from backend.migrations import weight_log_years
+    from backend.services.firestore import get_firestore_service
+    from backend.services.weight_logs import (
+        DailyWeightLogStore,
+        YearlyWeightLogStore,
+    )
+
+    fake = use_fake_firestore()
+    today = date.today()
+    with app_client() as client:
+        for days_ago in range(DAYS):
+            client.post(
+                "/api/body-metrics/weight",
+                json={
+                    "date": (today - timedelta(days=days_ago)).isoformat(),
+                    "weight": 80 + (days_ago % 7) / 10,
+                },
+                headers=AUTH,
+            )
+    totals = weight_log_years.migrate()
+    print(
+        f"Migrated {totals['copied']} logs into {totals['years']} year documents"
+    )
+
+    fs = get_firestore_service()
+    stores = {"daily": DailyWeightLogStore(fs), "yearly": YearlyWeightLogStore(fs)}
+    rows = []
+    for months in (1, 3, 12):
+        start = today - timedelta(days=months * 30)
+        for layout, store in stores.items():
+            fake.stats.clear()
+            logs = store.list_since("u1", start)
+            rows.append({
+                "window_months": months,
+                "layout": layout,
+                "logs": len(logs),
+                "docs_read": fake.stats["reads"],
+                **timed(lambda: store.list_since("u1", start), 20),
+            })
+    print()
+    table(rows)
+
+
+if __name__ == "__main__":
+    main()
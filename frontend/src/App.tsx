@@ -14,12 +14,20 @@ import { ProfilePage } from "./pages/ProfilePage";
 import "./App.css";
 
 function AppContent() {
-  const { getIdToken } = useAuth();
+  const { user, getIdToken } = useAuth();
+  const uid = user?.uid;
 
   useEffect(() => {
     api.setTokenGetter(getIdToken);
   }, [getIdToken]);
 
+  useEffect(() => {
+    // Creates the profile on first sign-in, stores any new email or picture
+    // from the token, and warms the server's cache. Pages' effects run
+    // before this one, so the profile calls sign in themselves on a 404.
+    if (uid) api.signIn().catch(() => undefined);
+  }, [uid]);
+
   return (
     <Routes>
       <Route path="/login" element={<LoginPage />} />
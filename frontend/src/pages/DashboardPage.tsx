@@ -40,6 +40,7 @@ export function DashboardPage() {
         routine_id: routine?.id,
         routine_name: routine?.name,
         date: today,
+        expand_routine: routine !== undefined,
       });
       navigate(`/workout/${session.id}`);
     } catch (error) {
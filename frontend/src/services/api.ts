@@ -9,6 +9,15 @@ import type {
   UserProfile,
 } from "../types";
 
+export class ApiError extends Error {
+  status: number;
+
+  constructor(message: string, status: number) {
+    super(message);
+    this.status = status;
+  }
+}
+
 class ApiClient {
   private getToken: () => Promise<string | null>;
 
@@ -42,7 +51,10 @@ class ApiClient {
 
     if (!response.ok) {
       const error = await response.json().catch(() => ({}));
-      throw new Error(error.detail || `HTTP error ${response.status}`);
+      throw new ApiError(
+        error.detail || `HTTP error ${response.status}`,
+        response.status
+      );
     }
 
     if (response.status === 204) {
@@ -136,6 +148,7 @@ class ApiClient {
     routine_name?: string;
     date: string;
     notes?: string;
+    expand_routine?: boolean;
   }): Promise<WorkoutSession> {
     return this.request<WorkoutSession>("/api/sessions", {
       method: "POST",
@@ -189,18 +202,43 @@ class ApiClient {
   }
 
   // Body Metrics
+  async signIn(): Promise<UserProfile> {
+    return this.request<UserProfile>("/api/body-metrics/profile", {
+      method: "POST",
+    });
+  }
+
+  // Only sign-in creates the profile, so a read or update that races the
+  // first sign-in and finds none signs in (idempotently) and carries on.
   async getProfile(): Promise<UserProfile> {
-    return this.request<UserProfile>("/api/body-metrics/profile");
+    try {
+      return await this.request<UserProfile>("/api/body-metrics/profile");
+    } catch (error) {
+      if (error instanceof ApiError && error.status === 404) {
+        return this.signIn();
+      }
+      throw error;
+    }
   }
 
   async updateProfile(data: {
     display_name?: string;
     height_cm?: number;
   }): Promise<UserProfile> {
-    return this.request<UserProfile>("/api/body-metrics/profile", {
-      method: "PATCH",
-      body: JSON.stringify(data),
-    });
+    const update = () =>
+      this.request<UserProfile>("/api/body-metrics/profile", {
+        method: "PATCH",
+        body: JSON.stringify(data),
+      });
+    try {
+      return await update();
+    } catch (error) {
+      if (error instanceof ApiError && error.status === 404) {
+        await this.signIn();
+        return update();
+      }
+      throw error;
+    }
   }
 
   async getWeightLogs(months = 3): Promise<WeightLog[]> {
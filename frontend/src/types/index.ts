@@ -106,6 +106,12 @@ export interface PerformedExercise {
   sets: PerformedSet[];
   order: number;
   notes?: string;
+  superset_id?: string;
+  target_sets?: number;
+  target_reps?: number;
+  target_weight?: number;
+  target_rpe?: number;
+  rest_seconds?: number;
 }
 
 export interface WorkoutSession {
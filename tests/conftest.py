@@ -0,0 +1,54 @@
+import pytest
+from fastapi.testclient import TestClient
+from firebase_admin import firestore as firebase_firestore
+
+from backend.config import settings
+from backend.services import cache, firestore as firestore_service
+from backend.services import rate_limit as rate_limit_service
+from backend.services.firestore import FirestoreService
+from backend.services.rate_limit import RateLimiter
+from backend.services.resilience import CircuitBreaker
+
+from .fake_firestore import FakeFirestore, transactional
+
+
+@pytest.fixture
+def db(monkeypatch) -> FakeFirestore:
+    """A fresh in-memory Firestore behind ``get_firestore_service()``."""
+    fake = FakeFirestore()
+    monkeypatch.setattr(firebase_firestore, "transactional", transactional)
+    monkeypatch.setattr(FirestoreService, "_initialize", lambda self: None)
+    monkeypatch.setattr(FirestoreService(), "_db", fake, raising=False)
+    monkeypatch.setattr(cache, "_cache", None)
+    monkeypatch.setattr(
+        firestore_service,
+        "breaker",
+        CircuitBreaker(
+            "firestore",
+            failure_rate=settings.FIRESTORE_BREAKER_FAILURE_RATE,
+            min_calls=settings.FIRESTORE_BREAKER_MIN_CALLS,
+            window=settings.FIRESTORE_BREAKER_WINDOW_SECONDS,
+            reset_timeout=settings.FIRESTORE_BREAKER_RESET_SECONDS,
+        ),
+    )
+    return fake
+
+
+@pytest.fixture
+def client(db, monkeypatch):
+    """The app, with each bearer token accepted as that user's ID.
+
+    Each test starts with full rate limit buckets.
+    """
+    from backend import auth
+    from backend.main import app
+
+    monkeypatch.setattr(rate_limit_service, "rate_limiter", RateLimiter())
+
+    monkeypatch.setattr(
+        auth.auth,
+        "verify_id_token",
+        lambda token, *args, **kwargs: {"uid": token, "email": f"{token}@example.com"},
+    )
+    with TestClient(app) as test_client:
+        yield test_client
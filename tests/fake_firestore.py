@@ -0,0 +1,331 @@
+"""An in-memory stand-in for the parts of the Firestore client the app uses.
+
+Documents live in one dict keyed by path. Every operation takes a single
+lock, so concurrent writes apply one at a time in a recorded order, and a
+transaction runs its function and commit under that lock. ``stats``
+counts reads, writes and queries the way Firestore bills them; ``fail``
+injects errors into the next calls.
+"""
+
+import copy
+import threading
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+
+from google.api_core import exceptions
+from google.cloud.firestore_v1 import transforms
+
+OPERATORS = {
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    "<": lambda a, b: a is not None and a < b,
+    "<=": lambda a, b: a is not None and a <= b,
+    ">": lambda a, b: a is not None and a > b,
+    ">=": lambda a, b: a is not None and a >= b,
+    "in": lambda a, b: a in b,
+    "array_contains": lambda a, b: b in (a or []),
+}
+
+
+def _set_field(data: dict, key: str, value):
+    if "." in key:
+        head, rest = key.split(".", 1)
+        _set_field(data.setdefault(head, {}), rest, value)
+    elif value is transforms.DELETE_FIELD:
+        data.pop(key, None)
+    elif isinstance(value, transforms.Increment):
+        data[key] = data.get(key, 0) + value.value
+    elif isinstance(value, transforms.ArrayUnion):
+        current = data.get(key, [])
+        data[key] = current + [v for v in value.values if v not in current]
+    elif isinstance(value, transforms.ArrayRemove):
+        data[key] = [v for v in data.get(key, []) if v not in value.values]
+    elif value is transforms.SERVER_TIMESTAMP:
+        data[key] = datetime.now(timezone.utc)
+    else:
+        data[key] = copy.deepcopy(value)
+
+
+def _field(row: tuple[str, dict], field: str):
+    path, data = row
+    return path.rsplit("/", 1)[-1] if field == "__name__" else data.get(field)
+
+
+class Snapshot:
+    def __init__(self, reference: "DocumentReference", data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data)
+
+    def get(self, field: str):
+        return self._data.get(field)
+
+
+class WriteOption:
+    def __init__(self, exists=None):
+        self.exists = exists
+
+
+class DocumentReference:
+    def __init__(self, client: "FakeFirestore", path: str):
+        self._client = client
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    def __eq__(self, other):
+        return isinstance(other, DocumentReference) and other.path == self.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+    @property
+    def parent(self) -> "CollectionReference":
+        return CollectionReference(self._client, self.path.rsplit("/", 1)[0])
+
+    def collection(self, name: str) -> "CollectionReference":
+        return CollectionReference(self._client, f"{self.path}/{name}")
+
+    def get(self, field_paths=None, transaction=None, **kwargs) -> Snapshot:
+        return self._client._read(self, field_paths)
+
+    def set(self, data: dict, merge: bool = False, **kwargs):
+        self._client._apply([("set", self, data, merge)])
+
+    def create(self, data: dict, **kwargs):
+        self._client._apply([("create", self, data, False)])
+
+    def update(self, data: dict, **kwargs):
+        self._client._apply([("update", self, data, True)])
+
+    def delete(self, option: WriteOption = None, **kwargs):
+        self._client._apply([("delete", self, option, False)])
+
+
+class Query:
+    def __init__(
+        self, client, path, filters=(), orders=(), limit=None, after=None, fields=None
+    ):
+        self._client = client
+        self._path = path
+        self._filters = list(filters)
+        self._orders = list(orders)
+        self._limit = limit
+        self._after = after
+        self._fields = fields
+
+    def _with(self, **changes) -> "Query":
+        query = Query(
+            self._client,
+            self._path,
+            self._filters,
+            self._orders,
+            self._limit,
+            self._after,
+            self._fields,
+        )
+        for key, value in changes.items():
+            setattr(query, f"_{key}", value)
+        return query
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = (
+                filter.field_path,
+                filter.op_string,
+                filter.value,
+            )
+        return self._with(filters=self._filters + [(field_path, op_string, value)])
+
+    def order_by(self, field_path, direction="ASCENDING"):
+        return self._with(orders=self._orders + [(field_path, direction)])
+
+    def limit(self, count: int):
+        return self._with(limit=count)
+
+    def start_after(self, snapshot):
+        return self._with(after=snapshot)
+
+    def select(self, field_paths):
+        return self._with(fields=list(field_paths))
+
+    def stream(self, transaction=None, **kwargs):
+        return iter(self._client._query(self))
+
+    def get(self, transaction=None, **kwargs):
+        return self._client._query(self)
+
+
+class CollectionReference(Query):
+    def __init__(self, client, path):
+        super().__init__(client, path)
+        self.id = path.rsplit("/", 1)[-1]
+
+    def document(self, document_id=None) -> DocumentReference:
+        return DocumentReference(
+            self._client, f"{self._path}/{document_id or uuid.uuid4().hex}"
+        )
+
+    def add(self, data: dict):
+        ref = self.document()
+        ref.set(data)
+        return None, ref
+
+    def list_documents(self, page_size=None, **kwargs):
+        prefix = self._path + "/"
+        with self._client.lock:
+            ids = {
+                path[len(prefix):].split("/")[0]
+                for path in self._client.documents
+                if path.startswith(prefix)
+            }
+        return [self.document(i) for i in sorted(ids)]
+
+
+class WriteBatch:
+    def __init__(self, client: "FakeFirestore"):
+        self._client = client
+        self._writes = []
+
+    def __len__(self):
+        return len(self._writes)
+
+    def set(self, reference, data, merge=False):
+        self._writes.append(("set", reference, data, merge))
+
+    def create(self, reference, data):
+        self._writes.append(("create", reference, data, False))
+
+    def update(self, reference, data, option=None):
+        self._writes.append(("update", reference, data, True))
+
+    def delete(self, reference, option=None):
+        self._writes.append(("delete", reference, option, False))
+
+    def commit(self, **kwargs):
+        if len(self._writes) > 500:
+            raise exceptions.InvalidArgument("maximum 500 writes allowed per request")
+        writes, self._writes = self._writes, []
+        self._client._apply(writes)
+        return [object() for _ in writes]
+
+
+class Transaction(WriteBatch):
+    def _run(self, fn, *args, **kwargs):
+        with self._client.lock:
+            result = fn(self, *args, **kwargs)
+            self.commit()
+            return result
+
+
+def transactional(fn):
+    def run(transaction, *args, **kwargs):
+        return transaction._run(fn, *args, **kwargs)
+
+    return run
+
+
+class FakeFirestore:
+    def __init__(self):
+        self.documents: dict[str, dict] = {}
+        self.lock = threading.RLock()
+        self.stats = Counter()
+        # (path, data) of every document write, in the order applied
+        self.history: list[tuple[str, dict]] = []
+        self._faults: list[Exception] = []
+
+    def fail(self, *errors: Exception):
+        """Raise ``errors`` from the next calls, one each."""
+        self._faults.extend(errors)
+
+    def _fault(self):
+        if self._faults:
+            raise self._faults.pop(0)
+
+    def collection(self, name: str) -> CollectionReference:
+        return CollectionReference(self, name)
+
+    def document(self, path: str) -> DocumentReference:
+        return DocumentReference(self, path)
+
+    def batch(self) -> WriteBatch:
+        return WriteBatch(self)
+
+    def transaction(self, **kwargs) -> Transaction:
+        return Transaction(self)
+
+    def write_option(self, exists=None, **kwargs) -> WriteOption:
+        return WriteOption(exists)
+
+    def get_all(self, references, field_paths=None, transaction=None, **kwargs):
+        return iter([ref.get(field_paths=field_paths) for ref in references])
+
+    def _read(self, ref: DocumentReference, field_paths=None) -> Snapshot:
+        self._fault()
+        with self.lock:
+            self.stats["reads"] += 1
+            data = copy.deepcopy(self.documents.get(ref.path))
+        if data is not None and field_paths is not None:
+            data = {k: v for k, v in data.items() if k in field_paths}
+        return Snapshot(ref, data)
+
+    def _query(self, query: Query) -> list[Snapshot]:
+        self._fault()
+        prefix = query._path + "/"
+        with self.lock:
+            self.stats["queries"] += 1
+            rows = [
+                (path, copy.deepcopy(data))
+                for path, data in self.documents.items()
+                if path.startswith(prefix) and "/" not in path[len(prefix):]
+            ]
+        for field, op, value in query._filters:
+            rows = [row for row in rows if OPERATORS[op](_field(row, field), value)]
+        rows.sort(key=lambda row: row[0])
+        for field, direction in reversed(query._orders):
+            rows.sort(
+                key=lambda row, f=field: (_field(row, f) is None, _field(row, f)),
+                reverse=str(direction).upper().endswith("DESCENDING"),
+            )
+        if query._after is not None:
+            after = getattr(query._after, "reference", None)
+            paths = [path for path, _ in rows]
+            if after is not None and after.path in paths:
+                rows = rows[paths.index(after.path) + 1:]
+        if query._limit is not None:
+            rows = rows[: query._limit]
+        snapshots = []
+        for path, data in rows:
+            if query._fields is not None:
+                data = {k: v for k, v in data.items() if k in query._fields}
+            snapshots.append(Snapshot(DocumentReference(self, path), data))
+        # Billed per document returned, at least one per query
+        self.stats["reads"] += max(len(snapshots), 1)
+        return snapshots
+
+    def _apply(self, writes: list):
+        self._fault()
+        with self.lock:
+            for op, ref, data, merge in writes:
+                exists = ref.path in self.documents
+                if op == "create" and exists:
+                    raise exceptions.AlreadyExists(f"Document exists: {ref.path}")
+                if op == "update" and not exists:
+                    raise exceptions.NotFound(f"No document to update: {ref.path}")
+                if op == "delete" and data is not None and data.exists and not exists:
+                    raise exceptions.NotFound(f"No document to delete: {ref.path}")
+            for op, ref, data, merge in writes:
+                self.stats["writes"] += 1
+                if op == "delete":
+                    self.documents.pop(ref.path, None)
+                    self.history.append((ref.path, None))
+                    continue
+                document = self.documents.get(ref.path, {}) if merge else {}
+                for key, value in data.items():
+                    _set_field(document, key, value)
+                self.documents[ref.path] = document
+                self.history.append((ref.path, copy.deepcopy(document)))
@@ -0,0 +1,79 @@
+from datetime import date, datetime, timedelta, timezone
+
+from backend.jobs import archive_sessions
+from backend.services.archive import get_session_archive
+
+AUTH = {"Authorization": "Bearer u1"}
+INDEX = "users/u1/session_archives/index"
+
+
+def add_finished_session(db, session_id: str, days_ago: int):
+    day = date.today() - timedelta(days=days_ago)
+    start = datetime.combine(day, datetime.min.time(), timezone.utc)
+    db.documents[f"users/u1/sessions/{session_id}"] = {
+        "routine_id": None,
+        "routine_name": None,
+        "date": day,
+        "notes": None,
+        "start_time": start,
+        "end_time": start + timedelta(hours=1),
+        "performed_exercises": [],
+        "created_at": start,
+        "updated_at": start,
+    }
+
+
+def test_archived_sessions_are_still_listed_and_flag_the_user(client, db):
+    client.post("/api/body-metrics/profile", headers=AUTH)
+    add_finished_session(db, "old", 400)
+    add_finished_session(db, "new", 1)
+
+    assert archive_sessions.run(user_id="u1") == {"users": 1, "archived": 1}
+    assert "users/u1/sessions/old" not in db.documents
+    assert db.documents["users/u1"]["has_archive"] is True
+
+    response = client.get("/api/sessions", headers=AUTH)
+    assert [s["id"] for s in response.json()] == ["new", "old"]
+
+
+def test_users_who_never_archived_do_not_read_the_archive_index(
+    client, db, monkeypatch
+):
+    client.post("/api/body-metrics/profile", headers=AUTH)
+    add_finished_session(db, "new", 1)
+
+    reads = []
+    read = type(db)._read
+
+    def record_read(self, ref, field_paths=None):
+        reads.append(ref.path)
+        return read(self, ref, field_paths)
+
+    monkeypatch.setattr(type(db), "_read", record_read)
+    assert len(client.get("/api/sessions", headers=AUTH).json()) == 1
+    assert client.get("/api/sessions/missing", headers=AUTH).status_code == 404
+    assert INDEX not in reads
+
+
+def test_deleting_an_archived_session_updates_month_and_index_together(
+    client, db, monkeypatch
+):
+    add_finished_session(db, "a", 400)
+    add_finished_session(db, "b", 401)
+    archive_sessions.run(user_id="u1")
+
+    commits = []
+    apply = type(db)._apply
+
+    def record_commit(self, writes):
+        commits.append({ref.path for _, ref, _, _ in writes})
+        return apply(self, writes)
+
+    monkeypatch.setattr(type(db), "_apply", record_commit)
+    assert client.delete("/api/sessions/a", headers=AUTH).status_code == 204
+    month = date.today() - timedelta(days=400)
+    assert {INDEX, f"users/u1/session_archives/{month:%Y-%m}"} in commits
+    assert "a" not in db.documents[INDEX]["sessions"]
+    archived = get_session_archive().list_sessions("u1", None, None, 10)
+    assert [s["id"] for s in archived] == ["b"]
+    assert client.delete("/api/sessions/a", headers=AUTH).status_code == 404
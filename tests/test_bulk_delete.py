@@ -0,0 +1,128 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+
+from backend.services.bulk_delete import BulkDeleter
+from backend.services.firestore import get_firestore_service
+from backend.services.session_store import SessionStore, get_session_store
+
+AUTH = {"Authorization": "Bearer u1"}
+
+
+def create_exercise(client, name: str) -> str:
+    response = client.post(
+        "/api/exercises", json={"name": name, "muscle_group": "quads"}, headers=AUTH
+    )
+    return response.json()["id"]
+
+
+def test_removing_an_exercise_from_sessions_renumbers_the_rest(db):
+    store = SessionStore(get_firestore_service(), 512, flush_window=0)
+    now = datetime.now(timezone.utc)
+    db.documents["users/u1/sessions/s1"] = {
+        "date": now,
+        "start_time": now,
+        "end_time": now,
+        "performed_exercises": [],
+    }
+    # Squat is performed every third exercise, across several shards.
+    for n in range(12):
+        exercise_id = "squat" if n % 3 == 0 else f"e{n}"
+        store.add_exercise(
+            "u1", "s1", {"id": f"pe{n}", "exercise_id": exercise_id, "sets": []}
+        )
+        store.add_set("u1", "s1", f"pe{n}", lambda number: {"set_number": number})
+    assert db.documents["users/u1/sessions/s1"]["shard_count"] > 1
+
+    counts = BulkDeleter(get_firestore_service()).delete_exercise_references(
+        "u1", "squat", include_sessions=True
+    )
+
+    assert counts["performed_exercises"] == 4
+    performed = store.get("u1", "s1")["performed_exercises"]
+    assert [e["id"] for e in performed] == [f"pe{n}" for n in range(12) if n % 3]
+    assert [e["order"] for e in performed] == list(range(8))
+
+
+def test_a_dry_run_does_not_write_buffered_sessions(client, monkeypatch):
+    exercise_id = create_exercise(client, "Squat")
+
+    flushed = []
+    monkeypatch.setattr(
+        get_session_store(), "flush_all", lambda user_id=None: flushed.append(user_id)
+    )
+    response = client.delete(
+        f"/api/exercises/{exercise_id}?dry_run=true&include_sessions=true",
+        headers=AUTH,
+    )
+    assert response.status_code == 200
+    assert response.json()["dry_run"] is True
+    assert flushed == []
+
+
+def test_account_deletion_runs_on_the_job_queue_and_drops_the_users_jobs(
+    client, db
+):
+    create_exercise(client, "Squat")
+    db.documents["job_outbox/theirs"] = {"user_id": "u1", "failed": True}
+    db.documents["job_outbox/other"] = {"user_id": "u2", "failed": True}
+
+    with client:
+        assert client.post("/api/account/deletion", headers=AUTH).status_code == 202
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            job = client.get("/api/account/deletion", headers=AUTH).json()
+            if job["status"] == "completed":
+                break
+            time.sleep(0.01)
+
+    assert job["status"] == "completed"
+    assert job["counts"]["exercises"] == 1
+    assert job["counts"]["job_outbox"] == 1
+    assert not any(path.startswith("users/u1") for path in db.documents)
+    # Only the other user's job is left; the deletion's own was completed.
+    assert [p for p in db.documents if p.startswith("job_outbox/")] == [
+        "job_outbox/other"
+    ]
+
+
+def test_deleting_an_account_runs_off_the_event_loop(client, db, monkeypatch):
+    create_exercise(client, "Squat")
+    on_loop = []
+    delete_user_data = BulkDeleter.delete_user_data
+
+    def record(self, user_id, **kwargs):
+        try:
+            asyncio.get_running_loop()
+            on_loop.append(True)
+        except RuntimeError:
+            on_loop.append(False)
+        return delete_user_data(self, user_id, **kwargs)
+
+    monkeypatch.setattr(BulkDeleter, "delete_user_data", record)
+    response = client.delete("/api/account", headers=AUTH)
+
+    assert response.status_code == 200
+    assert response.json()["counts"]["exercises"] == 1
+    assert on_loop == [False]
+    assert not any(path.startswith("users/u1/exercises/") for path in db.documents)
+
+
+def test_deleted_accounts_documents_are_not_served_from_the_cache(client):
+    exercise_id = create_exercise(client, "Squat")
+    provision = {
+        "type": "exercise",
+        "exercise_id": exercise_id,
+        "target_sets": 3,
+        "target_reps": 5,
+    }
+    routine_id = client.post(
+        "/api/routines", json={"name": "Legs", "provisions": [provision]}, headers=AUTH
+    ).json()["id"]
+    urls = [f"/api/exercises/{exercise_id}", f"/api/routines/{routine_id}"]
+    for url in urls:
+        assert client.get(url, headers=AUTH).status_code == 200
+
+    assert client.delete("/api/account", headers=AUTH).status_code == 200
+    for url in urls:
+        assert client.get(url, headers=AUTH).status_code == 404
@@ -0,0 +1,91 @@
+import json
+import time
+from datetime import datetime, timezone
+
+import fakeredis
+import pytest
+
+from backend.services import cache
+from backend.services.cache import LocalCache, RedisCache
+
+TTL = 60
+
+
+@pytest.fixture
+def workers(monkeypatch):
+    """Two workers' caches sharing one in-memory Redis server."""
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(
+        cache.redis.Redis,
+        "from_url",
+        lambda url: fakeredis.FakeRedis(server=server),
+    )
+    caches = [RedisCache(prefix="test:") for _ in range(2)]
+    for worker in caches:
+        assert worker._subscribed.wait(2)
+    yield caches
+    for worker in caches:
+        worker.close()
+
+
+def eventually(check, timeout: float = 2) -> bool:
+    deadline = time.monotonic() + timeout
+    while not check():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_values_are_stored_as_json(workers):
+    a, _ = workers
+    value = {"name": "A", "created_at": datetime(2026, 10, 19, tzinfo=timezone.utc)}
+
+    assert a.get_or_load("k", lambda: value, TTL) == value
+    stored = a._redis.get("test:val:k")
+    assert json.loads(stored)[0] == 0
+    assert a.get("k") == value
+
+
+def test_an_invalidation_drops_every_workers_near_copy(workers):
+    a, b = workers
+    a.set("k", {"name": "A"}, a.version("k"), TTL)
+    assert b.get("k") == {"name": "A"}
+    assert b._near.get("k") is not None
+
+    assert a.invalidate("k") == 1
+    assert eventually(lambda: b._near.get("k") is None)
+    assert b.get("k") is None
+    assert b.version("k") == 1
+
+
+def test_a_load_that_missed_an_invalidation_is_not_served(workers):
+    a, b = workers
+    version = a.version("k")
+    # b updates the value while a is still loading the old one.
+    b.put("k", {"name": "B"}, TTL)
+    a.set("k", {"name": "A"}, version, TTL)
+
+    assert a.get("k") is None
+    assert b.get("k") is None
+    assert a.get_or_load("k", lambda: {"name": "B"}, TTL) == {"name": "B"}
+
+
+def test_a_value_that_is_not_json_is_a_miss(workers):
+    a, _ = workers
+    a._redis.set("test:val:k", b"\x80\x04not json")
+    assert a.get("k") is None
+
+
+def test_a_forgotten_version_still_rejects_older_loads():
+    local = LocalCache(max_entries=2)
+    version = local.version("a")
+    local.invalidate("a")
+    # Two more invalidations push "a" out of the versions kept.
+    local.invalidate("b")
+    local.invalidate("c")
+
+    local.set("a", {"name": "old"}, version, TTL)
+    assert local.get("a") is None
+    local.set("a", {"name": "new"}, local.version("a"), TTL)
+    assert local.get("a") == {"name": "new"}
@@ -0,0 +1,34 @@
+from datetime import date, timedelta
+
+from backend.services.calendar import TrainingCalendar
+from backend.services.firestore import get_firestore_service
+
+
+def train(calendar: TrainingCalendar, *days: date):
+    for day in days:
+        session = {"date": day.isoformat(), "end_time": None}
+        calendar.record_session("u1", f"s-{day}", session)
+
+
+def test_the_current_streak_runs_on_into_last_year(db):
+    calendar = TrainingCalendar(get_firestore_service())
+    new_year = date(2027, 1, 1)
+    train(calendar, *(new_year - timedelta(days=n) for n in range(1, 4)))
+
+    # Before the first session of the year, yesterday's run still counts.
+    assert calendar.year("u1", 2027, today=new_year)["current_streak"] == 3
+
+    train(calendar, new_year)
+    assert calendar.year("u1", 2027, today=new_year)["current_streak"] == 4
+    assert calendar.year("u1", 2027, today=date(2027, 1, 3))["current_streak"] == 0
+
+
+def test_any_year_the_endpoint_accepts_can_be_read(client):
+    for year in (1900, 2024, 9999):
+        response = client.get(
+            f"/api/sessions/calendar?year={year}",
+            headers={"Authorization": "Bearer u1"},
+        )
+        assert response.status_code == 200
+        days = 366 if year == 2024 else 365
+        assert response.json()["levels"] == [0] * days
@@ -0,0 +1,24 @@
+from backend import middleware
+from backend.middleware import choose_encoding
+
+AUTH = {"Authorization": "Bearer u1"}
+
+
+def test_without_brotli_clients_asking_for_br_get_gzip(client, monkeypatch):
+    monkeypatch.setattr(middleware, "brotli", None)
+    assert choose_encoding("br") is None
+    assert choose_encoding("br, gzip;q=0.5") == "gzip"
+
+    for n in range(20):
+        client.post(
+            "/api/exercises",
+            json={"name": f"Exercise {n}", "muscle_group": "chest", "notes": "x" * 50},
+            headers=AUTH,
+        )
+    response = client.get(
+        "/api/exercises", headers={**AUTH, "Accept-Encoding": "br, gzip"}
+    )
+    assert response.headers["content-encoding"] == "gzip"
+    assert len(response.json()) == 20
+    # The client decompressed the body; the length is what was sent.
+    assert int(response.headers["content-length"]) < len(response.content)
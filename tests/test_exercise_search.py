@@ -0,0 +1,70 @@
+import asyncio
+import threading
+from datetime import datetime, timezone
+
+from backend.auth import AuthenticatedUser
+from backend.models.exercise import Exercise
+from backend.routers import exercises
+from backend.services.exercise_search import ExerciseSearch
+
+
+def exercise(exercise_id: str, name: str) -> Exercise:
+    now = datetime.now(timezone.utc)
+    return Exercise(
+        id=exercise_id,
+        user_id="u1",
+        name=name,
+        muscle_group="quads",
+        created_at=now,
+        updated_at=now,
+    )
+
+
+def test_concurrent_first_searches_build_the_index_once_off_the_loop(
+    db, monkeypatch
+):
+    for n, name in enumerate(["Back Squat", "Front Squat", "Bench Press"]):
+        data = exercise(f"e{n}", name).model_dump(exclude={"id", "user_id"})
+        db.documents[f"users/u1/exercises/e{n}"] = data
+    monkeypatch.setattr(exercises, "exercise_search", ExerciseSearch())
+
+    queried_on = []
+    query = type(db)._query
+
+    def slow_query(self, q):
+        queried_on.append(threading.get_ident())
+        threading.Event().wait(0.05)
+        return query(self, q)
+
+    monkeypatch.setattr(type(db), "_query", slow_query)
+    user = AuthenticatedUser(uid="u1")
+
+    async def main():
+        return await asyncio.gather(*[
+            exercises.search_exercises(
+                q="squat", muscle_group=None, limit=20, user=user
+            )
+            for _ in range(5)
+        ])
+
+    results = asyncio.run(main())
+    names = [[e.name for e in result] for result in results]
+    assert names == [["Back Squat", "Front Squat"]] * 5
+    assert len(queried_on) == 1
+    assert queried_on[0] != threading.get_ident()
+
+
+def test_an_index_built_across_a_write_is_used_but_not_kept():
+    search = ExerciseSearch()
+
+    def load():
+        # A create commits while the index is being read.
+        search.upsert(exercise("e2", "Zercher Squat"))
+        return [exercise("e1", "Back Squat")]
+
+    index = search.index("u1", load)
+    assert [e.name for e in index.search("squat")] == ["Back Squat"]
+    assert search.cached("u1") is None
+
+    index = search.index("u1", lambda: [exercise("e1", "Back Squat")])
+    assert search.cached("u1") is index
@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+from backend.models.exercise import exercise_name_key
+from backend.services.firestore import FirestoreService
+
+AUTH = {"Authorization": "Bearer u1"}
+
+
+def create(client, name: str):
+    return client.post(
+        "/api/exercises", json={"name": name, "muscle_group": "chest"}, headers=AUTH
+    )
+
+
+@pytest.mark.parametrize("name", ["", "   ", "\t\n"])
+def test_blank_names_are_rejected(client, name):
+    assert create(client, name).status_code == 422
+
+
+@pytest.mark.parametrize("name", ["__x__", ".", "..", "a/b", " Bench  Press "])
+def test_any_other_name_gets_a_valid_reservation(client, db, name):
+    response = create(client, name)
+    assert response.status_code == 201
+    assert response.json()["name"] == name.strip()
+    key = exercise_name_key(name)
+    assert key.startswith("n:") and "/" not in key
+    assert f"users/u1/exercise_names/{key}" in db.documents
+
+
+def test_names_differing_in_case_and_spacing_clash(client):
+    assert create(client, "Bench Press").status_code == 201
+    assert create(client, " bench   PRESS").status_code == 400
+
+
+@pytest.mark.parametrize("field", ["name", "muscle_group", "category"])
+def test_required_fields_cannot_be_patched_to_null(client, db, field):
+    exercise = create(client, "Bench Press").json()
+    response = client.patch(
+        f"/api/exercises/{exercise['id']}", json={field: None}, headers=AUTH
+    )
+    assert response.status_code == 422
+    assert db.documents[f"users/u1/exercises/{exercise['id']}"][field] is not None
+
+    response = client.patch(
+        f"/api/exercises/{exercise['id']}", json={"notes": None}, headers=AUTH
+    )
+    assert response.status_code == 200
+
+
+def test_updates_and_deletes_run_their_transactions_off_the_event_loop(
+    client, monkeypatch
+):
+    exercise = create(client, "Bench Press").json()
+    on_loop = []
+    transact = FirestoreService.transact
+
+    def record(self, fn):
+        try:
+            asyncio.get_running_loop()
+            on_loop.append(True)
+        except RuntimeError:
+            on_loop.append(False)
+        return transact(self, fn)
+
+    monkeypatch.setattr(FirestoreService, "transact", record)
+    url = f"/api/exercises/{exercise['id']}"
+    assert client.patch(url, json={"notes": "pause"}, headers=AUTH).status_code == 200
+    assert client.delete(url, headers=AUTH).status_code == 204
+    assert on_loop == [False, False]
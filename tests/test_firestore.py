@@ -0,0 +1,152 @@
+import threading
+import time
+
+import pytest
+from firebase_admin import firestore
+from google.api_core.exceptions import NotFound, ServiceUnavailable
+
+from backend.config import settings
+from backend.services import firestore as firestore_service
+from backend.services.firestore import get_firestore_service
+from backend.services.resilience import (
+    BreakerState,
+    CircuitBreaker,
+    FirestoreUnavailable,
+)
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(settings, "FIRESTORE_RETRY_BASE_SECONDS", 0.001)
+    monkeypatch.setattr(settings, "FIRESTORE_RETRY_MAX_SECONDS", 0.001)
+
+
+def use_breaker(monkeypatch, min_calls: int, reset_timeout: float) -> CircuitBreaker:
+    breaker = CircuitBreaker(
+        "test",
+        failure_rate=0.5,
+        min_calls=min_calls,
+        window=60,
+        reset_timeout=reset_timeout,
+    )
+    monkeypatch.setattr(firestore_service, "breaker", breaker)
+    return breaker
+
+
+def test_reads_are_retried_after_a_transient_error(db):
+    db.documents["users/u1"] = {"name": "A"}
+    db.fail(ServiceUnavailable("blip"), ServiceUnavailable("blip"))
+
+    fs = get_firestore_service()
+    assert fs.read(fs.get_user_doc("u1").get).to_dict() == {"name": "A"}
+    assert db.stats["reads"] == 1
+
+
+def test_reads_give_up_after_the_last_attempt(db):
+    db.fail(*[ServiceUnavailable("down")] * settings.FIRESTORE_READ_ATTEMPTS)
+
+    fs = get_firestore_service()
+    with pytest.raises(FirestoreUnavailable):
+        fs.read(fs.get_user_doc("u1").get)
+    assert not db._faults
+
+
+def test_writes_are_not_retried(db):
+    db.fail(ServiceUnavailable("blip"))
+
+    fs = get_firestore_service()
+    with pytest.raises(FirestoreUnavailable):
+        fs.write(fs.get_user_doc("u1").set, {"name": "A"})
+    assert "users/u1" not in db.documents
+
+
+def test_errors_about_the_request_are_raised_as_they_are(db):
+    fs = get_firestore_service()
+    with pytest.raises(NotFound):
+        fs.write(fs.get_user_doc("u1").update, {"name": "A"})
+
+
+def test_calls_get_the_deadline_and_retries_stop_at_it(db, monkeypatch):
+    monkeypatch.setattr(settings, "FIRESTORE_TIMEOUT_SECONDS", 0.05)
+    monkeypatch.setattr(
+        firestore_service,
+        "backoff_delays",
+        lambda attempts, base, maximum: iter([0.01, 0.1][: attempts - 1]),
+    )
+    calls = []
+
+    def read(**kwargs):
+        calls.append(kwargs)
+        raise ServiceUnavailable("slow")
+
+    # The first retry fits in the 50 ms deadline; waiting for the second
+    # would not, so the read gives up without it.
+    with pytest.raises(FirestoreUnavailable):
+        get_firestore_service().read(read)
+    assert calls == [{"timeout": 0.05, "retry": None}] * 2
+
+
+def test_an_open_breaker_rejects_calls_without_trying(db, monkeypatch):
+    breaker = use_breaker(monkeypatch, min_calls=2, reset_timeout=60)
+    db.fail(*[ServiceUnavailable("down")] * 2)
+    fs = get_firestore_service()
+    with pytest.raises(FirestoreUnavailable):
+        fs.read(fs.get_user_doc("u1").get)
+    assert breaker.state == BreakerState.OPEN
+
+    with pytest.raises(FirestoreUnavailable) as raised:
+        fs.read(fs.get_user_doc("u1").get)
+    assert raised.value.retry_after == 60
+    assert db.stats["reads"] == 0
+
+
+def test_retries_stop_once_the_breaker_opens(db, monkeypatch):
+    use_breaker(monkeypatch, min_calls=1, reset_timeout=60)
+    db.fail(ServiceUnavailable("down"), ServiceUnavailable("down"))
+
+    fs = get_firestore_service()
+    with pytest.raises(FirestoreUnavailable) as raised:
+        fs.read(fs.get_user_doc("u1").get)
+    # The first failure opened the breaker; the retry was not sent.
+    assert raised.value.retry_after == 60
+    assert len(db._faults) == 1
+
+
+def test_a_half_open_breaker_sends_one_probe_and_does_not_retry_it(db, monkeypatch):
+    breaker = use_breaker(monkeypatch, min_calls=1, reset_timeout=0.05)
+    db.fail(ServiceUnavailable("down"))
+    fs = get_firestore_service()
+    with pytest.raises(FirestoreUnavailable):
+        fs.read(fs.get_user_doc("u1").get)
+    assert breaker.state == BreakerState.OPEN
+
+    # The probe fails and opens the breaker again, so it is not retried.
+    time.sleep(0.05)
+    db.fail(ServiceUnavailable("down"), ServiceUnavailable("down"))
+    with pytest.raises(FirestoreUnavailable):
+        fs.read(fs.get_user_doc("u1").get)
+    assert len(db._faults) == 1
+
+    # A probe that succeeds closes it.
+    time.sleep(0.05)
+    db._faults.clear()
+    db.documents["users/u1"] = {"name": "A"}
+    assert fs.read(fs.get_user_doc("u1").get).exists
+    assert breaker.state == BreakerState.CLOSED
+
+
+def test_a_hung_transaction_gives_up_at_the_deadline(db, monkeypatch):
+    monkeypatch.setattr(settings, "FIRESTORE_TIMEOUT_SECONDS", 0.05)
+    release = threading.Event()
+
+    @firestore.transactional
+    def hang(transaction):
+        release.wait(2)
+
+    started = time.monotonic()
+    try:
+        with pytest.raises(FirestoreUnavailable):
+            get_firestore_service().transact(hang)
+        assert time.monotonic() - started < 1
+    finally:
+        release.set()
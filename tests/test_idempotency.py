@@ -0,0 +1,73 @@
+import pytest
+
+from backend.services import idempotency
+from backend.services.idempotency import MAX_KEY_LENGTH, MemoryIdempotencyStore
+
+AUTH = {"Authorization": "Bearer u1"}
+
+
+@pytest.fixture(autouse=True)
+def store(monkeypatch):
+    monkeypatch.setattr(idempotency, "idempotency_store", MemoryIdempotencyStore())
+
+
+def keyed(key: str) -> dict:
+    return {**AUTH, "Idempotency-Key": key}
+
+
+def sessions(db) -> list[str]:
+    return [path for path in db.documents if path.startswith("users/u1/sessions/")]
+
+
+def test_a_retry_gets_the_original_response(client, db):
+    body = {"date": "2026-10-19"}
+    first = client.post("/api/sessions", json=body, headers=keyed("k1"))
+    retry = client.post("/api/sessions", json=body, headers=keyed("k1"))
+
+    assert first.status_code == retry.status_code == 201
+    assert retry.json() == first.json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert len(sessions(db)) == 1
+
+
+def test_reusing_a_key_for_a_different_request_is_a_conflict(client, db):
+    client.post("/api/sessions", json={"date": "2026-10-19"}, headers=keyed("k1"))
+    response = client.post(
+        "/api/sessions", json={"date": "2026-10-20"}, headers=keyed("k1")
+    )
+    assert response.status_code == 409
+    assert len(sessions(db)) == 1
+
+
+def test_the_query_string_is_part_of_the_request(client):
+    session_id = client.post(
+        "/api/sessions", json={"date": "2026-10-19"}, headers=AUTH
+    ).json()["id"]
+    url = f"/api/sessions/{session_id}/exercises"
+
+    full = client.post(url, json={"exercise_id": "e1"}, headers=keyed("k2"))
+    delta = client.post(
+        url + "?delta=true", json={"exercise_id": "e1"}, headers=keyed("k2")
+    )
+    assert full.status_code == 200
+    assert delta.status_code == 409
+
+
+@pytest.mark.parametrize("key", ["", "has space", "k" * (MAX_KEY_LENGTH + 1)])
+def test_a_malformed_key_is_rejected(client, db, key):
+    response = client.post(
+        "/api/sessions", json={"date": "2026-10-19"}, headers=keyed(key)
+    )
+    assert response.status_code == 400
+    assert sessions(db) == []
+
+
+def test_a_failed_request_frees_its_key(client):
+    url = "/api/sessions/missing/exercises"
+    response = client.post(url, json={"exercise_id": "e1"}, headers=keyed("k3"))
+    assert response.status_code == 404
+
+    session_id = client.post(
+        "/api/sessions", json={"date": "2026-10-19"}, headers=keyed("k3")
+    ).json()["id"]
+    assert session_id
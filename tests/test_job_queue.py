@@ -0,0 +1,94 @@
+import asyncio
+import threading
+
+from backend.services.job_queue import JobOutbox, JobQueue, _handlers
+
+
+class BrokenOutbox(JobOutbox):
+    """An outbox whose writes fail, recording the thread each ran on."""
+
+    def __init__(self, put_fails: bool = False, delete_fails: bool = False):
+        self.put_fails = put_fails
+        self.delete_fails = delete_fails
+        self.threads = []
+
+    def put(self, job):
+        self.threads.append(("put", threading.get_ident()))
+        if self.put_fails:
+            raise RuntimeError("outbox down")
+
+    def delete(self, job_id):
+        self.threads.append(("delete", threading.get_ident()))
+        if self.delete_fails:
+            raise RuntimeError("outbox down")
+
+    def load(self):
+        return []
+
+
+def run_jobs(outbox: JobOutbox, count: int) -> tuple[int, bool]:
+    """Enqueue ``count`` jobs for one user and wait for the queue to drain.
+
+    Returns the event loop's thread and whether the queue drained.
+    """
+
+    async def main():
+        queue = JobQueue(workers=1, max_attempts=2, retry_base=0, outbox=outbox)
+        await queue.start()
+        try:
+            for n in range(count):
+                queue.enqueue("u1", "test_job", {"n": n})
+            for _ in range(200):
+                await asyncio.sleep(0.005)
+                if not queue._active:
+                    break
+            return threading.get_ident(), not queue._active
+        finally:
+            await queue.stop()
+
+    return asyncio.run(main())
+
+
+def test_a_failing_outbox_delete_does_not_stall_the_users_jobs(monkeypatch):
+    ran = []
+    monkeypatch.setitem(
+        _handlers, "test_job", lambda user_id, payload: ran.append(payload)
+    )
+    outbox = BrokenOutbox(delete_fails=True)
+
+    loop_thread, drained = run_jobs(outbox, 3)
+
+    assert drained
+    assert ran == [{"n": 0}, {"n": 1}, {"n": 2}]
+    deletes = [thread for op, thread in outbox.threads if op == "delete"]
+    assert len(deletes) == 3 and loop_thread not in deletes
+
+
+def test_jobs_still_run_when_the_outbox_cannot_record_them(monkeypatch):
+    ran = []
+    monkeypatch.setitem(
+        _handlers, "test_job", lambda user_id, payload: ran.append(payload)
+    )
+
+    _, drained = run_jobs(BrokenOutbox(put_fails=True), 2)
+
+    assert drained
+    assert ran == [{"n": 0}, {"n": 1}]
+
+
+def test_a_failed_job_is_retried_when_the_outbox_cannot_record_the_failure(
+    monkeypatch,
+):
+    attempts = []
+
+    def flaky(user_id, payload):
+        attempts.append(payload)
+        if len(attempts) == 1:
+            raise RuntimeError("first attempt fails")
+
+    monkeypatch.setitem(_handlers, "test_job", flaky)
+
+    _, drained = run_jobs(BrokenOutbox(put_fails=True), 1)
+
+    assert drained
+    assert attempts == [{"n": 0}, {"n": 0}]
@@ -0,0 +1,33 @@
+from backend.services.profiles import profiles
+
+AUTH = {"Authorization": "Bearer u1"}
+PROFILE = "/api/body-metrics/profile"
+
+
+def test_reading_a_profile_never_creates_one(client, db):
+    assert client.get(PROFILE, headers=AUTH).status_code == 404
+    response = client.patch(PROFILE, json={"height_cm": 180}, headers=AUTH)
+    assert response.status_code == 404
+    assert "users/u1" not in db.documents
+    assert db.stats["writes"] == 0
+
+    created = client.post(PROFILE, headers=AUTH).json()
+    assert created["email"] == "u1@example.com"
+    assert client.get(PROFILE, headers=AUTH).json() == created
+    updated = client.patch(PROFILE, json={"height_cm": 180}, headers=AUTH).json()
+    assert updated["height_cm"] == 180
+    assert db.stats["writes"] == 2
+
+
+def test_changed_claims_are_stored_at_sign_in_not_on_every_request(client, db):
+    client.post(PROFILE, headers=AUTH)
+    profiles.forget("u1")
+    db.documents["users/u1"]["email"] = "old@example.com"
+    db.stats.clear()
+
+    assert client.get(PROFILE, headers=AUTH).json()["email"] == "old@example.com"
+    assert db.stats["writes"] == 0
+
+    assert client.post(PROFILE, headers=AUTH).json()["email"] == "u1@example.com"
+    assert db.documents["users/u1"]["email"] == "u1@example.com"
+    assert db.stats["writes"] == 1
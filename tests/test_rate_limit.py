@@ -0,0 +1,50 @@
+from backend.services import rate_limit as rate_limit_service
+from backend.services.rate_limit import RateLimiter
+
+AUTH = {"Authorization": "Bearer u1"}
+
+
+def use_limiter(monkeypatch, **kwargs) -> RateLimiter:
+    limiter = RateLimiter(**kwargs)
+    monkeypatch.setattr(rate_limit_service, "rate_limiter", limiter)
+    return limiter
+
+
+def test_requests_over_the_burst_get_429_with_retry_after(client, monkeypatch):
+    use_limiter(monkeypatch, rate=0.5, burst=2, max_concurrent=8)
+
+    assert client.get("/api/exercises", headers=AUTH).status_code == 200
+    assert client.get("/api/exercises", headers=AUTH).status_code == 200
+    response = client.get("/api/exercises", headers=AUTH)
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "2"
+
+    # Other users have their own buckets.
+    other = client.get("/api/exercises", headers={"Authorization": "Bearer u2"})
+    assert other.status_code == 200
+
+
+def test_a_failed_request_gives_back_its_concurrency_slot(client, monkeypatch):
+    limiter = use_limiter(monkeypatch, rate=100, burst=100, max_concurrent=1)
+
+    for _ in range(3):
+        response = client.get("/api/exercises/missing", headers=AUTH)
+        assert response.status_code == 404
+    assert limiter._in_flight == {}
+    assert client.get("/api/exercises", headers=AUTH).status_code == 200
+
+
+def test_a_user_at_the_concurrency_cap_is_refused(client, monkeypatch):
+    limiter = use_limiter(monkeypatch, rate=100, burst=100, max_concurrent=1)
+    assert limiter.acquire("u1")
+
+    response = client.get("/api/exercises", headers=AUTH)
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1"
+    limiter.release("u1")
+    assert client.get("/api/exercises", headers=AUTH).status_code == 200
+
+
+def test_a_rate_of_zero_turns_the_buckets_off():
+    limiter = RateLimiter(rate=0, burst=1, max_concurrent=1)
+    assert [limiter.take("u1") for _ in range(5)] == [0] * 5
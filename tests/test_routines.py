@@ -0,0 +1,99 @@
+import fakeredis
+
+from backend.models.routine import (
+    PROVISIONS_FORMAT,
+    _provisions_adapter,
+    decode_provisions,
+    encode_provisions,
+)
+from backend.services import cache
+from backend.services.cache import RedisCache
+
+AUTH = {"Authorization": "Bearer u1"}
+
+
+def create_routine(client) -> dict:
+    exercise = client.post(
+        "/api/exercises", json={"name": "Squat", "muscle_group": "quads"}, headers=AUTH
+    ).json()
+    provision = {
+        "type": "exercise",
+        "exercise_id": exercise["id"],
+        "target_sets": 3,
+        "target_reps": 5,
+    }
+    response = client.post(
+        "/api/routines", json={"name": "Legs", "provisions": [provision]}, headers=AUTH
+    )
+    assert response.status_code == 201
+    return response.json()
+
+
+def test_null_provisions_are_rejected_instead_of_clearing_them(client):
+    routine = create_routine(client)
+    response = client.patch(
+        f"/api/routines/{routine['id']}", json={"provisions": None}, headers=AUTH
+    )
+    assert response.status_code == 422
+
+    response = client.get(f"/api/routines/{routine['id']}", headers=AUTH)
+    assert len(response.json()["provisions"]) == 1
+
+
+def test_left_out_provisions_are_kept_and_an_empty_list_clears_them(client):
+    routine = create_routine(client)
+    url = f"/api/routines/{routine['id']}"
+    response = client.patch(url, json={"name": "Leg day"}, headers=AUTH)
+    assert response.status_code == 200
+    assert len(response.json()["provisions"]) == 1
+
+    response = client.patch(url, json={"provisions": []}, headers=AUTH)
+    assert response.json()["provisions"] == []
+
+
+def test_stored_provisions_read_back_as_they_were_written():
+    item = {"exercise_id": "e1", "target_sets": 3, "target_reps": 5}
+    provisions = _provisions_adapter.validate_python([
+        {"type": "exercise", "id": "p1", "notes": "slow", **item},
+        {
+            "type": "superset",
+            "id": "p2",
+            "order": 1,
+            "items": [
+                {"id": "i1", **item},
+                {"id": "i2", "order": 1, "target_weight": 20.5, **item},
+            ],
+        },
+    ])
+
+    decoded = decode_provisions(encode_provisions(provisions), PROVISIONS_FORMAT)
+    assert decoded == provisions
+    assert [type(p) for p in decoded] == [type(p) for p in provisions]
+    assert decoded[1].items[1].rest_seconds == 90
+
+
+def test_routines_are_cached_in_redis(client, db, monkeypatch):
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(
+        cache.redis.Redis, "from_url", lambda url: fakeredis.FakeRedis(server=server)
+    )
+    shared = RedisCache(prefix="test:")
+    monkeypatch.setattr(cache, "_cache", shared)
+    routine = create_routine(client)
+    url = f"/api/routines/{routine['id']}"
+    key = f"test:val:{cache.doc_key('routines', 'u1', routine['id'])}"
+
+    try:
+        first = client.get(url, headers=AUTH).json()
+        assert shared._redis.get(key) is not None
+        # Served from Redis alone, as another worker would be.
+        stored = db.documents.pop(f"users/u1/routines/{routine['id']}")
+        shared._near.clear()
+        assert client.get(url, headers=AUTH).json() == first
+        db.documents[f"users/u1/routines/{routine['id']}"] = stored
+
+        updated = client.patch(url, json={"name": "Leg day"}, headers=AUTH).json()
+        assert shared._redis.get(key) is not None
+        assert client.get(url, headers=AUTH).json() == updated
+    finally:
+        shared.close()
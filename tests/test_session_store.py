@@ -0,0 +1,166 @@
+import asyncio
+import statistics
+import threading
+from datetime import datetime, timezone
+
+import pytest
+
+from backend.services.firestore import get_firestore_service
+from backend.services.session_store import (
+    PerformedExerciseTooLarge,
+    SessionStore,
+    estimate_size,
+)
+
+THRESHOLD = 16 * 1024
+
+
+def new_session(db, session_id: str = "s1") -> str:
+    now = datetime.now(timezone.utc)
+    db.documents[f"users/u1/sessions/{session_id}"] = {
+        "date": now,
+        "start_time": now,
+        "end_time": None,
+        "performed_exercises": [],
+        "created_at": now,
+        "updated_at": now,
+    }
+    return session_id
+
+
+def add_exercise(store: SessionStore, session_id: str, n: int) -> str:
+    exercise_id = f"pe{n}"
+    store.add_exercise(
+        "u1", session_id, {"id": exercise_id, "exercise_id": f"e{n}", "sets": []}
+    )
+    return exercise_id
+
+
+def build_set(set_number: int) -> dict:
+    return {
+        "set_number": set_number,
+        "reps": 5,
+        "weight": 100.0,
+        "rpe": 8.0,
+        "completed": True,
+        "notes": "felt strong, keep the weight next week",
+    }
+
+
+def test_2000_sets_in_one_session_keep_each_write_bounded(db):
+    store = SessionStore(get_firestore_service(), THRESHOLD, flush_window=0)
+    session_id = new_session(db)
+    written = []
+    exercise_id = None
+    for i in range(2000):
+        if i % 10 == 0:
+            exercise_id = add_exercise(store, session_id, i // 10)
+        before = len(db.history)
+        store.add_set("u1", session_id, exercise_id, build_set)
+        written.append(
+            sum(estimate_size(data) for _, data in db.history[before:] if data)
+        )
+
+    # Without sharding the last write would rewrite all 2,000 sets, and the
+    # second thousand would write three times as much as the first.
+    assert max(written) <= THRESHOLD * 1.5
+    assert statistics.mean(written[1000:]) < 1.25 * statistics.mean(written[:1000])
+    assert db.documents[f"users/u1/sessions/{session_id}"]["shard_count"] > 1
+
+    session = store.get("u1", session_id)
+    performed = session["performed_exercises"]
+    assert [exercise["order"] for exercise in performed] == list(range(200))
+    assert sum(len(exercise["sets"]) for exercise in performed) == 2000
+
+
+def test_sets_can_still_be_added_to_a_spilled_exercise(db):
+    store = SessionStore(get_firestore_service(), THRESHOLD, flush_window=0)
+    session_id = new_session(db)
+    first = add_exercise(store, session_id, 0)
+    for n in range(1, 60):
+        exercise_id = add_exercise(store, session_id, n)
+        for _ in range(10):
+            store.add_set("u1", session_id, exercise_id, build_set)
+
+    assert first in db.documents[f"users/u1/sessions/{session_id}"]["shard_index"]
+    new_set, _ = store.add_set("u1", session_id, first, build_set)
+    assert new_set["set_number"] == 1
+    performed = store.get("u1", session_id)["performed_exercises"]
+    assert performed[0]["sets"] == [new_set]
+
+
+def test_one_exercise_cannot_outgrow_half_the_threshold(db):
+    store = SessionStore(get_firestore_service(), THRESHOLD, flush_window=0)
+    session_id = new_session(db)
+    exercise_id = add_exercise(store, session_id, 0)
+    with pytest.raises(PerformedExerciseTooLarge):
+        for _ in range(2000):
+            store.add_set("u1", session_id, exercise_id, build_set)
+
+    document = db.documents[f"users/u1/sessions/{session_id}"]
+    assert estimate_size(document) <= THRESHOLD
+    # The refused set was not kept.
+    sets = document["performed_exercises"][0]["sets"]
+    assert sets[-1]["set_number"] == len(sets)
+
+
+def test_mutations_of_different_sessions_do_not_wait_on_each_other(db, monkeypatch):
+    store = SessionStore(get_firestore_service(), THRESHOLD, flush_window=0)
+    slow, fast = new_session(db, "slow"), new_session(db, "fast")
+    slow_exercise = add_exercise(store, slow, 0)
+    fast_exercise = add_exercise(store, fast, 0)
+
+    reading, release = threading.Event(), threading.Event()
+    read = type(db)._read
+
+    def blocking_read(self, ref, field_paths=None):
+        if ref.id == slow:
+            reading.set()
+            release.wait(5)
+        return read(self, ref, field_paths)
+
+    monkeypatch.setattr(type(db), "_read", blocking_read)
+    thread = threading.Thread(
+        target=store.add_set, args=("u1", slow, slow_exercise, build_set)
+    )
+    thread.start()
+    try:
+        assert reading.wait(5)
+        # The slow session's lock is held across its read.
+        done = threading.Thread(
+            target=store.add_set, args=("u1", fast, fast_exercise, build_set)
+        )
+        done.start()
+        done.join(2)
+        assert not done.is_alive()
+    finally:
+        release.set()
+        thread.join()
+    assert store._session_locks == {}
+
+
+def test_write_behind_flushes_off_the_event_loop(db, monkeypatch):
+    store = SessionStore(get_firestore_service(), THRESHOLD, flush_window=0.01)
+    session_id = new_session(db)
+    exercise_id = add_exercise(store, session_id, 0)
+    flushed_on = []
+    flush = store._flush
+
+    def record_flush(ref):
+        flushed_on.append(threading.get_ident())
+        flush(ref)
+
+    monkeypatch.setattr(store, "_flush", record_flush)
+
+    async def main():
+        store.add_set("u1", session_id, exercise_id, build_set)
+        assert store._buffered
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if not store._buffered:
+                break
+
+    asyncio.run(main())
+    assert flushed_on and threading.get_ident() not in flushed_on
+    sets = db.documents[f"users/u1/sessions/{session_id}"]["performed_exercises"][0]
+    assert len(sets["sets"]) == 1
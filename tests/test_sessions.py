@@ -0,0 +1,42 @@
+import threading
+
+from backend.routers.sessions import _update_session_doc
+from backend.services.firestore import get_firestore_service
+
+AUTH = {"Authorization": "Bearer u1"}
+
+
+def test_racing_session_updates_get_different_versions(db, monkeypatch):
+    db.documents["users/u1/sessions/s1"] = {"notes": None, "version": 1}
+    fs = get_firestore_service()
+    ref = fs.get_user_collection("u1", "sessions").document("s1")
+    other = threading.Thread(target=_update_session_doc, args=(fs, ref, {"notes": "b"}))
+    read = type(db)._read
+
+    def racing_read(self, doc_ref, field_paths=None):
+        snapshot = read(self, doc_ref, field_paths)
+        if other.ident is None:
+            # Another instance updates the session between our read and write.
+            other.start()
+            other.join(0.1)
+        return snapshot
+
+    monkeypatch.setattr(type(db), "_read", racing_read)
+    update = _update_session_doc(fs, ref, {"notes": "a"})
+    other.join()
+
+    assert update["version"] == 2
+    assert db.documents["users/u1/sessions/s1"] == {"notes": "b", "version": 3}
+
+
+def test_finishing_a_session_bumps_its_version(client, db):
+    session = client.post(
+        "/api/sessions", json={"date": "2026-10-19"}, headers=AUTH
+    ).json()
+    response = client.post(f"/api/sessions/{session['id']}/finish", headers=AUTH)
+    assert response.status_code == 200
+    assert response.json()["version"] == session["version"] + 1
+    assert response.json()["end_time"] is not None
+
+    response = client.post("/api/sessions/missing/finish", headers=AUTH)
+    assert response.status_code == 404
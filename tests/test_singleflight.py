@@ -0,0 +1,135 @@
+import asyncio
+import threading
+
+from backend.services.job_queue import JobOutbox, JobQueue, _handlers
+from backend.services.singleflight import SingleFlight, single_flight
+
+
+class Loader:
+    """A read whose calls block until released, returning the current data."""
+
+    def __init__(self):
+        self.data = "v1"
+        self.calls = 0
+        self.release = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        data = self.data
+        self.release.wait(5)
+        return data
+
+
+async def settle():
+    # Let threadpool calls start before the test carries on.
+    for _ in range(20):
+        await asyncio.sleep(0.005)
+
+
+def test_identical_concurrent_reads_share_one_call():
+    async def main():
+        flights = SingleFlight("test")
+        load = Loader()
+        reads = [
+            asyncio.create_task(flights.do("u1", "exercises", load)) for _ in range(5)
+        ]
+        await settle()
+        load.release.set()
+        assert await asyncio.gather(*reads) == ["v1"] * 5
+        assert load.calls == 1
+        assert flights.coalesce_rate() == 0.8
+
+    asyncio.run(main())
+
+
+def test_read_after_a_write_does_not_join_a_read_from_before_it():
+    async def main():
+        flights = SingleFlight("test")
+        load = Loader()
+        stale = asyncio.create_task(flights.do("u1", "exercises", load))
+        await settle()
+
+        # A write commits while the first read is in flight.
+        load.data = "v2"
+        flights.invalidate("u1")
+
+        fresh = asyncio.create_task(flights.do("u1", "exercises", load))
+        await settle()
+        load.release.set()
+        assert await stale == "v1"
+        assert await fresh == "v2"
+        assert load.calls == 2
+
+    asyncio.run(main())
+
+
+def test_reads_after_the_write_still_coalesce_with_each_other():
+    async def main():
+        flights = SingleFlight("test")
+        load = Loader()
+        stale = asyncio.create_task(flights.do("u1", "exercises", load))
+        await settle()
+        load.data = "v2"
+        flights.invalidate("u1")
+
+        fresh = [
+            asyncio.create_task(flights.do("u1", "exercises", load)) for _ in range(3)
+        ]
+        await settle()
+        load.release.set()
+        assert await stale == "v1"
+        assert await asyncio.gather(*fresh) == ["v2"] * 3
+        assert load.calls == 2
+
+    asyncio.run(main())
+
+
+def test_a_write_by_another_user_does_not_split_reads():
+    async def main():
+        flights = SingleFlight("test")
+        load = Loader()
+        first = asyncio.create_task(flights.do("u1", "exercises", load))
+        await settle()
+        flights.invalidate("u2")
+        second = asyncio.create_task(flights.do("u1", "exercises", load))
+        await settle()
+        load.release.set()
+        assert await asyncio.gather(first, second) == ["v1", "v1"]
+        assert load.calls == 1
+
+    asyncio.run(main())
+
+
+class MemoryOutbox(JobOutbox):
+    def put(self, job):
+        pass
+
+    def delete(self, job_id):
+        pass
+
+    def load(self):
+        return []
+
+
+def test_a_background_job_invalidates_the_users_reads(monkeypatch):
+    monkeypatch.setitem(_handlers, "test_rename", lambda user_id, payload: None)
+
+    async def main():
+        load = Loader()
+        queue = JobQueue(workers=1, outbox=MemoryOutbox())
+        await queue.start()
+        try:
+            stale = asyncio.create_task(single_flight.do("u1", "exercises", load))
+            await settle()
+            # The job changes data the read returns.
+            load.data = "v2"
+            queue.enqueue("u1", "test_rename", {})
+            await settle()
+            fresh = asyncio.create_task(single_flight.do("u1", "exercises", load))
+            await settle()
+            load.release.set()
+            assert (await stale, await fresh) == ("v1", "v2")
+        finally:
+            await queue.stop()
+
+    asyncio.run(main())
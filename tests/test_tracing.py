@@ -0,0 +1,109 @@
+import pytest
+
+from backend.config import settings
+from backend.services import tracing
+from backend.services.tracing import NOOP_SPAN, SpanExporter, SpanProcessor, tracer
+
+AUTH = {"Authorization": "Bearer u1"}
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+
+
+class ListExporter(SpanExporter):
+    def __init__(self):
+        self.spans = []
+
+    def export(self, spans):
+        self.spans.extend(spans)
+
+
+@pytest.fixture
+def exported(monkeypatch):
+    """Spans exported by the app's tracer, once ``flush()`` is called."""
+    exporter = ListExporter()
+    processor = SpanProcessor(exporter, interval=60)
+    monkeypatch.setattr(tracer, "processor", processor)
+    monkeypatch.setattr(tracer, "enabled", True)
+    monkeypatch.setattr(tracer, "_sample_rate", 1.0)
+    yield exporter
+    processor.shutdown()
+
+
+@pytest.mark.parametrize(
+    "traceparent",
+    [
+        "garbage",
+        f"00-{TRACE_ID}-{PARENT_ID}",
+        f"00-{TRACE_ID.upper()}-{PARENT_ID}-01",
+        f"00-{'0' * 32}-{PARENT_ID}-01",
+        f"00-{TRACE_ID}-{'0' * 16}-01",
+        f"ff-{TRACE_ID}-{PARENT_ID}-01",
+    ],
+)
+def test_an_invalid_traceparent_starts_a_new_trace(exported, traceparent):
+    span = tracer.start_trace("GET /", traceparent=traceparent, tracestate="k=v")
+
+    assert span.recording
+    assert span.trace_id != TRACE_ID
+    assert int(span.trace_id, 16)
+    assert span.parent_id is None
+    assert span.trace_state is None
+
+
+def test_the_callers_sampled_flag_is_honored(exported, monkeypatch):
+    sampled = tracer.start_trace("GET /", traceparent=f"00-{TRACE_ID}-{PARENT_ID}-01")
+    assert (sampled.trace_id, sampled.parent_id) == (TRACE_ID, PARENT_ID)
+    assert tracer.start_trace("GET /", f"00-{TRACE_ID}-{PARENT_ID}-00") is NOOP_SPAN
+
+    # The caller's decision stands over the sample rate either way.
+    monkeypatch.setattr(tracer, "_sample_rate", 0.0)
+    assert tracer.start_trace("GET /") is NOOP_SPAN
+    assert tracer.start_trace("GET /", f"00-{TRACE_ID}-{PARENT_ID}-01").recording
+
+
+def test_a_span_is_the_parent_of_spans_started_within_it(exported):
+    with tracer.start_trace("GET /") as root:
+        with tracer.span("outer") as outer:
+            with tracer.span("inner") as inner:
+                pass
+        assert tracer.current() is root
+
+    assert (outer.parent_id, inner.parent_id) == (root.span_id, outer.span_id)
+    assert {outer.trace_id, inner.trace_id} == {root.trace_id}
+    assert tracer.current() is NOOP_SPAN
+
+
+def test_spans_within_a_request_join_the_callers_trace(client, exported):
+    response = client.get(
+        "/api/exercises",
+        headers={**AUTH, "traceparent": f"00-{TRACE_ID}-{PARENT_ID}-01"},
+    )
+    assert response.status_code == 200
+    tracer.processor.flush()
+
+    [root] = [span for span in exported.spans if span.kind == "server"]
+    children = {span.name: span for span in exported.spans if span is not root}
+    assert {span.trace_id for span in exported.spans} == {TRACE_ID}
+    assert root.parent_id == PARENT_ID
+    assert "firestore.query" in children
+    assert {span.parent_id for span in children.values()} == {root.span_id}
+    assert response.headers["traceparent"] == f"00-{TRACE_ID}-{root.span_id}-01"
+    # Outside the request there is no current span to be a child of.
+    assert tracer.span("later") is NOOP_SPAN
+
+
+def test_nothing_is_traced_with_tracing_off(client, monkeypatch):
+    monkeypatch.setattr(settings, "TRACING_EXPORTER", "")
+    off = tracing._tracer()
+    assert not off.enabled
+    assert off.start_trace("GET /", f"00-{TRACE_ID}-{PARENT_ID}-01") is NOOP_SPAN
+
+    # A span ending here would fail for want of a processor.
+    monkeypatch.setattr(tracer, "processor", off.processor)
+    monkeypatch.setattr(tracer, "enabled", off.enabled)
+    response = client.get(
+        "/api/exercises",
+        headers={**AUTH, "traceparent": f"00-{TRACE_ID}-{PARENT_ID}-01"},
+    )
+    assert response.status_code == 200
+    assert "traceparent" not in response.headers
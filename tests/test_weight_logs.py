@@ -0,0 +1,72 @@
+import threading
+from datetime import date, datetime, timezone
+
+from backend.migrations.weight_log_ids import migrate_user
+from backend.models.body_metrics import WeightLogCreate, weight_log_id
+from backend.services.firestore import get_firestore_service
+from backend.services.weight_logs import DailyWeightLogStore, YearlyWeightLogStore
+
+DAY = date(2026, 10, 1)
+
+
+def test_concurrent_upserts_for_one_day_leave_one_document(db):
+    store = DailyWeightLogStore(get_firestore_service())
+    start = threading.Barrier(20)
+
+    def upsert(weight: float):
+        start.wait()
+        store.upsert("u1", WeightLogCreate(date=DAY, weight=weight))
+
+    threads = [threading.Thread(target=upsert, args=(70 + i,)) for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    prefix = "users/u1/weight_logs/"
+    paths = [path for path in db.documents if path.startswith(prefix)]
+    assert paths == [prefix + weight_log_id(DAY)]
+    # The document holds whichever upsert was applied last.
+    last = [data for path, data in db.history if path == paths[0]][-1]
+    assert db.documents[paths[0]]["weight"] == last["weight"]
+    assert db.stats["queries"] == 0
+    assert db.stats["writes"] == 20
+
+    logs = store.list_since("u1", DAY)
+    assert [log.weight for log in logs] == [last["weight"]]
+
+
+def test_migration_keeps_the_latest_log_of_each_day(db):
+    collection = "users/u1/weight_logs/"
+    db.documents[collection + "a"] = {
+        "date": datetime(2026, 1, 1, tzinfo=timezone.utc),
+        "weight": 80,
+        "created_at": datetime(2026, 1, 1, 8, tzinfo=timezone.utc),
+    }
+    db.documents[collection + "b"] = {
+        "date": datetime(2026, 1, 1, tzinfo=timezone.utc),
+        "weight": 79,
+        "created_at": datetime(2026, 1, 1, 20, tzinfo=timezone.utc),
+    }
+
+    assert migrate_user(get_firestore_service(), "u1", dry_run=True) == {
+        "written": 1,
+        "deleted": 2,
+    }
+    assert len(db.documents) == 2
+
+    migrate_user(get_firestore_service(), "u1")
+    assert list(db.documents) == [collection + weight_log_id(date(2026, 1, 1))]
+    assert db.documents[collection + "2026-01-01"]["weight"] == 79
+
+
+def test_yearly_delete_finds_logs_not_migrated_yet(db):
+    fs = get_firestore_service()
+    DailyWeightLogStore(fs).upsert("u1", WeightLogCreate(date=DAY, weight=80))
+    store = YearlyWeightLogStore(fs)
+    store.upsert("u1", WeightLogCreate(date=date(2026, 10, 2), weight=79))
+
+    assert store.delete("u1", weight_log_id(DAY))
+    assert "users/u1/weight_logs/" + weight_log_id(DAY) not in db.documents
+    assert not store.delete("u1", weight_log_id(DAY))
+    assert [log.weight for log in store.list_since("u1", DAY)] == [79]